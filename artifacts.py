@@ -0,0 +1,421 @@
+#
+# artifacts.py
+#
+# Reads and writes the artifacts the lambdas keep in S3 (combined
+# article text, podcast scripts, audio) directly from/to memory,
+# with no local file in between: no /tmp writes and re-reads, and
+# no collisions between invocations sharing a /tmp path.
+#
+# Text artifacts are stored gzip-compressed, with Content-Encoding
+# set to gzip so browsers (and get_bytes below) decompress them
+# transparently. Objects written before compression was added
+# have no Content-Encoding and are returned as is.
+#
+# Keys are content-addressed: derived from a SHA-256 of the
+# content plus the parameters it was generated with, so the same
+# artifact always gets the same key, and is only uploaded once
+# no matter how many queries produce it.
+#
+
+import gzip
+import hashlib
+import json
+
+
+GZIP_LEVEL = 6
+
+# S3 parts must be at least 5 MiB, except the last:
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+
+
+###################################################################
+#
+# put_bytes:
+#
+def put_bytes(bucket, key, data, content_type, compress=False):
+  """
+  Uploads bytes to S3 as a public-read object, in a single PUT
+
+  Parameters
+  ----------
+  bucket : boto3 Bucket resource,
+  key : object key,
+  data : contents (bytes),
+  content_type : MIME type, e.g. 'audio/mpeg',
+  compress : store gzip-compressed with Content-Encoding: gzip
+
+  Returns
+  -------
+  nothing
+  """
+  extra = {}
+
+  if compress:
+    # mtime=0 so the same data always compresses to the same bytes:
+    data = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    extra['ContentEncoding'] = 'gzip'
+
+  bucket.put_object(Key=key,
+                    Body=data,
+                    ACL='public-read',
+                    ContentType=content_type,
+                    **extra)
+
+
+###################################################################
+#
+# put_text:
+#
+def put_text(bucket, key, text, content_type='text/plain', compress=True):
+  """
+  Uploads a string to S3 as a public-read, UTF-8 encoded object,
+  gzip-compressed by default
+
+  Parameters
+  ----------
+  bucket : boto3 Bucket resource,
+  key : object key,
+  text : contents (string),
+  content_type : MIME type,
+  compress : store gzip-compressed with Content-Encoding: gzip
+
+  Returns
+  -------
+  nothing
+  """
+  put_bytes(bucket, key, text.encode("utf-8"), content_type, compress)
+
+
+###################################################################
+#
+# put_fileobj:
+#
+def put_fileobj(bucket, key, fileobj, content_type):
+  """
+  Uploads the contents of a readable file-like object to S3 as a
+  public-read object; large objects are sent as a multipart upload
+  by boto3, reading the source a part at a time
+
+  Parameters
+  ----------
+  bucket : boto3 Bucket resource,
+  key : object key,
+  fileobj : readable binary file-like object,
+  content_type : MIME type
+
+  Returns
+  -------
+  nothing
+  """
+  bucket.upload_fileobj(fileobj,
+                        key,
+                        ExtraArgs={
+                          'ACL': 'public-read',
+                          'ContentType': content_type
+                        })
+
+
+###################################################################
+#
+# MultipartWriter
+#
+# Uploads an object of unknown length as it is produced: write
+# copies the data into a part_size buffer, and every time it is
+# full it is sent as one part of a multipart upload and reused,
+# so at most one part is held in memory. The object (public-read)
+# only appears when close completes the upload; abort discards
+# the parts. An object smaller than one part is sent with a
+# single PUT instead.
+#
+#   writer = MultipartWriter(bucket, key, 'audio/mpeg')
+#   try:
+#     for data in ...:
+#       writer.write(data)
+#     writer.close()
+#   except:
+#     writer.abort()
+#     raise
+#
+class MultipartWriter:
+
+  def __init__(self, bucket, key, content_type, part_size=DEFAULT_PART_SIZE):
+    self.bucket = bucket
+    self.key = key
+    self.content_type = content_type
+    self.part_size = max(part_size, 5 * 1024 * 1024)
+    self.size = 0
+    self._buffer = None
+    self._fill = 0
+    self._upload_id = None
+    self._parts = []
+
+  def write(self, data):
+    if self._buffer is None:
+      self._buffer = bytearray()
+
+    data = memoryview(data)
+    self.size += len(data)
+
+    while len(data) > 0:
+      n = min(len(data), self.part_size - self._fill)
+      if len(self._buffer) < self._fill + n:
+        # the buffer grows until the first part is full:
+        self._buffer += data[:n]
+      else:
+        self._buffer[self._fill:self._fill + n] = data[:n]
+      self._fill += n
+      data = data[n:]
+
+      if self._fill == self.part_size:
+        self._upload_part(self._buffer)
+        self._fill = 0
+
+  def _rest(self):
+    return bytes(self._buffer[:self._fill]) if self._buffer is not None else b""
+
+  def _upload_part(self, part):
+    client = self.bucket.meta.client
+
+    if self._upload_id is None:
+      response = client.create_multipart_upload(Bucket=self.bucket.name,
+                                                Key=self.key,
+                                                ACL='public-read',
+                                                ContentType=self.content_type)
+      self._upload_id = response['UploadId']
+
+    number = len(self._parts) + 1
+    response = client.upload_part(Bucket=self.bucket.name,
+                                  Key=self.key,
+                                  PartNumber=number,
+                                  UploadId=self._upload_id,
+                                  Body=part)
+    self._parts.append({'ETag': response['ETag'], 'PartNumber': number})
+
+  def close(self):
+    """
+    Uploads what is left and completes the object
+
+    Returns
+    -------
+    the object's size in bytes
+    """
+    if self._upload_id is None:
+      put_bytes(self.bucket, self.key, self._rest(), self.content_type)
+    else:
+      if self._fill > 0:
+        self._upload_part(self._rest())
+      self.bucket.meta.client.complete_multipart_upload(Bucket=self.bucket.name,
+                                                        Key=self.key,
+                                                        UploadId=self._upload_id,
+                                                        MultipartUpload={'Parts': self._parts})
+    self._buffer = None
+    self._fill = 0
+    return self.size
+
+  def abort(self):
+    """
+    Discards the parts uploaded so far
+    """
+    if self._upload_id is not None:
+      self.bucket.meta.client.abort_multipart_upload(Bucket=self.bucket.name,
+                                                     Key=self.key,
+                                                     UploadId=self._upload_id)
+      self._upload_id = None
+    self._buffer = None
+    self._fill = 0
+
+
+###################################################################
+#
+# get_bytes:
+#
+def get_bytes(bucket, key):
+  """
+  Downloads an S3 object into memory, decompressing it if it was
+  stored with Content-Encoding: gzip
+
+  Parameters
+  ----------
+  bucket : boto3 Bucket resource,
+  key : object key
+
+  Returns
+  -------
+  contents (bytes)
+  """
+  response = bucket.Object(key).get()
+  data = response["Body"].read()
+
+  if response.get("ContentEncoding") == "gzip":
+    data = gzip.decompress(data)
+
+  return data
+
+
+###################################################################
+#
+# get_text:
+#
+def get_text(bucket, key):
+  """
+  Downloads a UTF-8 text object from S3 into a string
+
+  Parameters
+  ----------
+  bucket : boto3 Bucket resource,
+  key : object key
+
+  Returns
+  -------
+  contents (string)
+  """
+  return get_bytes(bucket, key).decode("utf-8")
+
+
+###################################################################
+#
+# artifact_key:
+#
+def artifact_key(prefix, content, params=None, ext=""):
+  """
+  Returns the content-addressed key for an artifact, e.g.
+  "summaries/<sha256>.txt"
+
+  Parameters
+  ----------
+  prefix : key prefix (folder), e.g. "summaries",
+  content : the content (string or bytes) the artifact holds
+            or is generated from,
+  params : optional dict of generation parameters that change
+           the artifact for the same content (e.g. the voice),
+  ext : key suffix, e.g. ".txt"
+
+  Returns
+  -------
+  key (string)
+  """
+  if isinstance(content, str):
+    content = content.encode("utf-8")
+
+  digest = hashlib.sha256(content)
+
+  if params:
+    digest.update(b"\0")
+    digest.update(json.dumps(params, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+
+  return prefix + "/" + digest.hexdigest() + ext
+
+
+###################################################################
+#
+# exists:
+#
+def exists(bucket, key):
+  """
+  Checks with a HEAD request whether an object exists
+
+  Parameters
+  ----------
+  bucket : boto3 Bucket resource,
+  key : object key
+
+  Returns
+  -------
+  True if the object exists, False if not
+  """
+  from botocore.exceptions import ClientError
+
+  try:
+    bucket.meta.client.head_object(Bucket=bucket.name, Key=key)
+    return True
+
+  except ClientError as err:
+    if err.response.get("Error", {}).get("Code") in ["404", "NoSuchKey", "NotFound"]:
+      return False
+    raise
+
+
+###################################################################
+#
+# put_text_if_absent:
+#
+def put_text_if_absent(bucket, key, text, content_type='text/plain', compress=True):
+  """
+  Like put_text, but skips the upload when an object with this
+  (content-addressed) key is already stored
+
+  Returns
+  -------
+  True if uploaded, False if the object already existed
+  """
+  if exists(bucket, key):
+    return False
+
+  put_text(bucket, key, text, content_type, compress)
+  return True
+
+
+###################################################################
+#
+# content_length:
+#
+def content_length(bucket, key):
+  """
+  Returns the size in bytes of a stored object (as stored, i.e.
+  compressed if it is gzip-encoded), with a HEAD request
+  """
+  response = bucket.meta.client.head_object(Bucket=bucket.name, Key=key)
+  return response["ContentLength"]
+
+
+###################################################################
+#
+# presigned_url:
+#
+def presigned_url(bucket, key, expires_in):
+  """
+  Returns a URL that lets anyone holding it GET the object for
+  the next expires_in seconds, signed with the caller's
+  credentials; no request is made to S3
+
+  Parameters
+  ----------
+  bucket : boto3 Bucket resource,
+  key : object key,
+  expires_in : validity of the URL, in seconds
+
+  Returns
+  -------
+  URL (string)
+  """
+  return bucket.meta.client.generate_presigned_url(
+    'get_object',
+    Params={'Bucket': bucket.name, 'Key': key},
+    ExpiresIn=expires_in
+  )
+
+
+###################################################################
+#
+# resign_url:
+#
+def resign_url(bucket, body):
+  """
+  Gives a stored response body (one with an "audiourl" presigned
+  for its "audiokey") a freshly signed URL, valid for the same
+  "expires_in" seconds from now, so a response given again later
+  (a replay, a job's result) does not carry an expired link
+
+  Parameters
+  ----------
+  bucket : boto3 Bucket resource,
+  body : the response body (dict)
+
+  Returns
+  -------
+  the body, with a new audiourl if it had one
+  """
+  if not body.get("audiourl") or not body.get("audiokey"):
+    return body
+
+  return {**body, "audiourl": presigned_url(bucket, body["audiokey"], body["expires_in"])}
@@ -0,0 +1,66 @@
+#
+# bench_artifacts.py
+#
+# Writing the combined article text in fetch_articles and reading
+# it back in summarize: the old += concatenation, /tmp file and
+# upload_file/download_file + readlines, versus artifacts.put_text
+# and artifacts.get_text straight from/to memory.
+#
+# Usage: python benchmarks/bench_artifacts.py [articles] [repeat]
+#
+
+import glob
+import os
+import sys
+
+import standins
+
+root = standins.add_repo_to_path()
+sys.path.insert(0, os.path.join(root, "fetch_articles"))
+
+import artifacts
+import htmltext
+
+n_articles = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+here = os.path.dirname(os.path.abspath(__file__))
+bodies = [open(f, encoding="utf-8").read() * 5 for f in sorted(glob.glob(os.path.join(here, "fixtures", "guardian_*.html")))]
+texts = [htmltext.extract_text_stream(bodies[i % len(bodies)]) for i in range(n_articles)]
+
+bucket = standins.FakeBucket()
+
+
+def before():
+  combined = ""
+  for text in texts:
+    combined += text
+
+  local_file = "/tmp/combinedarticles.txt"
+  with open(local_file, "w") as outfile:
+    outfile.write(combined)
+  bucket.upload_file(local_file, "combinedarticles/x.txt",
+                     ExtraArgs={'ACL': 'public-read', 'ContentType': 'text/plain'})
+
+  bucket.download_file("combinedarticles/x.txt", local_file)
+  with open(local_file, "r") as infile:
+    return infile.readlines()
+
+
+def after():
+  combined = "".join(texts)
+  artifacts.put_text(bucket, "combinedarticles/y.txt", combined)
+  return artifacts.get_text(bucket, "combinedarticles/y.txt")
+
+
+print("{} articles, {:.1f} KB combined text".format(n_articles, len("".join(texts)) / 1024))
+
+for name, fn in [("before", before), ("after", after)]:
+  times = standins.timeit(fn, repeat)
+  print("{:8s} {}".format(name, standins.summary(times)))
+
+# without the simulated network, to show the local overhead alone:
+bucket = standins.FakeBucket(latency=0, bandwidth=0)
+for name, fn in [("before", before), ("after", after)]:
+  times = standins.timeit(fn, repeat)
+  print("{:8s} {}   (no network)".format(name, standins.summary(times)))
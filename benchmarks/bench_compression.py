@@ -0,0 +1,62 @@
+#
+# bench_compression.py
+#
+# Gzip-compressed text artifacts: compression ratio, encode and
+# decode cost, and the transfer time saved at a few S3 bandwidths,
+# for combined article texts of increasing size.
+#
+# Usage: python benchmarks/bench_compression.py [repeat]
+#
+
+import glob
+import gzip
+import os
+import sys
+import time
+
+import standins
+
+root = standins.add_repo_to_path()
+sys.path.insert(0, os.path.join(root, "fetch_articles"))
+
+import artifacts
+import htmltext
+
+repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+here = os.path.dirname(os.path.abspath(__file__))
+texts = [htmltext.extract_text_stream(open(f, encoding="utf-8").read())
+         for f in sorted(glob.glob(os.path.join(here, "fixtures", "guardian_*.html")))]
+
+BANDWIDTHS = [("10 MB/s", 10e6), ("50 MB/s", 50e6), ("100 MB/s", 100e6)]
+
+print("{:>9s} {:>9s} {:>7s} {:>10s} {:>10s}   {}".format(
+  "raw KB", "gzip KB", "ratio", "encode ms", "decode ms", "transfer saved (up + down) at " + ", ".join(b[0] for b in BANDWIDTHS)))
+
+for articles in [5, 20, 50]:
+  # repeat the fixtures, numbered, so the text is not one big repeat:
+  text = "".join("(%d) %s" % (i, texts[i % len(texts)]) for i in range(articles * 3))
+  raw = text.encode("utf-8")
+
+  start = time.perf_counter()
+  for _ in range(repeat):
+    packed = gzip.compress(raw, compresslevel=artifacts.GZIP_LEVEL, mtime=0)
+  encode = (time.perf_counter() - start) / repeat
+
+  start = time.perf_counter()
+  for _ in range(repeat):
+    gzip.decompress(packed)
+  decode = (time.perf_counter() - start) / repeat
+
+  saved = ["{:6.2f} ms".format(1000 * 2 * (len(raw) - len(packed)) / bw) for _, bw in BANDWIDTHS]
+
+  print("{:9.1f} {:9.1f} {:6.1f}x {:10.2f} {:10.2f}   {}".format(
+    len(raw) / 1024, len(packed) / 1024, len(raw) / len(packed), 1000 * encode, 1000 * decode, "  ".join(saved)))
+
+# round trip through the S3 stand-in, including an old uncompressed key:
+bucket = standins.FakeBucket(latency=0, bandwidth=0)
+artifacts.put_text(bucket, "combinedarticles/new.txt", text)
+artifacts.put_text(bucket, "combinedarticles/old.txt", text, compress=False)
+assert artifacts.get_text(bucket, "combinedarticles/new.txt") == text
+assert artifacts.get_text(bucket, "combinedarticles/old.txt") == text
+print("round trip ok for compressed and uncompressed keys")
@@ -0,0 +1,46 @@
+#
+# bench_dbpool.py
+#
+# Per-request latency of a typical handler (open connection, one
+# SELECT, release) with the old connect-per-call behavior versus
+# the pooled datatier.get_dbConn.
+#
+# Usage: python benchmarks/bench_dbpool.py [requests] [handshake_ms]
+#
+
+import sys
+
+import standins
+
+standins.add_repo_to_path()
+
+requests_n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+handshake = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.030
+
+standins.install_pymysql_standin(handshake=handshake, schema=standins.SCHEMA)
+
+import pymysql
+import datatier
+
+
+def connect_per_call():
+  dbConn = pymysql.connect(host="db", port=3306, user="u", passwd="p", database="podcastgenerator")
+  datatier.retrieve_all_rows(dbConn, "select * from queries order by queryid")
+  # the handlers never closed the connection...
+
+
+def pooled():
+  dbConn = datatier.get_dbConn("db", 3306, "u", "p", "podcastgenerator")
+  try:
+    datatier.retrieve_all_rows(dbConn, "select * from queries order by queryid")
+  finally:
+    datatier.release_dbConn(dbConn)
+
+
+print("simulated handshake: {:.0f} ms, {} requests".format(1000 * handshake, requests_n))
+
+for name, fn in [("connect per call", connect_per_call), ("pooled", pooled)]:
+  standins.Stats.reset()
+  times = standins.timeit(fn, requests_n)
+  print("{:18s} {}   connects {:4d}   round trips {:5d}".format(
+    name, standins.summary(times), standins.Stats.connects, standins.Stats.round_trips))
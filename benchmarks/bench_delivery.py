@@ -0,0 +1,106 @@
+#
+# bench_delivery.py
+#
+# Delivering a podcast to the client: the audio base64-encoded in
+# the JSON response, versus a presigned URL the client downloads
+# a chunk at a time. For 5, 20 and 60 minute episodes, reports
+# the response size (API Gateway caps it at 10 MB, Lambda at
+# 6 MB) and the peak memory (tracemalloc) on the server side and
+# on the client side. The download comes from a local HTTP server
+# standing in for S3.
+#
+# Usage: python benchmarks/bench_delivery.py
+#
+
+import base64
+import http.server
+import json
+import os
+import tempfile
+import threading
+import tracemalloc
+
+import requests
+
+import standins
+
+BITRATE = 48000 // 8  # bytes per second of 48 kbps MP3
+
+audio = {}
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+
+  def do_GET(self):
+    data = audio[self.path]
+    self.send_response(200)
+    self.send_header("Content-Length", str(len(data)))
+    self.end_headers()
+    view = memoryview(data)
+    for i in range(0, len(data), 1024 * 1024):
+      self.wfile.write(view[i:i + 1024 * 1024])
+
+  def log_message(self, *args):
+    pass
+
+
+server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+baseurl = "http://127.0.0.1:{}".format(server.server_address[1])
+
+bucket = standins.FakeBucket(latency=0, bandwidth=0)
+filename = os.path.join(tempfile.mkdtemp(), "podcast.mp3")
+
+
+def peak(fn):
+  tracemalloc.start()
+  result = fn()
+  _, top = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return result, top
+
+
+def inline_server(key):
+  data = bucket.Object(key).get()["Body"].read()
+  return json.dumps({"audiokey": key, "audiodata": base64.b64encode(data).decode()})
+
+
+def inline_client(body):
+  data = json.loads(body)
+  with open(filename, "wb") as f:
+    f.write(base64.b64decode(data["audiodata"]))
+
+
+def url_server(key):
+  # HEAD + presign: nothing is read
+  return json.dumps({"audiokey": key, "audiourl": baseurl + "/" + key,
+                     "contentlength": len(bucket.objects[key]["data"])})
+
+
+def url_client(body):
+  data = json.loads(body)
+  with requests.get(data["audiourl"], stream=True) as res:
+    with open(filename, "wb") as f:
+      for chunk in res.iter_content(chunk_size=64 * 1024):
+        f.write(chunk)
+
+
+print("{:>8}  {:>8}  {:>7}  {:>12}  {:>10}  {:>10}".format(
+  "episode", "mp3 MB", "mode", "response KB", "server MB", "client MB"))
+
+for minutes in [5, 20, 60]:
+  key = "podcasts/{}min.mp3".format(minutes)
+  data = os.urandom(minutes * 60 * BITRATE)
+  bucket.put_object(Key=key, Body=data)
+  audio["/" + key] = data
+
+  for mode, server_fn, client_fn in [("inline", inline_server, inline_client), ("url", url_server, url_client)]:
+    body, server_peak = peak(lambda: server_fn(key))
+    _, client_peak = peak(lambda: client_fn(body))
+    ok = open(filename, "rb").read() == data
+    print("{:8d}  {:8.1f}  {:>7}  {:12.1f}  {:10.1f}  {:10.1f}{}".format(
+      minutes, len(data) / 1e6, mode, len(body) / 1e3, server_peak / 1e6, client_peak / 1e6,
+      "" if ok else "  MISMATCH"))
+    del body
+
+server.shutdown()
@@ -0,0 +1,111 @@
+#
+# bench_episode_upload.py
+#
+# Peak RSS and latency of synthesizing and storing 5, 20 and 60
+# minute episodes, against local stand-ins for Polly and S3:
+# "buffered" joins all the audio in memory and uploads it with one
+# PUT (as generate_podcast did before), "multipart" passes the
+# audio from synthesis.synthesize straight to an
+# artifacts.MultipartWriter. Each run is a separate process, and
+# peak RSS is reported above the RSS before the run; the S3
+# stand-in keeps no data, so it does not count. First checks that
+# both store the same bytes.
+#
+# Usage: python benchmarks/bench_episode_upload.py [workers]
+#
+
+import glob
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import standins
+
+root = standins.add_repo_to_path()
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(root, "fetch_articles"))
+sys.path.insert(0, os.path.join(root, "generate_podcast"))
+
+import artifacts
+import htmltext
+import synthesis
+
+SETTINGS = {"OutputFormat": "mp3", "VoiceId": "Joanna", "Engine": "standard"}
+PART_SIZE = 8 * 1024 * 1024
+
+
+def make_script(minutes, chars_per_second):
+  words = " ".join(htmltext.extract_text_stream(open(f, encoding="utf-8").read())
+                   for f in sorted(glob.glob(os.path.join(here, "fixtures", "guardian_*.html")))).split()
+  rng = random.Random(minutes)
+  sentences = []
+  while sum(len(s) + 1 for s in sentences) < minutes * 60 * chars_per_second:
+    sentences.append(" ".join(rng.choice(words) for _ in range(rng.randint(8, 30))).capitalize() + ".")
+  return " ".join(sentences)
+
+
+def peak_rss_mb(reset=False):
+  #
+  # Linux: VmHWM, which writing 5 to clear_refs resets to the
+  # current RSS, so setup (imports, the script) does not count
+  #
+  try:
+    if reset:
+      with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    with open("/proc/self/status") as f:
+      for line in f:
+        if line.startswith("VmHWM:"):
+          return int(line.split()[1]) / 1024
+  except OSError:
+    pass
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(mode, minutes, workers, bucket):
+  polly = standins.FakePolly(per_char=0.0002)
+  script = make_script(minutes, polly.chars_per_second)
+  key = "podcasts/{}.mp3".format(minutes)
+
+  baseline = peak_rss_mb(reset=True)
+  start = time.perf_counter()
+  if mode == "buffered":
+    audio, stats = synthesis.synthesize(polly, script, SETTINGS, max_workers=workers)
+    artifacts.put_bytes(bucket, key, audio, 'audio/mpeg')
+  else:
+    writer = artifacts.MultipartWriter(bucket, key, 'audio/mpeg', PART_SIZE)
+    _, stats = synthesis.synthesize(polly, script, SETTINGS, max_workers=workers, sink=writer.write)
+    writer.close()
+
+  return time.perf_counter() - start, stats, key, baseline
+
+
+if len(sys.argv) > 1 and sys.argv[1] == "--child":
+  mode, minutes, workers = sys.argv[2], int(sys.argv[3]), int(sys.argv[4])
+  bucket = standins.FakeBucket(keep_data=False)
+  seconds, stats, key, baseline = run(mode, minutes, workers, bucket)
+  print(seconds, peak_rss_mb() - baseline, bucket.objects[key]["size"], stats["duration"])
+  sys.exit(0)
+
+workers = int(sys.argv[1]) if len(sys.argv) > 1 else synthesis.DEFAULT_MAX_WORKERS
+
+# same bytes either way (20 minutes => a few parts):
+stored = {}
+for mode in ["buffered", "multipart"]:
+  bucket = standins.FakeBucket(latency=0, bandwidth=0)
+  _, _, key, _ = run(mode, 20, workers, bucket)
+  stored[mode] = bucket.objects[key]["data"]
+print("multipart upload stores the same bytes:", "yes" if stored["buffered"] == stored["multipart"] else "NO")
+del stored
+
+print("{:>8}  {:>10}  {:>8}  {:>10}  {:>12}".format("episode", "mode", "MB", "seconds", "peak RSS +MB"))
+
+for minutes in [5, 20, 60]:
+  for mode in ["buffered", "multipart"]:
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode, str(minutes), str(workers)],
+                         capture_output=True, text=True, check=True).stdout.split()
+    seconds, rss_mb, size, duration = float(out[0]), float(out[1]), int(out[2]), float(out[3])
+    print("{:8d}  {:>10}  {:8.1f}  {:10.2f}  {:12.1f}".format(minutes, mode, size / 1e6, seconds, rss_mb))
@@ -0,0 +1,96 @@
+#
+# bench_extractive.py
+#
+# Extractive pre-summarization (summarize/extractive.py): runtime,
+# compression ratio in characters and approximate tokens, and how
+# much of the content survives, for increasing numbers of articles.
+#
+# Content overlap: with a reference summary (e.g. a script made by
+# the model from the full text, downloaded from summaries/), the
+# share of its content words found in the compressed input vs. in
+# the full input. Without one, the share of the full text's 50
+# highest TF-IDF terms still present after compression.
+#
+# Usage: python benchmarks/bench_extractive.py [ratio] [combined.txt reference.txt]
+#
+
+import glob
+import os
+import re
+import sys
+import time
+
+from collections import Counter
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(here), "fetch_articles"))
+sys.path.insert(0, os.path.join(os.path.dirname(here), "summarize"))
+
+import extractive
+import htmltext
+import prompting
+
+ratio = float(sys.argv[1]) if len(sys.argv) > 1 else 0.4
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def content_words(text):
+  return {w for w in WORD_RE.findall(text.lower()) if w not in extractive._STOPWORDS}
+
+
+def top_terms(articles, k=50):
+  df = Counter()
+  tf = Counter()
+  for a in articles:
+    words = [w for w in WORD_RE.findall(a.lower()) if w not in extractive._STOPWORDS]
+    tf.update(words)
+    df.update(set(words))
+  n = len(articles)
+  return {w for w, _ in sorted(tf.items(), key=lambda x: -x[1] * (1 + n / df[x[0]]))[:k]}
+
+
+if len(sys.argv) > 3:
+  with open(sys.argv[2], encoding="utf-8") as f:
+    corpora = [prompting.split_articles(f.read())]
+  with open(sys.argv[3], encoding="utf-8") as f:
+    reference = content_words(f.read())
+else:
+  texts = [htmltext.extract_text_stream(open(f, encoding="utf-8").read())
+           for f in sorted(glob.glob(os.path.join(here, "fixtures", "guardian_*.html")))]
+  # articles of realistic length, built from all the fixtures in a
+  # different order each, numbered so sentences are not all repeats:
+  corpora = []
+  for n in [5, 20, 50, 100]:
+    corpora.append([" ".join("Update %d.%d: %s" % (i, j, texts[(i + j) % len(texts)]) for j in range(len(texts)))
+                    for i in range(n)])
+  reference = None
+
+print("ratio {}".format(ratio))
+print("{:>8s} {:>10s} {:>10s} {:>9s} {:>9s} {:>10s}".format(
+  "articles", "chars", "kept", "tokens", "kept", "time ms") + "   overlap full -> compressed")
+
+for articles in corpora:
+  extractive.compress_articles(articles, ratio)  # warm up
+
+  start = time.perf_counter()
+  compressed = extractive.compress_articles(articles, ratio)
+  elapsed = time.perf_counter() - start
+
+  full = " ".join(articles)
+  small = " ".join(compressed)
+
+  if reference is not None:
+    terms = reference
+  else:
+    terms = top_terms(articles)
+
+  overlap_full = len(terms & content_words(full)) / max(1, len(terms))
+  overlap_small = len(terms & content_words(small)) / max(1, len(terms))
+
+  tokens_full = prompting.count_tokens(full)
+  tokens_small = prompting.count_tokens(small)
+
+  print("{:8d} {:10d} {:9.1f}% {:9d} {:8.1f}% {:10.2f}   {:5.1f}% -> {:5.1f}%".format(
+    len(articles), len(full), 100 * len(small) / len(full), tokens_full,
+    100 * tokens_small / tokens_full, 1000 * elapsed, 100 * overlap_full, 100 * overlap_small))
@@ -0,0 +1,54 @@
+#
+# bench_fetch_writes.py
+#
+# Database writes done by fetch_articles per fetch: the old
+# insert + SELECT LAST_INSERT_ID() + one committed INSERT per
+# article, versus one transaction with perform_insert and a
+# batched perform_action_many.
+#
+# Usage: python benchmarks/bench_fetch_writes.py [fetches] [articles] [rtt_ms]
+#
+
+import sys
+
+import standins
+
+standins.add_repo_to_path()
+
+fetches = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+n_articles = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+rtt = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.001
+
+standins.install_pymysql_standin(rtt=rtt, schema=standins.SCHEMA)
+
+import datatier
+
+dbConn = datatier.get_dbConn("db", 3306, "u", "p", "podcastgenerator")
+
+articles = [("world/2025/item-%d" % i, "Headline %d" % i) for i in range(n_articles)]
+
+QUERY_SQL = "INSERT INTO queries(querytext, status, textkey) VALUES(%s, %s, %s);"
+ARTICLE_SQL = "INSERT INTO articles(url, headline, querytext, queryid) VALUES(%s, %s, %s, %s);"
+
+
+def before():
+  datatier.perform_action(dbConn, QUERY_SQL, ["sports", "gathered articles", "k"])
+  queryid = datatier.retrieve_one_row(dbConn, "SELECT LAST_INSERT_ID();")[0]
+  for url, headline in articles:
+    datatier.perform_action(dbConn, ARTICLE_SQL, [url, headline, "sports", queryid])
+
+
+def after():
+  with datatier.transaction(dbConn):
+    queryid = datatier.perform_insert(dbConn, QUERY_SQL, ["sports", "gathered articles", "k"], commit=False)
+    rows = [[url, headline, "sports", queryid] for url, headline in articles]
+    datatier.perform_action_many(dbConn, ARTICLE_SQL, rows, commit=False)
+
+
+print("{} fetches, {} articles each, simulated rtt {:.1f} ms".format(fetches, n_articles, 1000 * rtt))
+
+for name, fn in [("before", before), ("after", after)]:
+  standins.Stats.reset()
+  times = standins.timeit(fn, fetches)
+  print("{:8s} {}   round trips/fetch {:5.1f}".format(
+    name, standins.summary(times), standins.Stats.round_trips / fetches))
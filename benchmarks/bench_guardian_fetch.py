@@ -0,0 +1,86 @@
+#
+# bench_guardian_fetch.py
+#
+# End-to-end time of guardian.search_articles (page requests +
+# text extraction) against a local mock of the Guardian search
+# API that adds latency to every request. Compares one request
+# at a time (max_workers=1) with concurrent page fetching.
+#
+# Usage: python benchmarks/bench_guardian_fetch.py [latency_ms] [page_size]
+#
+
+import glob
+import json
+import os
+import sys
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(here), "fetch_articles"))
+
+import guardian
+import htmltext
+
+latency = float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.150
+page_size = int(sys.argv[2]) if len(sys.argv) > 2 else guardian.DEFAULT_PAGE_SIZE
+
+TOTAL_RESULTS = 500
+BODIES = [open(f, encoding="utf-8").read() * 10
+          for f in sorted(glob.glob(os.path.join(here, "fixtures", "guardian_*.html")))]
+
+
+class MockGuardian(BaseHTTPRequestHandler):
+
+  def do_GET(self):
+    params = parse_qs(urlparse(self.path).query)
+    page = int(params.get("page", ["1"])[0])
+    size = int(params.get("page-size", ["10"])[0])
+    pages = (TOTAL_RESULTS + size - 1) // size
+
+    time.sleep(latency)
+
+    if page > pages:
+      self.send_response(400)
+      self.end_headers()
+      return
+
+    first = (page - 1) * size
+    results = [{
+      "id": "world/2024/item-%d" % i,
+      "fields": {"headline": "Headline %d" % i, "body": BODIES[i % len(BODIES)]},
+    } for i in range(first, min(first + size, TOTAL_RESULTS))]
+
+    payload = json.dumps({"response": {"status": "ok", "pages": pages, "results": results}}).encode()
+    self.send_response(200)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(payload)))
+    self.end_headers()
+    self.wfile.write(payload)
+
+  def log_message(self, *args):
+    pass
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), MockGuardian)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+endpoint = "http://127.0.0.1:%d/search" % server.server_address[1]
+
+extractor = htmltext.get_extractor()
+
+print("mock latency {:.0f} ms per request, page size {}, extractor {}".format(
+  1000 * latency, page_size, extractor.__name__))
+
+for count in [5, 20, 50]:
+  for label, workers in [("sequential", 1), ("concurrent", guardian.MAX_WORKERS)]:
+    start = time.perf_counter()
+    found = guardian.search_articles("test", "climate", extractor, count=count,
+                                     page_size=page_size, max_workers=workers, endpoint=endpoint)
+    elapsed = time.perf_counter() - start
+    assert len(found) == count
+    print("{:3d} articles  {:10s} {:8.1f} ms".format(count, label, 1000 * elapsed))
+
+server.shutdown()
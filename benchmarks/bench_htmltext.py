@@ -0,0 +1,72 @@
+#
+# bench_htmltext.py
+#
+# Throughput (MB/s of HTML) and peak memory of each htmltext
+# backend over the Guardian-style bodies in fixtures/, and over
+# real Guardian bodies in fixtures/real/ if there are any (see
+# tools/capture_fixtures.py). First checks which backends return
+# exactly the same text as the BeautifulSoup reference.
+#
+# Usage: python benchmarks/bench_htmltext.py [repeat] [scale]
+#
+#   scale: each hand-written fixture is repeated this many times
+#          to make a long-form body (default 30, i.e. ~50KB per
+#          body); real bodies are used as they are
+#
+
+import glob
+import os
+import sys
+import time
+import tracemalloc
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(here), "fetch_articles"))
+
+import htmltext
+
+repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+scale = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+
+fixtures = sorted(glob.glob(os.path.join(here, "fixtures", "guardian_*.html")))
+bodies = [open(f, encoding="utf-8").read() * scale for f in fixtures]
+
+real = sorted(glob.glob(os.path.join(here, "fixtures", "real", "*.html")))
+fixtures += real
+bodies += [open(f, encoding="utf-8").read() for f in real]
+nbytes = sum(len(b.encode("utf-8")) for b in bodies)
+
+backends = []
+for name, fn in htmltext.EXTRACTORS.items():
+  try:
+    fn("<p>x</p>")
+    backends.append((name, fn))
+  except ImportError:
+    print("{:8s} not installed, skipped".format(name))
+
+reference = dict(backends).get("bs4")
+if reference is not None:
+  for name, fn in backends:
+    differ = [os.path.basename(f) for f, body in zip(fixtures, bodies) if fn(body) != reference(body)]
+    if differ:
+      print("{:8s} differs from bs4 on {} of {} fixtures: {}".format(name, len(differ), len(fixtures), ", ".join(differ)))
+    else:
+      print("{:8s} text-equivalent to bs4 on all {} fixtures".format(name, len(fixtures)))
+
+print("corpus: {} bodies ({} real), {:.1f} KB total".format(len(bodies), len(real), nbytes / 1024))
+
+for name, fn in backends:
+  start = time.perf_counter()
+  for _ in range(repeat):
+    for body in bodies:
+      fn(body)
+  elapsed = time.perf_counter() - start
+
+  tracemalloc.start()
+  for body in bodies:
+    fn(body)
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+
+  print("{:8s} {:8.2f} MB/s   peak python memory {:8.1f} KB".format(
+    name, repeat * nbytes / elapsed / 1e6, peak / 1024))
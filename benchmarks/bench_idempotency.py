@@ -0,0 +1,168 @@
+#
+# bench_idempotency.py
+#
+# Retried POST /fetch/{query} requests, with and without an
+# Idempotency-Key header, against local stand-ins for the
+# Guardian API, S3 and MySQL (query cache off, as with
+# ?refresh=true, so every fetch is real work):
+#
+#   retry: the response to the first request is lost on the way
+#          back, and the client sends it again;
+#   burst: a client times out and retries several times while
+#          the first request is still running (all at once).
+#
+# Reports the queries rows created, Guardian searches and S3
+# requests per request sent by the client, and how long the
+# client waited for its answer (mean of the retries).
+#
+# Usage: python benchmarks/bench_idempotency.py [duplicates] [rounds]
+#
+
+import contextlib
+import glob
+import importlib.util
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import standins
+
+root = standins.add_repo_to_path()
+here = os.path.dirname(os.path.abspath(__file__))
+
+duplicates = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+standins.install_pymysql_standin(schema=standins.SCHEMA)
+
+CONFIG = """
+[s3]
+bucket_name = bucket
+
+[rds]
+endpoint = db
+port_number = 3306
+user_name = admin
+user_pwd = secret
+db_name = podcastgenerator
+
+[guardian]
+api_key = test
+
+[cache]
+query_ttl = 0
+
+[idempotency]
+poll_interval = 0.05
+"""
+
+os.chdir(tempfile.mkdtemp())
+with open("podcast-config.ini", "w") as f:
+  f.write(CONFIG)
+
+os.environ["DATATIER_POOL_MAX_SIZE"] = str(duplicates + 2)
+sys.path.insert(0, os.path.join(root, "fetch_articles"))
+
+import datatier
+import guardian
+import htmltext
+import runtime
+
+
+def load_handler(directory):
+  # every lambda's module is called lambda_function:
+  spec = importlib.util.spec_from_file_location(directory + "_lambda", os.path.join(root, directory, "lambda_function.py"))
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module.lambda_handler
+
+
+fetch_handler = load_handler("fetch_articles")
+
+bucket = standins.FakeBucket()
+runtime._bucket = bucket
+
+texts = [htmltext.extract_text_stream(open(f, encoding="utf-8").read())
+         for f in sorted(glob.glob(os.path.join(here, "fixtures", "guardian_*.html")))]
+
+searches = 0
+
+
+def search_articles(api_key, query, extractor, count=guardian.DEFAULT_COUNT, **kwargs):
+  # the Guardian API: a 300 ms search
+  global searches
+  searches += 1
+  time.sleep(0.300)
+  return [({"id": "world/" + query + "/" + str(i), "fields": {"headline": query + " headline " + str(i)}},
+           "About " + query + ". " + texts[i % len(texts)]) for i in range(count)]
+
+
+guardian.search_articles = search_articles
+
+
+def post(query, key):
+  event = {"pathParameters": {"query": query}}
+  if key is not None:
+    event["headers"] = {"Idempotency-Key": key}
+
+  start = time.perf_counter()
+  res = fetch_handler(event, None)
+  assert res["statusCode"] == 200, res["body"]
+  return json.loads(res["body"])["queryid"], time.perf_counter() - start
+
+
+def retry(query, key):
+  post(query, key)  # the answer is lost
+  return [post(query, key)]
+
+
+def burst(query, key):
+  results = []
+  barrier = threading.Barrier(duplicates)
+
+  def client():
+    barrier.wait()
+    results.append(post(query, key))
+
+  threads = [threading.Thread(target=client) for _ in range(duplicates)]
+  for t in threads:
+    t.start()
+  for t in threads:
+    t.join()
+  return results
+
+
+def count_queries():
+  dbConn = runtime.get_dbConn()
+  n = datatier.retrieve_one_row(dbConn, "SELECT COUNT(*) FROM queries;", [])[0]
+  datatier.release_dbConn(dbConn)
+  return n
+
+
+print("{} rounds, {} duplicates per burst, query cache off".format(rounds, duplicates))
+print("{:>6}  {:>10}  {:>12}  {:>17}  {:>11}  {:>9}  {:>10}".format(
+  "flow", "key", "sent", "queries created", "searches", "S3 reqs", "wait ms"))
+
+run = 0
+for label, flow, sent in [("retry", retry, 2), ("burst", burst, duplicates)]:
+  for keyed in [False, True]:
+    before = (count_queries(), searches, bucket.requests)
+    waits = []
+    for i in range(rounds):
+      run += 1
+      key = str(uuid.uuid4()) if keyed else None
+      with contextlib.redirect_stdout(io.StringIO()):
+        results = flow("topic{}".format(run), key)
+      if keyed:  # every attempt got the same query
+        assert len(set(r[0] for r in results)) == 1
+      waits += [r[1] for r in results]
+
+    rows, calls, s3 = (a - b for a, b in zip((count_queries(), searches, bucket.requests), before))
+    print("{:>6}  {:>10}  {:>12}  {:17.1f}  {:11.1f}  {:9.1f}  {:10.0f}".format(
+      label, "same key" if keyed else "none", sent, rows / rounds, calls / rounds, s3 / rounds,
+      1000 * sum(waits) / len(waits)))
@@ -0,0 +1,82 @@
+#
+# bench_importtime.py
+#
+# Import-time profile of each lambda package: runs
+# python -X importtime -c "import lambda_function" in a fresh
+# process in every lambda directory, and reports the cumulative
+# import time of lambda_function (the module-load part of a cold
+# start) and of each module it imports directly, largest first.
+# The median of several runs is reported, after one run to write
+# the .pyc files.
+#
+# A module is counted under whichever module imports it first, as
+# -X importtime does. The lambdas' own dependencies (pymysql,
+# boto3, requests, numpy, ...) must be installed; a directory that
+# fails to import is reported with the error.
+#
+# Usage: python benchmarks/bench_importtime.py [runs] [top]
+#
+
+import glob
+import os
+import statistics
+import subprocess
+import sys
+
+import standins
+
+root = standins.add_repo_to_path()
+
+runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+top = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+
+def profile(directory):
+  #
+  # one run: {module: cumulative us} for lambda_function and its
+  # direct imports, or raises with the child's error
+  #
+  res = subprocess.run([sys.executable, "-X", "importtime", "-c", "import lambda_function"],
+                       cwd=directory, capture_output=True, text=True)
+  if res.returncode != 0:
+    raise RuntimeError(res.stderr.strip().splitlines()[-1])
+
+  #
+  # lines are "import time: self | cumulative | name", a module's
+  # imports come before it and are indented 2 more spaces
+  #
+  lines = []
+  for line in res.stderr.splitlines():
+    if not line.startswith("import time:") or "cumulative" in line:
+      continue
+    _, cumulative, name = line[len("import time:"):].split("|")
+    depth = (len(name) - len(name.lstrip())) // 2
+    lines.append((depth, name.strip(), int(cumulative)))
+
+  last = max(i for i, (depth, name, _) in enumerate(lines) if name == "lambda_function" and depth == 0)
+  times = {"lambda_function": lines[last][2]}
+  i = last - 1
+  while i >= 0 and lines[i][0] > 0:
+    if lines[i][0] == 1:
+      times[lines[i][1]] = lines[i][2]
+    i -= 1
+  return times
+
+
+for directory in sorted(os.path.dirname(p) for p in glob.glob(os.path.join(root, "*", "lambda_function.py"))):
+  name = os.path.basename(directory)
+  try:
+    profile(directory)
+    samples = [profile(directory) for _ in range(runs)]
+  except RuntimeError as e:
+    print("{}: failed: {}".format(name, e))
+    print()
+    continue
+
+  modules = {m: statistics.median(s.get(m, 0) for s in samples) for m in samples[0]}
+  total = modules.pop("lambda_function")
+
+  print("{}: {:.1f} ms (median of {})".format(name, total / 1000, runs))
+  for m, t in sorted(modules.items(), key=lambda item: -item[1])[:top]:
+    print("  {:<24} {:8.1f} ms".format(m, t / 1000))
+  print()
@@ -0,0 +1,205 @@
+#
+# bench_jobs.py
+#
+# Synchronous vs asynchronous pipeline requests, against local
+# stand-ins for the Guardian API, Bedrock, Polly, S3, MySQL and
+# SQS (with as many workers as clients, like Lambda scaling out):
+# several clients each ask for a podcast on a new topic at once.
+# Synchronously, each client holds its connection for the whole
+# pipeline. Asynchronously, the POST returns 202 at once and the
+# client polls GET /jobs/{id}, with a fixed interval, with
+# exponential backoff, or with exponential backoff and jitter (as
+# main.py does). Reports how long the POST took, when the client
+# saw the result, how long after the job finished that was, the
+# number of polls per job, and the most polls in any 100 ms.
+# scale multiplies the Bedrock and Polly latencies, for longer
+# jobs.
+#
+# Usage: python benchmarks/bench_jobs.py [clients] [scale]
+#
+
+import collections
+import contextlib
+import glob
+import importlib.util
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import standins
+
+root = standins.add_repo_to_path()
+here = os.path.dirname(os.path.abspath(__file__))
+
+clients = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+scale = float(sys.argv[2]) if len(sys.argv) > 2 else 1
+
+standins.install_pymysql_standin(schema=standins.SCHEMA)
+
+CONFIG = """
+[s3]
+bucket_name = bucket
+
+[rds]
+endpoint = db
+port_number = 3306
+user_name = admin
+user_pwd = secret
+db_name = podcastgenerator
+
+[guardian]
+api_key = test
+
+[polly]
+segment_cache = false
+
+[jobs]
+queue_url = https://sqs.us-east-2.amazonaws.com/123456789012/podcast-jobs
+"""
+
+os.chdir(tempfile.mkdtemp())
+with open("podcast-config.ini", "w") as f:
+  f.write(CONFIG)
+
+os.environ["DATATIER_POOL_MAX_SIZE"] = str(2 * clients + 2)
+sys.path.insert(0, os.path.join(root, "job_worker"))
+
+import guardian
+import htmltext
+import jobs
+import runtime
+
+
+def load_handler(directory):
+  # every lambda's module is called lambda_function:
+  spec = importlib.util.spec_from_file_location(directory + "_lambda", os.path.join(root, directory, "lambda_function.py"))
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module.lambda_handler
+
+
+pipeline_handler = load_handler("pipeline")
+worker_handler = load_handler("job_worker")
+status_handler = load_handler("job_status")
+
+runtime._bucket = standins.FakeBucket()
+runtime._clients["bedrock-runtime"] = standins.FakeBedrock(overhead=0.200 * scale, per_output_token=0.002 * scale)
+runtime._clients["polly"] = standins.FakePolly(overhead=0.150 * scale, per_char=0.0005 * scale)
+sqs = runtime._clients["sqs"] = standins.FakeSQS(worker_handler, workers=clients)
+
+texts = [htmltext.extract_text_stream(open(f, encoding="utf-8").read())
+         for f in sorted(glob.glob(os.path.join(here, "fixtures", "guardian_*.html")))]
+
+
+def search_articles(api_key, query, extractor, count=guardian.DEFAULT_COUNT, **kwargs):
+  # the Guardian API: a 300 ms search, topic-specific text
+  time.sleep(0.300)
+  return [({"id": "world/" + query + "/" + str(i), "fields": {"headline": query + " headline " + str(i)}},
+           "About " + query + ". " + texts[i % len(texts)]) for i in range(count)]
+
+
+guardian.search_articles = search_articles
+
+polls = []
+polls_lock = threading.Lock()
+
+
+def get_job(jobid):
+  with polls_lock:
+    polls.append(time.perf_counter())
+  res = status_handler({"pathParameters": {"jobid": str(jobid)}}, None)
+  return json.loads(res["body"])
+
+
+#
+# polling policies: the delay before each poll
+#
+def fixed(attempt):
+  return 1.0
+
+
+def backoff(attempt):
+  return min(4.0, 0.5 * 2 ** attempt)
+
+
+def backoff_jitter(attempt):
+  delay = min(4.0, 0.5 * 2 ** attempt)
+  return random.uniform(delay / 2, delay)
+
+
+def client(topic, policy, results):
+  start = time.perf_counter()
+
+  if policy is None:
+    res = pipeline_handler({"pathParameters": {"query": topic}}, None)
+    assert res["statusCode"] == 200, res["body"]
+    end = time.perf_counter()
+    results.append((end - start, end - start, 0, 0))
+    return
+
+  res = pipeline_handler({"pathParameters": {"query": topic}, "queryStringParameters": {"async": "true"}}, None)
+  assert res["statusCode"] == 202, res["body"]
+  posted = time.perf_counter() - start
+  jobid = json.loads(res["body"])["jobid"]
+
+  attempt = 0
+  while True:
+    time.sleep(policy(attempt))
+    attempt += 1
+    job = get_job(jobid)
+    if job["state"] in ["done", "failed"]:
+      break
+
+  assert job["state"] == "done", job
+  seen = time.perf_counter()
+  finished = finish_times[jobid]
+  results.append((posted, seen - start, seen - finished, attempt))
+
+
+#
+# when each job finished, as seen by the worker:
+#
+finish_times = {}
+jobs_finish = jobs.finish
+
+
+def timed_finish(dbConn, jobid, statusCode, body):
+  jobs_finish(dbConn, jobid, statusCode, body)
+  finish_times[jobid] = time.perf_counter()
+
+
+jobs.finish = timed_finish
+
+print("{} clients at once, each a new topic, latency scale {}".format(clients, scale))
+print("{:>16}  {:>9}  {:>9}  {:>12}  {:>11}  {:>14}".format(
+  "mode", "POST ms", "result s", "late by ms", "polls/job", "max polls/100ms"))
+
+run = 0
+for label, policy in [("synchronous", None), ("poll every 1 s", fixed),
+                      ("backoff", backoff), ("backoff+jitter", backoff_jitter)]:
+  results = []
+  polls.clear()
+  run += 1
+  threads = [threading.Thread(target=client, args=("topic{}x{}".format(run, i), policy, results))
+             for i in range(clients)]
+  with contextlib.redirect_stdout(io.StringIO()):
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+    sqs.join()
+
+  buckets = collections.Counter(int(t / 0.1) for t in polls)
+  n = len(results)
+  print("{:>16}  {:9.0f}  {:9.2f}  {:>12}  {:>11}  {:>14}".format(
+    label,
+    1000 * sum(r[0] for r in results) / n,
+    sum(r[1] for r in results) / n,
+    "-" if policy is None else "{:.0f}".format(1000 * sum(r[2] for r in results) / n),
+    "-" if policy is None else "{:.1f}".format(sum(r[3] for r in results) / n),
+    "-" if policy is None else max(buckets.values())))
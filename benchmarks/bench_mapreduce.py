@@ -0,0 +1,55 @@
+#
+# bench_mapreduce.py
+#
+# Script generation latency, single prompt vs. map-reduce, against
+# a local stand-in for Bedrock whose latency grows with the input
+# and output tokens (see standins.FakeBedrock).
+#
+# Usage: python benchmarks/bench_mapreduce.py [workers] [input_us_per_token]
+#
+
+import glob
+import os
+import sys
+import time
+
+import standins
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(here), "fetch_articles"))
+sys.path.insert(0, os.path.join(os.path.dirname(here), "summarize"))
+
+import generation
+import htmltext
+
+workers = int(sys.argv[1]) if len(sys.argv) > 1 else generation.DEFAULT_MAP_WORKERS
+per_input_token = float(sys.argv[2]) / 1e6 if len(sys.argv) > 2 else 0.0002
+
+PARAMS = {"max_gen_len": 512, "temperature": 0.5, "top_p": 0.9}
+BUDGET = 100000  # no truncation, to compare the same input
+
+texts = [htmltext.extract_text_stream(open(f, encoding="utf-8").read())
+         for f in sorted(glob.glob(os.path.join(here, "fixtures", "guardian_*.html")))]
+
+client = standins.FakeBedrock(per_input_token=per_input_token)
+
+print("stub model: {:.0f} ms + {:.2f} ms/input token + {:.0f} ms/output token, {} workers".format(
+  1000 * client.overhead, 1000 * client.per_input_token, 1000 * client.per_output_token, workers))
+
+for n in [3, 5, 20, 50]:
+  articles = [" ".join(texts[(i + j) % len(texts)] for j in range(len(texts))) for i in range(n)]
+
+  results = []
+  for mode in ["single", "mapreduce"]:
+    client.calls = 0
+    start = time.perf_counter()
+    if mode == "single":
+      generation.summarize_single(client, articles, BUDGET, PARAMS)
+    else:
+      generation.summarize_map_reduce(client, articles, BUDGET, PARAMS, workers)
+    results.append((mode, time.perf_counter() - start, client.calls))
+
+  auto = generation.choose_mode("auto", articles)  # default threshold
+  print("{:3d} articles  ".format(n) + "  ".join(
+    "{} {:7.0f} ms ({} calls)".format(mode, 1000 * t, calls) for mode, t, calls in results) +
+    "   auto => " + auto)
@@ -0,0 +1,153 @@
+#
+# bench_pipeline.py
+#
+# End-to-end latency of turning a query into a podcast: the
+# three-hop flow (the client POSTs /fetch, then /summarize/{id},
+# then /podcast/{id}, each a separate lambda invocation) versus
+# one POST /pipeline/{query}, against local stand-ins for the
+# Guardian API, Bedrock, Polly, S3 and MySQL. Each HTTP request
+# also pays a simulated client <-> API Gateway <-> Lambda round
+# trip. Every run is a new topic, so nothing comes from the
+# caches; the segment cache is off. Also reports S3 requests and
+# database round trips per run, and checks that both flows store
+# the same script and audio.
+#
+# Usage: python benchmarks/bench_pipeline.py [runs] [hop_ms]
+#
+
+import contextlib
+import glob
+import importlib.util
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import standins
+
+root = standins.add_repo_to_path()
+here = os.path.dirname(os.path.abspath(__file__))
+
+runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+hop = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.060
+
+standins.install_pymysql_standin(schema=standins.SCHEMA)
+
+CONFIG = """
+[s3]
+bucket_name = bucket
+
+[rds]
+endpoint = db
+port_number = 3306
+user_name = admin
+user_pwd = secret
+db_name = podcastgenerator
+
+[guardian]
+api_key = test
+
+[polly]
+segment_cache = false
+"""
+
+os.chdir(tempfile.mkdtemp())
+with open("podcast-config.ini", "w") as f:
+  f.write(CONFIG)
+
+for d in ["pipeline", "generate_podcast", "summarize", "fetch_articles"]:
+  sys.path.insert(0, os.path.join(root, d))
+
+import datatier
+import guardian
+import htmltext
+import runtime
+
+
+def load_handler(directory):
+  # every lambda's module is called lambda_function:
+  spec = importlib.util.spec_from_file_location(directory + "_lambda", os.path.join(root, directory, "lambda_function.py"))
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module.lambda_handler
+
+
+fetch_handler = load_handler("fetch_articles")
+summarize_handler = load_handler("summarize")
+podcast_handler = load_handler("generate_podcast")
+pipeline_handler = load_handler("pipeline")
+
+bucket = standins.FakeBucket()
+runtime._bucket = bucket
+runtime._clients["bedrock-runtime"] = standins.FakeBedrock(overhead=0.200, per_output_token=0.002)
+runtime._clients["polly"] = standins.FakePolly()
+
+#
+# the Guardian API: 5 fixture articles after a 300 ms search,
+# with the topic in the text, so every topic is new to the caches
+#
+texts = [htmltext.extract_text_stream(open(f, encoding="utf-8").read())
+         for f in sorted(glob.glob(os.path.join(here, "fixtures", "guardian_*.html")))]
+
+
+def search_articles(api_key, query, extractor, count=guardian.DEFAULT_COUNT, **kwargs):
+  time.sleep(0.300)
+  return [({"id": "world/" + query + "/" + str(i), "fields": {"headline": query + " headline " + str(i)}},
+           "About " + query + ". " + texts[i % len(texts)]) for i in range(count)]
+
+
+guardian.search_articles = search_articles
+
+
+def request(handler, event):
+  # one HTTP request from the client:
+  time.sleep(hop)
+  res = handler(event, None)
+  body = json.loads(res["body"])
+  assert res["statusCode"] == 200, body
+  return body
+
+
+def three_hops(query):
+  queryid = request(fetch_handler, {"pathParameters": {"query": query}})["queryid"]
+  summary = request(summarize_handler, {"pathParameters": {"queryid": str(queryid)}})
+  podcast = request(podcast_handler, {"pathParameters": {"queryid": str(queryid)}})
+  return summary["scriptkey"], podcast["audiokey"]
+
+
+def pipeline(query):
+  body = request(pipeline_handler, {"pathParameters": {"query": query}})
+  return body["scriptkey"], body["audiokey"]
+
+
+print("{} runs, {:.0f} ms per HTTP request round trip".format(runs, 1000 * hop))
+print("{:>10}  {:>34}  {:>11}  {:>9}".format("flow", "end-to-end latency", "S3 requests", "DB trips"))
+
+keys = {}
+for label, flow in [("three hops", three_hops), ("pipeline", pipeline)]:
+  times = []
+  s3 = 0
+  trips = 0
+  for i in range(runs):
+    standins.Stats.reset()
+    before = bucket.requests
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+      keys[label, i] = flow("topic{}".format(i))
+    times.append(time.perf_counter() - start)
+    s3 += bucket.requests - before
+    trips += standins.Stats.round_trips
+    if label == "three hops":
+      # so the pipeline's run of the same topic is not a cache hit,
+      # and has to store everything again:
+      bucket.objects.clear()
+      dbConn = runtime.get_dbConn()
+      datatier.perform_action(dbConn, "DELETE FROM resultcache;", [])
+      datatier.perform_action(dbConn, "UPDATE queries SET normtext = '';", [])
+      datatier.release_dbConn(dbConn)
+  print("{:>10}  {}  {:11.1f}  {:9.1f}".format(label, standins.summary(times), s3 / runs, trips / runs))
+
+same = all(keys["three hops", i] == keys["pipeline", i] for i in range(runs))
+print("both flows store the same script and audio:", "yes" if same else "NO")
@@ -0,0 +1,84 @@
+#
+# bench_polly.py
+#
+# Synthesis time for scripts of 1,500 to 24,000 characters: the
+# old single synthesize_speech call (which fails over Polly's
+# character limit) versus synthesis.synthesize, chunked on
+# sentences and run with 1 to 16 concurrent requests, against a
+# local Polly stand-in (standins.FakePolly). Also checks that the
+# joined audio has exactly the frames and duration of its chunks,
+# in order.
+#
+# Usage: python benchmarks/bench_polly.py [chunk_chars]
+#
+
+import glob
+import os
+import random
+import sys
+import time
+
+import standins
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(here), "fetch_articles"))
+sys.path.insert(0, os.path.join(os.path.dirname(here), "generate_podcast"))
+
+import htmltext
+import synthesis
+
+chunk_chars = int(sys.argv[1]) if len(sys.argv) > 1 else synthesis.DEFAULT_CHUNK_CHARS
+
+SETTINGS = {"OutputFormat": "mp3", "VoiceId": "Joanna", "Engine": "standard"}
+
+words = " ".join(htmltext.extract_text_stream(open(f, encoding="utf-8").read())
+                 for f in sorted(glob.glob(os.path.join(here, "fixtures", "guardian_*.html")))).split()
+
+# sentences of random words from the fixtures, so no two chunks
+# are the same (repeats are only synthesized once):
+rng = random.Random(1)
+sentences = []
+while sum(len(s) + 1 for s in sentences) < 24000:
+  sentences.append(" ".join(rng.choice(words) for _ in range(rng.randint(8, 30))).capitalize() + ".")
+text = " ".join(sentences)
+
+polly = standins.FakePolly()
+
+print("chunks of at most {} characters".format(chunk_chars))
+print("{:>7}  {:>7}  {:>10}  {}".format("chars", "chunks", "old call", "  ".join(
+  "{:>9}".format("{} wkr".format(w)) for w in [1, 2, 4, 8, 16])))
+
+for size in [1500, 6000, 24000]:
+  script = text[:size].rsplit(" ", 1)[0]
+
+  start = time.perf_counter()
+  try:
+    polly.synthesize_speech(Text=script, **SETTINGS)
+    old = "{:7.0f} ms".format(1000 * (time.perf_counter() - start))
+  except Exception:
+    old = "too long"
+
+  times = []
+  reference = None
+  for workers in [1, 2, 4, 8, 16]:
+    start = time.perf_counter()
+    audio, stats = synthesis.synthesize(polly, script, SETTINGS, chunk_chars, workers)
+    times.append(time.perf_counter() - start)
+
+    if reference is None:
+      reference = audio
+      # frames only, duration = sum of the chunks, in order:
+      chunks = synthesis.split_script(script, chunk_chars)
+      expected = [synthesis.audio_frames(polly.synthesize_speech(Text=c, **SETTINGS)["AudioStream"].read())
+                  for c in chunks]
+      ok = audio == b"".join(f for f, _, _ in expected)
+      frames, samples, rate = synthesis.audio_frames(audio)
+      ok = ok and frames == audio and abs(samples / rate - stats["duration"]) < 0.01
+      assert all(len(c) <= chunk_chars for c in chunks) and " ".join(chunks).split() == script.split(), \
+        "chunks do not cover the script"
+    else:
+      ok = ok and audio == reference
+
+  print("{:7d}  {:7d}  {:>10}  {}   {:.0f} s of audio{}".format(
+    len(script), stats["chunks"], old, "  ".join("{:6.0f} ms".format(1000 * t) for t in times),
+    stats["duration"], "" if ok else "  MISMATCH"))
@@ -0,0 +1,93 @@
+#
+# bench_runtime.py
+#
+# Setup cost per warm invocation: the old handler preamble
+# (read podcast-config.ini, point AWS_SHARED_CREDENTIALS_FILE at
+# it, setup_default_session, build an S3 resource and Bucket, read
+# the RDS settings, get a DB connection) versus runtime.py, which
+# does all that once per container.
+#
+# boto3 is the real library with dummy credentials: building
+# sessions, resources and clients is all local, and nothing here
+# sends a request to AWS. MySQL is the SQLite stand-in.
+#
+# Usage: python benchmarks/bench_runtime.py [invocations]
+#
+
+import os
+import sys
+import tempfile
+
+import standins
+
+standins.add_repo_to_path()
+
+invocations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+standins.install_pymysql_standin(schema=standins.SCHEMA)
+
+CONFIG = """
+[s3]
+bucket_name = podcast-bucket
+
+[s3readwrite]
+aws_access_key_id = AKIAEXAMPLEEXAMPLE00
+aws_secret_access_key = example
+region_name = us-east-2
+
+[rds]
+endpoint = db
+port_number = 3306
+user_name = admin
+user_pwd = secret
+db_name = podcastgenerator
+"""
+
+os.chdir(tempfile.mkdtemp())
+with open("podcast-config.ini", "w") as f:
+  f.write(CONFIG)
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-2")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "AKIAEXAMPLEEXAMPLE00")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "example")
+
+import boto3
+from configparser import ConfigParser
+
+import datatier
+import runtime
+
+
+def before():
+  config_file = 'podcast-config.ini'
+  os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
+  configur = ConfigParser()
+  configur.read(config_file)
+
+  boto3.setup_default_session(profile_name='s3readwrite')
+  s3 = boto3.resource('s3')
+  bucket = s3.Bucket(configur.get('s3', 'bucket_name'))
+
+  rds_endpoint = configur.get('rds', 'endpoint')
+  rds_portnum = int(configur.get('rds', 'port_number'))
+  rds_username = configur.get('rds', 'user_name')
+  rds_pwd = configur.get('rds', 'user_pwd')
+  rds_dbname = configur.get('rds', 'db_name')
+  dbConn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
+  datatier.release_dbConn(dbConn)
+
+
+def after():
+  configur = runtime.get_config()
+  bucket = runtime.get_bucket()
+  polly_client = runtime.get_client("polly")
+  dbConn = runtime.get_dbConn()
+  datatier.release_dbConn(dbConn)
+
+
+# the old handlers made their Polly/Bedrock client at import time:
+boto3.client("polly")
+
+for label, fn in [("before (per invocation)", before), ("runtime.py", after)]:
+  times = standins.timeit(fn, invocations)
+  print("{:<24} first {:6.1f} ms, then {}".format(label, 1000 * times[0], standins.summary(times[1:])))
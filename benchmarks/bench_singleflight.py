@@ -0,0 +1,171 @@
+#
+# bench_singleflight.py
+#
+# Duplicate concurrent requests, against local stand-ins for
+# Bedrock, Polly, S3 and MySQL: several clients POST
+# /summarize/{queryid} for the same query at once, then POST
+# /podcast/{queryid} at once. Without single flight (the claims
+# replaced by ones every request wins, as before) each of them
+# calls Bedrock and Polly; with it, one does and the others wait
+# for its result. Reports the Bedrock calls, Polly requests and
+# characters, and the client latency (mean and worst) per round.
+# Every round is a new topic, so nothing comes from the caches;
+# the segment cache is off.
+#
+# Usage: python benchmarks/bench_singleflight.py [clients] [rounds]
+#
+
+import contextlib
+import glob
+import importlib.util
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import standins
+
+root = standins.add_repo_to_path()
+here = os.path.dirname(os.path.abspath(__file__))
+
+clients = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+standins.install_pymysql_standin(schema=standins.SCHEMA)
+
+CONFIG = """
+[s3]
+bucket_name = bucket
+
+[rds]
+endpoint = db
+port_number = 3306
+user_name = admin
+user_pwd = secret
+db_name = podcastgenerator
+
+[guardian]
+api_key = test
+
+[polly]
+segment_cache = false
+
+[claims]
+poll_interval = 0.1
+"""
+
+os.chdir(tempfile.mkdtemp())
+with open("podcast-config.ini", "w") as f:
+  f.write(CONFIG)
+
+os.environ["DATATIER_POOL_MAX_SIZE"] = str(clients + 2)
+for d in ["generate_podcast", "summarize", "fetch_articles"]:
+  sys.path.insert(0, os.path.join(root, d))
+
+import claims
+import guardian
+import htmltext
+import runtime
+
+
+def load_handler(directory):
+  # every lambda's module is called lambda_function:
+  spec = importlib.util.spec_from_file_location(directory + "_lambda", os.path.join(root, directory, "lambda_function.py"))
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module.lambda_handler
+
+
+fetch_handler = load_handler("fetch_articles")
+summarize_handler = load_handler("summarize")
+podcast_handler = load_handler("generate_podcast")
+
+runtime._bucket = standins.FakeBucket()
+bedrock = runtime._clients["bedrock-runtime"] = standins.FakeBedrock(overhead=0.200, per_output_token=0.002)
+polly = runtime._clients["polly"] = standins.FakePolly()
+
+texts = [htmltext.extract_text_stream(open(f, encoding="utf-8").read())
+         for f in sorted(glob.glob(os.path.join(here, "fixtures", "guardian_*.html")))]
+
+
+def search_articles(api_key, query, extractor, count=guardian.DEFAULT_COUNT, **kwargs):
+  # topic-specific text, so every topic is new to the caches
+  return [({"id": "world/" + query + "/" + str(i), "fields": {"headline": query + " headline " + str(i)}},
+           "About " + query + ". " + texts[i % len(texts)]) for i in range(count)]
+
+
+guardian.search_articles = search_articles
+
+
+#
+# before: every request goes ahead with the stage
+#
+def always_claim(dbConn, queryid, ready, working):
+  return True, working
+
+
+def no_release(dbConn, queryid, working, ready):
+  pass
+
+
+def at_once(handler, queryid):
+  # all the clients send the same request together:
+  results = []
+  barrier = threading.Barrier(clients)
+
+  def client():
+    barrier.wait()
+    start = time.perf_counter()
+    res = handler({"pathParameters": {"queryid": str(queryid)}}, None)
+    results.append((res["statusCode"], time.perf_counter() - start, json.loads(res["body"])))
+
+  threads = [threading.Thread(target=client) for _ in range(clients)]
+  for t in threads:
+    t.start()
+  for t in threads:
+    t.join()
+
+  assert all(r[0] == 200 for r in results), [r[2] for r in results if r[0] != 200]
+  return results
+
+
+print("{} identical requests at once, {} rounds".format(clients, rounds))
+print("{:>16}  {:>13}  {:>13}  {:>14}  {:>15}  {:>16}".format(
+  "mode", "Bedrock calls", "summarize s", "Polly requests", "Polly chars", "podcast s"))
+
+claim_or_wait = claims.claim_or_wait
+release = claims.release
+
+for label, single_flight in [("no single flight", False), ("single flight", True)]:
+  claims.claim_or_wait = claim_or_wait if single_flight else always_claim
+  claims.release = release if single_flight else no_release
+
+  bedrock.calls = polly.calls = polly.characters = 0
+  summarize_times = []
+  podcast_times = []
+
+  for i in range(rounds):
+    with contextlib.redirect_stdout(io.StringIO()):
+      res = fetch_handler({"pathParameters": {"query": "{} topic{}".format(label, i)}}, None)
+      queryid = json.loads(res["body"])["queryid"]
+
+      summaries = at_once(summarize_handler, queryid)
+      podcasts = at_once(podcast_handler, queryid)
+
+    assert len(set(r[2]["scriptkey"] for r in summaries)) == 1
+    assert len(set(r[2]["audiokey"] for r in podcasts)) == 1
+    summarize_times += [r[1] for r in summaries]
+    podcast_times += [r[1] for r in podcasts]
+
+  print("{:>16}  {:13.1f}  {:>13}  {:14.1f}  {:15.0f}  {:>16}".format(
+    label,
+    bedrock.calls / rounds,
+    "{:.2f} / {:.2f}".format(sum(summarize_times) / len(summarize_times), max(summarize_times)),
+    polly.calls / rounds,
+    polly.characters / rounds,
+    "{:.2f} / {:.2f}".format(sum(podcast_times) / len(podcast_times), max(podcast_times))))
+
+print("(latency: mean / worst per client)")
@@ -0,0 +1,81 @@
+#
+# bench_streaming.py
+#
+# Script generation with and without streaming, against local
+# stand-ins for Bedrock and S3: when the caller first sees any
+# of the script (time to first token, and when the first partial
+# script shows up in the bucket for a poll to find), the total
+# time, and how many partial writes streaming costs.
+#
+# Usage: python benchmarks/bench_streaming.py [partial_interval]
+#
+
+import glob
+import os
+import sys
+import threading
+import time
+
+import standins
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(here), "fetch_articles"))
+sys.path.insert(0, os.path.join(os.path.dirname(here), "summarize"))
+
+import generation
+import htmltext
+import partials
+
+interval = float(sys.argv[1]) if len(sys.argv) > 1 else partials.DEFAULT_INTERVAL
+
+PARAMS = {"max_gen_len": 512, "temperature": 0.5, "top_p": 0.9}
+BUDGET = 8000
+
+texts = [htmltext.extract_text_stream(open(f, encoding="utf-8").read())
+         for f in sorted(glob.glob(os.path.join(here, "fixtures", "guardian_*.html")))]
+
+client = standins.FakeBedrock()
+
+print("partial script written at most every {:.2f} s".format(interval))
+print("{:>8}  {:>9}  {:>8}  {:>9}  {:>10}  {:>8}  {:>6}".format(
+  "articles", "mode", "ttft ms", "total ms", "visible ms", "writes", "same"))
+
+for n in [5, 20]:
+  articles = [texts[i % len(texts)] for i in range(n)]
+
+  start = time.perf_counter()
+  blocking, stats = generation.summarize_single(client, articles, BUDGET, PARAMS)
+  total = time.perf_counter() - start
+  print("{:8d}  {:>9}  {:8d}  {:9.0f}  {:>10}  {:>8}  {:>6}".format(
+    n, "blocking", stats["ttft_ms"], 1000 * total, "-", "-", "-"))
+
+  bucket = standins.FakeBucket()
+  key = partials.partial_key(n)
+  partial = partials.PartialScript(bucket, key, interval)
+
+  # a client polling the bucket every 50 ms:
+  visible = []
+  done = threading.Event()
+
+  def poll():
+    while not done.is_set():
+      if key in bucket.objects:
+        visible.append(time.perf_counter())
+        return
+      time.sleep(0.05)
+
+  poller = threading.Thread(target=poll)
+  poller.start()
+
+  start = time.perf_counter()
+  streamed, stats = generation.summarize_single(client, articles, BUDGET, PARAMS, on_text=partial.append)
+  partial.flush()
+  total = time.perf_counter() - start
+
+  done.set()
+  poller.join()
+
+  same = streamed == blocking and bucket.objects[key]["data"].decode() == blocking
+  print("{:8d}  {:>9}  {:8d}  {:9.0f}  {:10.0f}  {:8d}  {:>6}".format(
+    n, "streaming", stats["ttft_ms"], 1000 * total, 1000 * (visible[0] - start) if visible else -1,
+    partial.writes, "yes" if same else "NO"))
@@ -0,0 +1,74 @@
+#
+# bench_ttscache.py
+#
+# Podcast synthesis for a series of scripts that share an intro,
+# an outro and some sentences, against local stand-ins for Polly
+# and S3: without the segment cache, then with it in one warm
+# container (memory + S3), then in a new container (S3 only).
+# Reports per-request Polly requests, characters saved, hit rate
+# and time, and checks that cached audio is identical to fresh.
+#
+# Usage: python benchmarks/bench_ttscache.py [scripts] [workers]
+#
+
+import glob
+import os
+import random
+import sys
+import time
+
+import standins
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(here), "fetch_articles"))
+sys.path.insert(0, os.path.join(os.path.dirname(here), "generate_podcast"))
+
+import htmltext
+import synthesis
+import ttscache
+
+n_scripts = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+workers = int(sys.argv[2]) if len(sys.argv) > 2 else synthesis.DEFAULT_MAX_WORKERS
+
+SETTINGS = {"OutputFormat": "mp3", "VoiceId": "Joanna", "Engine": "standard"}
+
+INTRO = "Welcome back to the podcast. Here is what is making the news today."
+OUTRO = "That's all for today. Thanks for listening, and see you next time."
+
+text = " ".join(htmltext.extract_text_stream(open(f, encoding="utf-8").read())
+                for f in sorted(glob.glob(os.path.join(here, "fixtures", "guardian_*.html"))))
+pool = [s for s in synthesis.split_segments(text) if 40 < len(s) < 300]
+
+rng = random.Random(1)
+scripts = [" ".join([INTRO] + rng.sample(pool, min(10, len(pool))) + [OUTRO]) for _ in range(n_scripts)]
+
+polly = standins.FakePolly()
+bucket = standins.FakeBucket()
+
+
+def run(label, make_cache):
+  print(label)
+  print("  {:>6}  {:>8}  {:>8}  {:>8}  {:>8}".format("script", "requests", "saved", "hit rate", "ms"))
+  outputs = []
+  total = 0
+  for i, script in enumerate(scripts):
+    start = time.perf_counter()
+    audio, stats = synthesis.synthesize(polly, script, SETTINGS, max_workers=workers, cache=make_cache())
+    t = time.perf_counter() - start
+    total += t
+    outputs.append(audio)
+    print("  {:6d}  {:8d}  {:8d}  {:7.0f}%  {:8.0f}".format(
+      i + 1, stats["requests"], stats["characters_saved"], 100 * stats["hit_rate"], 1000 * t))
+  print("  total {:.0f} ms, {} Polly characters so far".format(1000 * total, polly.characters))
+  return outputs
+
+
+run("no segment cache (chunks)", lambda: None)
+
+lru = ttscache.MemoryLRU(ttscache.DEFAULT_MEMORY_BYTES)
+warm = run("segment cache, one container", lambda: ttscache.SegmentCache(bucket, SETTINGS, lru))
+
+lru = ttscache.MemoryLRU(ttscache.DEFAULT_MEMORY_BYTES)
+fresh = run("segment cache, new container (S3 only)", lambda: ttscache.SegmentCache(bucket, SETTINGS, lru))
+
+print("cached audio identical to fresh:", "yes" if warm == fresh else "NO")
@@ -0,0 +1,577 @@
+#
+# standins.py
+#
+# Local stand-ins for the services the lambdas talk to, so the
+# benchmarks in this folder run on a laptop without MySQL or AWS.
+#
+# Each stand-in sleeps for a configurable, simulated network
+# delay so the numbers reflect round trips rather than the
+# (much faster) local implementation.
+#
+
+import hashlib
+import json
+import os
+import queue
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import types
+
+
+###################################################################
+#
+# pymysql stand-in backed by SQLite
+#
+# Supports the subset of the pymysql API used by datatier.py.
+# Every execute/commit/rollback/ping counts as one round trip,
+# and connect() pays a simulated TCP + TLS + auth handshake.
+#
+class Stats:
+  connects = 0
+  round_trips = 0
+
+  @classmethod
+  def reset(cls):
+    cls.connects = 0
+    cls.round_trips = 0
+
+
+class SqliteCursor:
+
+  def __init__(self, conn):
+    self._conn = conn
+    self._cur = conn._db.cursor()
+    self.rowcount = -1
+    self.lastrowid = None
+
+  def _translate(self, sql):
+    sql = sql.replace("%s", "?")
+    sql = sql.replace("LAST_INSERT_ID()", "last_insert_rowid()")
+    # MySQL date arithmetic and upserts:
+    sql = re.sub(r"NOW\(\) - INTERVAL \? SECOND", "datetime('now', '-' || ? || ' seconds')", sql)
+    sql = sql.replace("NOW()", "datetime('now')")
+    sql = sql.replace("ON DUPLICATE KEY UPDATE", "ON CONFLICT DO UPDATE SET")
+    sql = sql.replace("INSERT IGNORE", "INSERT OR IGNORE")
+    sql = re.sub(r"VALUES\((\w+)\)", r"excluded.\1", sql)
+    return sql
+
+  def execute(self, sql, parameters=()):
+    self._conn._round_trip()
+    self._cur.execute(self._translate(sql), list(parameters or []))
+    self.rowcount = self._cur.rowcount
+    self.lastrowid = self._cur.lastrowid
+    return self.rowcount
+
+  def executemany(self, sql, seq_of_parameters):
+    # pymysql folds INSERT ... VALUES into one multi-row statement:
+    self._conn._round_trip()
+    self._cur.executemany(self._translate(sql), [list(p) for p in seq_of_parameters])
+    self.rowcount = self._cur.rowcount
+    return self.rowcount
+
+  def fetchone(self):
+    return self._cur.fetchone()
+
+  def fetchmany(self, size=1):
+    return self._cur.fetchmany(size)
+
+  def fetchall(self):
+    return self._cur.fetchall()
+
+  def __iter__(self):
+    return iter(self._cur)
+
+  def close(self):
+    self._cur.close()
+
+
+class SqliteConnection:
+
+  def __init__(self, path, rtt):
+    self._db = sqlite3.connect(path, check_same_thread=False)
+    self._rtt = rtt
+    self.open = True
+
+  def _round_trip(self):
+    Stats.round_trips += 1
+    if self._rtt:
+      time.sleep(self._rtt)
+
+  def cursor(self, cursorclass=None):
+    return SqliteCursor(self)
+
+  def ping(self, reconnect=True):
+    self._round_trip()
+
+  def begin(self):
+    self._round_trip()
+
+  def commit(self):
+    self._round_trip()
+    self._db.commit()
+
+  def rollback(self):
+    self._round_trip()
+    self._db.rollback()
+
+  def close(self):
+    self.open = False
+    self._db.close()
+
+
+def install_pymysql_standin(handshake=0.030, rtt=0.001, schema=None):
+  """
+  Registers a fake 'pymysql' module backed by a temporary SQLite
+  database, and returns the path of that database
+
+  Parameters
+  ----------
+  handshake : simulated connect latency in seconds,
+  rtt : simulated latency per round trip in seconds,
+  schema : optional SQL script run once to create tables
+
+  Returns
+  -------
+  path to the SQLite database file
+  """
+  fd, path = tempfile.mkstemp(suffix=".db")
+  os.close(fd)
+
+  if schema:
+    db = sqlite3.connect(path)
+    db.executescript(schema)
+    db.commit()
+    db.close()
+
+  def connect(host=None, port=None, user=None, passwd=None, database=None, **kwargs):
+    Stats.connects += 1
+    time.sleep(handshake)
+    return SqliteConnection(path, rtt)
+
+  module = types.ModuleType("pymysql")
+  module.connect = connect
+  module.cursors = types.SimpleNamespace(Cursor=None, SSCursor=None)
+  sys.modules["pymysql"] = module
+  return path
+
+
+#
+# SQLite flavour of database/database.sql:
+#
+SCHEMA = """
+CREATE TABLE queries
+(
+    queryid           integer primary key autoincrement,
+    querytext         varchar(256) not null,
+    status            varchar(256) not null,
+    textkey           varchar(256) not null DEFAULT '',
+    scriptkey         varchar(256) not null DEFAULT '',
+    audiokey          varchar(256) not null DEFAULT '',
+    normtext          varchar(256) not null DEFAULT '',
+    articlecount      int not null DEFAULT 0,
+    created           datetime not null DEFAULT CURRENT_TIMESTAMP,
+    claimed           datetime null DEFAULT NULL
+);
+
+CREATE TABLE articles
+(
+    articleid      integer primary key autoincrement,
+    url            varchar(256) not null,
+    headline       varchar(128) not null,
+    querytext      varchar(128) not null,
+    queryid        int not null
+);
+
+CREATE TABLE resultcache
+(
+    cachekey       char(64) primary key,
+    kind           varchar(32) not null,
+    artifactkey    varchar(256) not null,
+    latency_ms     int not null DEFAULT 0,
+    hits           int not null DEFAULT 0,
+    created        datetime not null DEFAULT CURRENT_TIMESTAMP,
+    lastused       datetime not null DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE jobs
+(
+    jobid          integer primary key autoincrement,
+    kind           varchar(32) not null,
+    target         varchar(256) not null,
+    params         text not null,
+    queryid        int not null DEFAULT 0,
+    state          varchar(32) not null DEFAULT 'queued',
+    statuscode     int not null DEFAULT 0,
+    result         text,
+    created        datetime not null DEFAULT CURRENT_TIMESTAMP,
+    updated        datetime not null DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE idempotency
+(
+    idemkey        char(64) primary key,
+    request        char(64) not null,
+    state          varchar(32) not null DEFAULT 'running',
+    statuscode     int not null DEFAULT 0,
+    response       text,
+    created        datetime not null DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+
+###################################################################
+#
+# S3 bucket stand-in
+#
+# In-memory version of the parts of the boto3 Bucket resource the
+# lambdas use. Every request pays a fixed latency, plus transfer
+# time at the given bandwidth (bytes/second).
+#
+class FakeBody:
+
+  def __init__(self, data):
+    self._data = data
+    self._pos = 0
+
+  def read(self, amt=None):
+    if amt is None:
+      amt = len(self._data) - self._pos
+    chunk = self._data[self._pos:self._pos + amt]
+    self._pos += len(chunk)
+    return chunk
+
+
+class FakeObject:
+
+  def __init__(self, bucket, key):
+    self._bucket = bucket
+    self.key = key
+
+  def get(self):
+    obj = self._bucket._get(self.key)
+    response = dict(obj["meta"])
+    response["Body"] = FakeBody(obj["data"])
+    response["ContentLength"] = len(obj["data"])
+    return response
+
+
+class FakeS3Client:
+  #
+  # bucket.meta.client: HEAD, DELETE, multipart uploads and presigning
+  #
+  def __init__(self, bucket):
+    self._bucket = bucket
+    self._uploads = {}
+
+  def head_object(self, Bucket, Key):
+    self._bucket._request()
+    if Key not in self._bucket.objects:
+      from botocore.exceptions import ClientError
+      raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+    obj = self._bucket.objects[Key]
+    return dict(obj["meta"], ContentLength=obj["size"])
+
+  def delete_object(self, Bucket, Key):
+    self._bucket._request()
+    self._bucket.objects.pop(Key, None)
+    return {}
+
+  def create_multipart_upload(self, Bucket, Key, **kwargs):
+    self._bucket._request()
+    upload_id = "upload-" + str(len(self._uploads) + 1)
+    self._uploads[upload_id] = {"key": Key, "meta": kwargs, "parts": {}}
+    return {"UploadId": upload_id}
+
+  def upload_part(self, Bucket, Key, PartNumber, UploadId, Body):
+    data = Body if isinstance(Body, (bytes, bytearray)) else Body.read()
+    self._bucket._request(len(data))
+    etag = hashlib.md5(data).hexdigest()
+    # with keep_data=False only the part's hash and size are kept:
+    self._uploads[UploadId]["parts"][PartNumber] = (etag, bytes(data) if self._bucket.keep_data else b"", len(data))
+    return {"ETag": etag}
+
+  def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+    self._bucket._request()
+    upload = self._uploads.pop(UploadId)
+    parts = [upload["parts"][p["PartNumber"]] for p in MultipartUpload["Parts"]]
+    assert all(etag == p["ETag"] for (etag, _, _), p in zip(parts, MultipartUpload["Parts"]))
+    self._bucket._store(Key, b"".join(data for _, data, _ in parts), upload["meta"],
+                        size=sum(size for _, _, size in parts))
+    return {}
+
+  def abort_multipart_upload(self, Bucket, Key, UploadId):
+    self._bucket._request()
+    self._uploads.pop(UploadId, None)
+    return {}
+
+  def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600):
+    # like a real one, valid from the time it is signed:
+    return "https://{}.s3.amazonaws.com/{}?X-Amz-Date={}&X-Amz-Expires={}".format(
+      Params["Bucket"], Params["Key"], time.time_ns(), ExpiresIn)
+
+
+class FakeBucket:
+  #
+  # keep_data=False keeps only the size of stored objects (and
+  # the hashes of multipart parts), for benchmarks where the
+  # stand-in holding the data would distort memory measurements
+  #
+  def __init__(self, name="bucket", latency=0.020, bandwidth=50e6, keep_data=True):
+    self.name = name
+    self.objects = {}
+    self.requests = 0
+    self.keep_data = keep_data
+    self.meta = types.SimpleNamespace(client=FakeS3Client(self))
+    self._latency = latency
+    self._bandwidth = bandwidth
+
+  def _request(self, nbytes=0):
+    self.requests += 1
+    delay = self._latency + (nbytes / self._bandwidth if self._bandwidth else 0)
+    if delay:
+      time.sleep(delay)
+
+  def _store(self, key, data, meta, size=None):
+    self.objects[key] = {
+      "data": bytes(data) if self.keep_data else b"",
+      "meta": meta,
+      "size": len(data) if size is None else size,
+    }
+
+  def _put(self, key, data, meta):
+    self._request(len(data))
+    self._store(key, data, meta)
+
+  def _get(self, key):
+    if key not in self.objects:
+      self._request()
+      from botocore.exceptions import ClientError
+      raise ClientError({"Error": {"Code": "NoSuchKey", "Message": key}}, "GetObject")
+    obj = self.objects[key]
+    self._request(len(obj["data"]))
+    return obj
+
+  def put_object(self, Key, Body, **kwargs):
+    data = Body if isinstance(Body, (bytes, bytearray)) else Body.read()
+    self._put(Key, data, kwargs)
+
+  def upload_file(self, Filename, Key, ExtraArgs=None):
+    with open(Filename, "rb") as f:
+      self._put(Key, f.read(), dict(ExtraArgs or {}))
+
+  def upload_fileobj(self, Fileobj, Key, ExtraArgs=None, Config=None):
+    self._put(Key, Fileobj.read(), dict(ExtraArgs or {}))
+
+  def download_file(self, Key, Filename):
+    obj = self._get(Key)
+    with open(Filename, "wb") as f:
+      f.write(obj["data"])
+
+  def Object(self, key):
+    return FakeObject(self, key)
+
+
+###################################################################
+#
+# Bedrock runtime stand-in
+#
+# Answers invoke_model like Llama on Bedrock, with a latency of
+# a fixed overhead, plus time per input token (prompt processing)
+# and per output token (generation). The "generation" is always
+# half of max_gen_len words long, taken from the end of the prompt.
+# invoke_model_with_response_stream sends it one word per chunk,
+# each as soon as it is "generated", in Bedrock's event format.
+#
+class FakeBedrock:
+
+  def __init__(self, overhead=0.300, per_input_token=0.0002, per_output_token=0.015):
+    self.overhead = overhead
+    self.per_input_token = per_input_token
+    self.per_output_token = per_output_token
+    self.calls = 0
+
+  def _generate(self, body):
+    request = json.loads(body)
+    prompt = request["prompt"]
+    max_gen_len = request.get("max_gen_len", 512)
+
+    words = prompt.split()
+    input_tokens = len(words)
+    output_tokens = max_gen_len // 2
+    text = " ".join((words * (1 + output_tokens // max(1, len(words))))[-output_tokens:])
+
+    self.calls += 1
+    return request, prompt, input_tokens, text, output_tokens
+
+  def invoke_model(self, modelId, contentType, accept, body):
+    request, prompt, input_tokens, text, output_tokens = self._generate(body)
+
+    time.sleep(self.overhead + self.per_input_token * input_tokens + self.per_output_token * output_tokens)
+
+    payload = json.dumps({
+      "generation": text,
+      "prompt_token_count": input_tokens,
+      "generation_token_count": output_tokens,
+      "stop_reason": "stop",
+    }).encode()
+    return {"body": FakeBody(payload)}
+
+  def invoke_model_with_response_stream(self, modelId, contentType, accept, body):
+    request, prompt, input_tokens, text, output_tokens = self._generate(body)
+
+    def events():
+      time.sleep(self.overhead + self.per_input_token * input_tokens)
+      words = text.split(" ")
+      for i, word in enumerate(words):
+        time.sleep(self.per_output_token)
+        last = i == len(words) - 1
+        chunk = {
+          "generation": word if i == 0 else " " + word,
+          "prompt_token_count": input_tokens if i == 0 else None,
+          "generation_token_count": i + 1,
+          "stop_reason": "stop" if last else None,
+        }
+        yield {"chunk": {"bytes": json.dumps(chunk).encode()}}
+
+    return {"body": events()}
+
+
+###################################################################
+#
+# Polly stand-in
+#
+# Answers synthesize_speech with MP3 audio whose duration grows
+# with the text (chars_per_second of speech), as MPEG-2 layer III
+# frames like Polly's 22050 Hz mono output, after a latency of a
+# fixed overhead plus time per character. Like a typical encoder,
+# each stream starts with an ID3 tag and an Info frame, and ends
+# with an ID3v1 tag. Texts over Polly's limit are refused.
+#
+class FakePolly:
+
+  MAX_CHARS = 3000
+
+  # MPEG-2 layer III, 64 kbps, 22050 Hz, mono, no padding:
+  FRAME_HEADER = bytes([0xFF, 0xF3, 0x80, 0xC0])
+  FRAME_LENGTH = 72 * 64000 // 22050
+  FRAME_SECONDS = 576 / 22050
+
+  def __init__(self, overhead=0.150, per_char=0.0005, chars_per_second=15):
+    self.overhead = overhead
+    self.per_char = per_char
+    self.chars_per_second = chars_per_second
+    self.calls = 0
+    self.characters = 0
+
+  def _frame(self, payload):
+    body = (payload * (1 + self.FRAME_LENGTH // max(1, len(payload))))[:self.FRAME_LENGTH - 4]
+    return self.FRAME_HEADER + body
+
+  def synthesize_speech(self, Text, OutputFormat, VoiceId, Engine=None, **kwargs):
+    if len(Text) > self.MAX_CHARS:
+      raise Exception("TextLengthExceededException: " + str(len(Text)) + " characters")
+
+    time.sleep(self.overhead + self.per_char * len(Text))
+    self.calls += 1
+    self.characters += len(Text)
+
+    nframes = max(1, round(len(Text) / self.chars_per_second / self.FRAME_SECONDS))
+    payload = Text.encode("utf-8")
+
+    id3 = b"ID3\x04\x00\x00" + bytes([0, 0, 0, 16]) + bytes(16)
+    info = self.FRAME_HEADER + bytes(9) + b"Info" + bytes(self.FRAME_LENGTH - 17)
+    frames = b"".join(self._frame(payload[i:] or b"\0") for i in range(nframes))
+    tag = b"TAG" + bytes(125)
+
+    return {
+      "AudioStream": FakeBody(id3 + info + frames + tag),
+      "ContentType": "audio/mpeg",
+      "RequestCharacters": len(Text),
+    }
+
+
+###################################################################
+#
+# SQS stand-in
+#
+# An in-process queue: send_message queues the message, and
+# worker threads deliver each one to a handler as an SQS event
+# with one record, the way a Lambda event source mapping with
+# batch size 1 does. A handler that raises has its message
+# delivered again, at most max_receives times.
+#
+class FakeSQS:
+
+  def __init__(self, handler, workers=1, latency=0.010, max_receives=3):
+    self.handler = handler
+    self.latency = latency
+    self.max_receives = max_receives
+    self.sent = 0
+    self._queue = queue.Queue()
+    self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+    for t in self._threads:
+      t.start()
+
+  def send_message(self, QueueUrl, MessageBody, DelaySeconds=0, **kwargs):
+    time.sleep(self.latency)
+    self.sent += 1
+    message_id = "message-" + str(self.sent)
+    self._queue.put((message_id, MessageBody, 1, time.monotonic() + DelaySeconds))
+    return {"MessageId": message_id}
+
+  def _work(self):
+    while True:
+      message_id, body, receives, visible = self._queue.get()
+      time.sleep(max(0, visible - time.monotonic()))
+      try:
+        self.handler({"Records": [{"messageId": message_id, "body": body}]}, None)
+      except Exception:
+        if receives < self.max_receives:
+          self._queue.put((message_id, body, receives + 1, 0))
+      finally:
+        self._queue.task_done()
+
+  def join(self):
+    """
+    Waits until every message sent so far has been handled
+    """
+    self._queue.join()
+
+
+###################################################################
+#
+# helpers
+#
+def add_repo_to_path():
+  """
+  Makes the top-level shared modules (datatier.py, ...) importable
+  """
+  root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  if root not in sys.path:
+    sys.path.insert(0, root)
+  return root
+
+
+def timeit(fn, repeat):
+  """
+  Calls fn() repeat times, returns list of per-call seconds
+  """
+  times = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    fn()
+    times.append(time.perf_counter() - start)
+  return times
+
+
+def summary(times):
+  times = sorted(times)
+  n = len(times)
+  return "mean {:7.2f} ms   p50 {:7.2f} ms   p95 {:7.2f} ms".format(
+    1000 * sum(times) / n,
+    1000 * times[n // 2],
+    1000 * times[min(n - 1, int(n * 0.95))])
@@ -6,6 +6,9 @@ USE podcastgenerator;
 
 DROP TABLE IF EXISTS queries;
 DROP TABLE IF EXISTS articles;
+DROP TABLE IF EXISTS resultcache;
+DROP TABLE IF EXISTS jobs;
+DROP TABLE IF EXISTS idempotency;
 
 CREATE TABLE queries
 (
@@ -15,7 +18,13 @@ CREATE TABLE queries
     textkey           varchar(256) not null DEFAULT '', -- S3 bucket key for the combined article content .txt file
     scriptkey         varchar(256) not null DEFAULT '', -- S3 bucket key for the generated podcast script .txt file (the summarize of all articled fetched from the Guardian API)
     audiokey          varchar(256) not null DEFAULT '',  -- S3 bucket key for the generated audio file .mp3
-    PRIMARY KEY (queryid)
+                                                         -- (the S3 keys are content-addressed, several queries can share one)
+    normtext          varchar(256) not null DEFAULT '', -- normalized querytext (lowercased, whitespace collapsed); '' once evicted from the query cache
+    articlecount      int not null DEFAULT 0, -- # of articles asked for (the Guardian may have had fewer), for query cache lookups
+    created           datetime not null DEFAULT CURRENT_TIMESTAMP, -- when the query was made, for the query cache TTL
+    claimed           datetime null DEFAULT NULL, -- when a request claimed it for summarizing / synthesizing (see claims.py)
+    PRIMARY KEY (queryid),
+    INDEX normtext_idx (normtext, created) -- query cache lookups
 );
 
 ALTER TABLE queries AUTO_INCREMENT = 10001; -- starting value
@@ -32,3 +41,46 @@ CREATE TABLE articles
 );
 
 ALTER TABLE articles AUTO_INCREMENT = 20001;
+
+CREATE TABLE resultcache
+(
+    cachekey       char(64) not null, -- SHA-256 of everything that determines the result (model, prompt, input text, parameters...)
+    kind           varchar(32) not null, -- kind of result, e.g. 'script'
+    artifactkey    varchar(256) not null, -- S3 bucket key of the cached result
+    latency_ms     int not null DEFAULT 0, -- how long producing the result took, i.e. what a hit saves
+    hits           int not null DEFAULT 0,
+    created        datetime not null DEFAULT CURRENT_TIMESTAMP, -- for TTL expiry
+    lastused       datetime not null DEFAULT CURRENT_TIMESTAMP, -- for LRU eviction
+    PRIMARY KEY (cachekey),
+    INDEX kind_lastused_idx (kind, lastused),
+    INDEX kind_created_idx (kind, created)
+);
+
+CREATE TABLE jobs
+(
+    jobid          int not null AUTO_INCREMENT,
+    kind           varchar(32) not null, -- 'fetch', 'summarize', 'podcast' or 'pipeline'
+    target         varchar(256) not null, -- the query text (fetch, pipeline) or queryid (summarize, podcast)
+    params         text not null, -- the request's query string options, as JSON
+    queryid        int not null DEFAULT 0, -- the query the job works on, once known (its status is the job's progress)
+    state          varchar(32) not null DEFAULT 'queued', -- queued, running, done or failed
+    statuscode     int not null DEFAULT 0, -- HTTP status of the finished job
+    result         mediumtext, -- response body of the finished job, as JSON
+    created        datetime not null DEFAULT CURRENT_TIMESTAMP,
+    updated        datetime not null DEFAULT CURRENT_TIMESTAMP, -- last change, for the worker's lease
+    PRIMARY KEY (jobid)
+);
+
+ALTER TABLE jobs AUTO_INCREMENT = 30001;
+
+CREATE TABLE idempotency
+(
+    idemkey        char(64) not null, -- SHA-256 of the request's Idempotency-Key header
+    request        char(64) not null, -- SHA-256 of the endpoint, target and options it was used for
+    state          varchar(32) not null DEFAULT 'running', -- running or done
+    statuscode     int not null DEFAULT 0, -- HTTP status of the response
+    response       mediumtext, -- response body, as JSON
+    created        datetime not null DEFAULT CURRENT_TIMESTAMP, -- for the TTL
+    PRIMARY KEY (idemkey),
+    INDEX created_idx (created) -- TTL cleanup
+);
@@ -0,0 +1,219 @@
+#
+# htmltext.py
+#
+# Extracts the readable text from the HTML body of a Guardian
+# article. There are several backends:
+#
+#   "stream" - html.parser.HTMLParser subclass that collects text
+#              as it scans, never building a tree (standard library)
+#   "lxml"   - lxml's C parser (needs the lxml package)
+#   "bs4"    - BeautifulSoup with html.parser, the original
+#              implementation, kept as the reference
+#
+# The text is what BeautifulSoup's
+#   get_text(separator=" ", strip=True)
+# returns, followed by html.unescape: every run of text between
+# two pieces of markup, stripped, skipping empty runs, joined by
+# single spaces. Text inside <script>, <style>, <template>, <rt>
+# and <rp>, and comments, are not part of the article.
+#
+# "stream", the default, gives exactly that text. lxml differs on
+# rare markup: it keeps the markup inside <textarea> as text
+# ("<b>x</b>" instead of "x") and drops CDATA sections, so it is
+# only used when asked for ("lxml", or "auto": lxml when it is
+# installed, else stream).
+#
+
+import html
+
+from html.parser import HTMLParser
+
+
+SKIPPED_TAGS = {"script", "style", "template", "rt", "rp"}
+
+DEFAULT_EXTRACTOR = "stream"
+
+
+###################################################################
+#
+# stream backend
+#
+class _TextCollector(HTMLParser):
+
+  def __init__(self):
+    super().__init__(convert_charrefs=True)
+    self.parts = []
+    self._pending = []
+    self._skip_depth = 0
+
+  def _flush(self):
+    # a run of text ends whenever markup starts:
+    if self._pending:
+      text = "".join(self._pending).strip()
+      self._pending = []
+      if text and self._skip_depth == 0:
+        self.parts.append(text)
+
+  def handle_starttag(self, tag, attrs):
+    self._flush()
+    if tag in SKIPPED_TAGS:
+      self._skip_depth += 1
+
+  def handle_endtag(self, tag):
+    self._flush()
+    if tag in SKIPPED_TAGS and self._skip_depth > 0:
+      self._skip_depth -= 1
+
+  def handle_startendtag(self, tag, attrs):
+    self._flush()
+
+  def handle_data(self, data):
+    self._pending.append(data)
+
+  def handle_comment(self, data):
+    self._flush()
+
+  def handle_decl(self, decl):
+    self._flush()
+
+  def handle_pi(self, data):
+    self._flush()
+
+  def unknown_decl(self, data):
+    self._flush()
+    if data.upper().startswith("CDATA["):
+      text = data[len("CDATA["):].strip()
+      if text:
+        self.parts.append(text)
+
+  def close(self):
+    super().close()
+    self._flush()
+
+
+def extract_text_stream(body):
+  """
+  Returns the text of an HTML body, scanning it once with
+  html.parser and never building a document tree
+
+  Parameters
+  ----------
+  body : HTML (string)
+
+  Returns
+  -------
+  text (string)
+  """
+  collector = _TextCollector()
+  collector.feed(body)
+  collector.close()
+  return html.unescape(" ".join(collector.parts))
+
+
+###################################################################
+#
+# lxml backend
+#
+def _lxml_parts(element, parts, skipping):
+  tag = element.tag if isinstance(element.tag, str) else None  # None => comment/PI
+
+  inner_skipping = skipping or tag is None or tag in SKIPPED_TAGS
+
+  if not inner_skipping and element.text:
+    text = element.text.strip()
+    if text:
+      parts.append(text)
+
+  for child in element:
+    _lxml_parts(child, parts, inner_skipping)
+
+  # text after the closing tag belongs to the parent:
+  if not skipping and element.tail:
+    text = element.tail.strip()
+    if text:
+      parts.append(text)
+
+
+def extract_text_lxml(body):
+  """
+  Returns the text of an HTML body, parsed with lxml
+
+  Parameters
+  ----------
+  body : HTML (string)
+
+  Returns
+  -------
+  text (string)
+  """
+  import lxml.html
+
+  if not body.strip():
+    return ""
+
+  root = lxml.html.fragment_fromstring(body, create_parent="div")
+
+  parts = []
+  _lxml_parts(root, parts, False)
+  return html.unescape(" ".join(parts))
+
+
+###################################################################
+#
+# bs4 backend
+#
+def extract_text_bs4(body):
+  """
+  Returns the text of an HTML body, parsed with BeautifulSoup
+  (the reference implementation; slowest)
+
+  Parameters
+  ----------
+  body : HTML (string)
+
+  Returns
+  -------
+  text (string)
+  """
+  from bs4 import BeautifulSoup
+
+  soup = BeautifulSoup(body, "html.parser")
+  text = soup.get_text(separator=" ", strip=True)
+  return html.unescape(text)
+
+
+EXTRACTORS = {
+  "stream": extract_text_stream,
+  "lxml": extract_text_lxml,
+  "bs4": extract_text_bs4,
+}
+
+
+###################################################################
+#
+# get_extractor
+#
+def get_extractor(name=DEFAULT_EXTRACTOR):
+  """
+  Returns the text extraction function for a backend
+
+  Parameters
+  ----------
+  name : "stream", "lxml", "bs4", or "auto" for lxml when it
+         is installed and stream otherwise
+
+  Returns
+  -------
+  function taking an HTML body (string) and returning its text
+  """
+  if name == "auto":
+    try:
+      import lxml.html
+      return extract_text_lxml
+    except ImportError:
+      return extract_text_stream
+
+  if name not in EXTRACTORS:
+    raise ValueError("unknown html extractor: " + str(name))
+
+  return EXTRACTORS[name]
@@ -0,0 +1,619 @@
+#
+# datatier.py
+#
+# Executes SQL queries against a MySQL database.
+#
+# Original author:
+#   Prof. Joe Hummel
+#   Northwestern University
+#
+
+import os
+import threading
+
+from contextlib import contextmanager
+
+import pymysql
+
+
+###################################################################
+#
+# connection pool:
+#
+# Lambda keeps the module loaded between warm invocations, so
+# connections parked here survive from one request to the next
+# and we skip the TCP + auth handshake with MySQL. The pool is
+# keyed by server/login/database, and holds at most
+# POOL_MAX_SIZE idle connections per key; anything beyond that
+# is closed when released.
+#
+POOL_MAX_SIZE = int(os.environ.get("DATATIER_POOL_MAX_SIZE", "2"))
+
+_pool = {}             # key => list of idle connections
+_pool_keys = {}        # id(connection) => key
+_failed = set()        # id(connection) of those a statement failed on
+_pool_lock = threading.Lock()
+
+
+def _close_quietly(dbConn):
+  try:
+    dbConn.close()
+  except Exception:
+    pass
+
+
+###################################################################
+#
+# get_dbConn:
+#
+# Returns a connection object for interacting with a MySQL
+# database. An idle connection from the pool is reused when one
+# is available (after a ping to make sure it is still alive),
+# otherwise a new connection is opened.
+#
+def get_dbConn(endpoint, portnum, username, pwd, dbname):
+  """
+  Returns a connection object for interacting with a MySQL
+  database, reusing a pooled connection when possible
+
+  Parameters
+  ----------
+  endpoint : machine name or IP address of server (string),
+  portnum : server port # (integer),
+  username : user name for login (string),
+  pwd : user password for login (string),
+  dbname : database name (string)
+
+  Returns
+  -------
+  a connection object; hand it back with release_dbConn()
+  when done so the next invocation can reuse it
+  """
+  key = (endpoint, portnum, username, dbname)
+
+  while True:
+    with _pool_lock:
+      idle = _pool.get(key)
+      dbConn = idle.pop() if idle else None
+
+    if dbConn is None:
+      break
+
+    try:
+      # cheap round trip; reconnects in place if the server
+      # dropped us (e.g. wait_timeout while the container
+      # was frozen):
+      dbConn.ping(reconnect=True)
+      return dbConn
+    except Exception as err:
+      print("datatier.get_dbConn(): discarding stale connection:", str(err))
+      with _pool_lock:
+        _pool_keys.pop(id(dbConn), None)
+      _close_quietly(dbConn)
+
+  try:
+    dbConn = pymysql.connect(host=endpoint,
+                             port=portnum,
+                             user=username,
+                             passwd=pwd,
+                             database=dbname)
+
+    with _pool_lock:
+      _pool_keys[id(dbConn)] = key
+
+    return dbConn
+
+  except Exception as err:
+    print("datatier.get_dbConn() failed:")
+    print(str(err))
+    raise
+
+
+###################################################################
+#
+# _mark_failed:
+#
+# Remembers that a statement failed on a connection, so that
+# release_dbConn closes it instead of pooling it.
+#
+def _mark_failed(dbConn):
+  with _pool_lock:
+    _failed.add(id(dbConn))
+
+
+###################################################################
+#
+# release_dbConn:
+#
+# Returns a connection obtained from get_dbConn to the pool.
+# Any open transaction is rolled back first so the next user
+# does not inherit a stale snapshot or half-done work. If the
+# pool is already full the connection is closed instead.
+#
+# A connection a statement failed on is closed, not pooled: a
+# rollback does not undo session state (e.g. a SET
+# FOREIGN_KEY_CHECKS = 0 whose matching SET ... = 1 never ran),
+# and the next invocation must not inherit it.
+#
+def release_dbConn(dbConn):
+  """
+  Returns a connection to the pool for reuse by later calls
+  to get_dbConn (or closes it if the pool is full)
+
+  Parameters
+  ----------
+  dbConn : a connection returned by get_dbConn, or None
+
+  Returns
+  -------
+  nothing
+  """
+  if dbConn is None:
+    return
+
+  with _pool_lock:
+    failed = id(dbConn) in _failed
+    _failed.discard(id(dbConn))
+
+  try:
+    if not failed:
+      dbConn.rollback()
+  except Exception:
+    failed = True
+
+  if failed:
+    with _pool_lock:
+      _pool_keys.pop(id(dbConn), None)
+    _close_quietly(dbConn)
+    return
+
+  with _pool_lock:
+    key = _pool_keys.get(id(dbConn))
+    idle = _pool.setdefault(key, []) if key is not None else None
+
+    if idle is not None and len(idle) < POOL_MAX_SIZE and dbConn not in idle:
+      idle.append(dbConn)
+      return
+
+    _pool_keys.pop(id(dbConn), None)
+
+  _close_quietly(dbConn)
+
+
+###################################################################
+#
+# close_pool:
+#
+# Closes every idle connection held by the pool.
+#
+def close_pool():
+  """
+  Closes all idle pooled connections
+
+  Parameters
+  ----------
+  None
+
+  Returns
+  -------
+  nothing
+  """
+  with _pool_lock:
+    conns = [c for idle in _pool.values() for c in idle]
+    _pool.clear()
+    for c in conns:
+      _pool_keys.pop(id(c), None)
+
+  for c in conns:
+    _close_quietly(c)
+
+
+##################################################################
+#
+# retrieve_one_row:
+#
+# Given a database connection and an SQL Select query,
+# executes this query against the database and returns
+# the first row (tuple) retrieved by the query (the tuple
+# can be empty if the SELECT retrieved no data). The query
+# can be parameterized using %s, in which case pass the
+# values as a list [value1, value2, ...]
+#
+def retrieve_one_row(dbConn, sql, parameters=[]):
+  """
+  Executes an sql SELECT query against the database connection
+  and returns the first row as a tuple
+
+  Parameters
+  __________
+  dbConn : the database connection, 
+  sql : the SQL SELECT query (can be parameterized with %s),
+  parameters: optional list of values if parameterized
+
+  Returns
+  _______
+  First row as a tuple, or () if SELECT retrieves no data
+  """
+
+  dbCursor = dbConn.cursor()
+
+  try:
+    dbCursor.execute(sql, parameters)
+    row = dbCursor.fetchone()
+    if row is None:  # executed successfully, but no data was retrieved
+      return ()
+    else:
+      return row
+
+  except Exception as err:
+    _mark_failed(dbConn)
+    print("datatier.retrieve_one_row() failed:")
+    print(str(err))
+    raise
+
+  finally:
+    dbCursor.close()
+
+
+##################################################################
+#
+# retrieve_all_rows:
+#
+# Given a database connection and an SQL Select query,
+# executes this query against the database and returns
+# a list of rows (tuples) retrieved by the query. If the
+# query retrieves no data, the empty list [] is returned.
+# The query can be parameterized using %s, in which case
+# pass the values as a list [value1, value2, ...]
+#
+def retrieve_all_rows(dbConn, sql, parameters=[]):
+  """
+  Executes an sql SELECT query against the database connection
+  and returns all rows as a list of tuples
+
+  Parameters
+  __________
+  dbConn : the database connection, 
+  sql : the SQL SELECT query (can be parameterized with %s),
+  parameters: optional list of values if parameterized
+
+  Returns
+  _______
+  All rows as a list of tuples, or [] if SELECT retrieves no
+  data
+  """
+
+  dbCursor = dbConn.cursor()
+
+  try:
+    dbCursor.execute(sql, parameters)
+    rows = dbCursor.fetchall()
+    if rows is None:  # executed successfully, but no data was retrieved
+      return []
+    else:
+      return rows
+
+  except Exception as err:
+    _mark_failed(dbConn)
+    print("datatier.retrieve_all_rows() failed:")
+    print(str(err))
+    raise
+
+  finally:
+    dbCursor.close()
+
+
+##################################################################
+#
+# retrieve_rows_iter:
+#
+# Given a database connection and an SQL Select query, returns
+# a generator over the rows (tuples) retrieved by the query.
+# Rows are read from an unbuffered server-side cursor in
+# batches, so the whole result set is never held in memory.
+# The query can be parameterized using %s, in which case pass
+# the values as a list [value1, value2, ...]
+#
+# NOTE: the connection cannot run another query until the
+# generator is exhausted or closed.
+#
+def retrieve_rows_iter(dbConn, sql, parameters=[], batch_size=100):
+  """
+  Executes an sql SELECT query against the database connection
+  and yields the rows one at a time as tuples
+
+  Parameters
+  __________
+  dbConn : the database connection, 
+  sql : the SQL SELECT query (can be parameterized with %s),
+  parameters: optional list of values if parameterized,
+  batch_size: # of rows to fetch from the server at a time
+
+  Returns
+  _______
+  A generator of tuples (yields nothing if SELECT retrieves
+  no data)
+  """
+
+  dbCursor = dbConn.cursor(pymysql.cursors.SSCursor)
+
+  try:
+    dbCursor.execute(sql, parameters)
+
+    while True:
+      rows = dbCursor.fetchmany(batch_size)
+      if not rows:
+        break
+      for row in rows:
+        yield row
+
+  except Exception as err:
+    _mark_failed(dbConn)
+    print("datatier.retrieve_rows_iter() failed:")
+    print(str(err))
+    raise
+
+  finally:
+    # closing an unbuffered cursor drains any unread rows:
+    dbCursor.close()
+
+
+###############################################################
+#
+# perform_action:
+#
+# Given a database connection and an SQL action query,
+# executes an ACTION query and returns the number of rows
+# modified; a return value of 0 means no rows were
+# modified. Action queries are typically "insert",
+# "update", "delete". The query can be parameterized
+# using %s, in which case pass the values as a list
+# [value1, value2, ...]
+#
+def perform_action(dbConn, sql, parameters=[], commit=True):
+  """
+  Executes an sql ACTION query against the database connection
+  and returns number of rows modified
+
+  Parameters
+  __________
+  dbConn : the database connection, 
+  sql : the SQL SELECT query (can be parameterized with %s),
+  parameters: optional list of values if parameterized,
+  commit: commit right away (pass False inside a transaction())
+
+  Returns
+  _______
+  number of rows modified (0 is not an error but implies
+  the query made no modifications)
+  """
+
+  dbCursor = dbConn.cursor()
+
+  try:
+    # try to execute, and if successful commit the changes
+    # and return the # of rows modified by the query:
+    dbCursor.execute(sql, parameters)
+    if commit:
+      dbConn.commit()
+    return dbCursor.rowcount
+
+  except Exception as err:
+    # failed, rollback any possible changes and log error:
+    _mark_failed(dbConn)
+    dbConn.rollback()
+    print("datatier.perform_action() failed:")
+    print(str(err))
+    raise
+
+  finally:
+    dbCursor.close()
+
+
+###############################################################
+#
+# perform_insert:
+#
+# Like perform_action, but for a single-row INSERT into a table
+# with an AUTO_INCREMENT key: returns the id of the new row,
+# which MySQL sends back with the OK packet, so there is no
+# need for a separate "SELECT LAST_INSERT_ID()" round trip.
+#
+def perform_insert(dbConn, sql, parameters=[], commit=True):
+  """
+  Executes an sql INSERT query against the database connection
+  and returns the AUTO_INCREMENT id of the inserted row
+
+  Parameters
+  __________
+  dbConn : the database connection, 
+  sql : the SQL INSERT query (can be parameterized with %s),
+  parameters: optional list of values if parameterized,
+  commit: commit right away (pass False inside a transaction())
+
+  Returns
+  _______
+  id of the inserted row
+  """
+
+  dbCursor = dbConn.cursor()
+
+  try:
+    dbCursor.execute(sql, parameters)
+    if commit:
+      dbConn.commit()
+    return dbCursor.lastrowid
+
+  except Exception as err:
+    _mark_failed(dbConn)
+    dbConn.rollback()
+    print("datatier.perform_insert() failed:")
+    print(str(err))
+    raise
+
+  finally:
+    dbCursor.close()
+
+
+###############################################################
+#
+# perform_action_many:
+#
+# Executes the same ACTION query once per parameter list, using
+# executemany. For "INSERT ... VALUES (%s, ...)" statements
+# pymysql sends all the rows as one multi-row INSERT, i.e. one
+# round trip no matter how many rows.
+#
+def perform_action_many(dbConn, sql, rows, commit=True):
+  """
+  Executes an sql ACTION query for each list of parameters in
+  rows and returns the total number of rows modified
+
+  Parameters
+  __________
+  dbConn : the database connection, 
+  sql : the SQL ACTION query (parameterized with %s),
+  rows: list of parameter lists, one per execution,
+  commit: commit right away (pass False inside a transaction())
+
+  Returns
+  _______
+  number of rows modified
+  """
+
+  if len(rows) == 0:
+    return 0
+
+  dbCursor = dbConn.cursor()
+
+  try:
+    dbCursor.executemany(sql, rows)
+    if commit:
+      dbConn.commit()
+    return dbCursor.rowcount
+
+  except Exception as err:
+    _mark_failed(dbConn)
+    dbConn.rollback()
+    print("datatier.perform_action_many() failed:")
+    print(str(err))
+    raise
+
+  finally:
+    dbCursor.close()
+
+
+###############################################################
+#
+# compare_and_set:
+#
+# Atomically changes a column of one row from an expected value
+# to a new one: "UPDATE ... WHERE key = %s AND column = expected".
+# The row is locked while the UPDATE runs, so when several
+# callers race for the same transition exactly one of them sees
+# the row change, and that caller has won it.
+#
+# With a lease_column (a datetime), the winner's time is stamped
+# there, and a row left in the new state for more than lease
+# seconds (its owner crashed or timed out) can be taken over.
+#
+# The table and column names go into the SQL as they are, so
+# they must be constants, never user input.
+#
+def compare_and_set(dbConn, table, keys, column, expected, new, updates={}, lease_column=None, lease=0, commit=True):
+  """
+  Sets column to new in the row identified by keys, only if it
+  is expected, and returns whether this call changed it
+
+  Parameters
+  __________
+  dbConn : the database connection,
+  table : table name,
+  keys : dict of key column => value identifying the row,
+  column : the column to compare and set,
+  expected : the value column must have,
+  new : the value to set it to,
+  updates : dict of other column => value to set with it,
+  lease_column : optional datetime column stamped with NOW(),
+  lease : seconds after which a row still in state new (per
+          lease_column) may be taken over, 0 never,
+  commit: commit right away (pass False inside a transaction())
+
+  Returns
+  _______
+  True if the row was changed, False if it did not have the
+  expected value (or does not exist)
+  """
+
+  sets = [column + " = %s"] + [name + " = %s" for name in updates]
+  parameters = [new] + list(updates.values())
+  if lease_column is not None:
+    sets.append(lease_column + " = NOW()")
+
+  where = [name + " = %s" for name in keys]
+  parameters += list(keys.values())
+
+  condition = column + " = %s"
+  parameters.append(expected)
+  if lease_column is not None and lease > 0:
+    condition = "(" + condition + " OR (" + column + " = %s AND " + lease_column + " < NOW() - INTERVAL %s SECOND))"
+    parameters += [new, lease]
+
+  sql = "UPDATE " + table + " SET " + ", ".join(sets) + " WHERE " + " AND ".join(where) + " AND " + condition + ";"
+
+  return perform_action(dbConn, sql, parameters, commit) == 1
+
+
+###############################################################
+#
+# transaction:
+#
+# Groups several actions into one unit of work with a single
+# commit at the end. Use with commit=False on the calls inside:
+#
+#   with datatier.transaction(dbConn):
+#     queryid = datatier.perform_insert(dbConn, sql1, [...], commit=False)
+#     datatier.perform_action_many(dbConn, sql2, rows, commit=False)
+#
+# If anything inside raises, everything is rolled back. Only a
+# failed statement (or commit) keeps the connection out of the
+# pool afterwards.
+#
+@contextmanager
+def transaction(dbConn):
+  """
+  Context manager that commits once on success, or rolls back
+  on error, all the actions performed inside the block
+
+  Parameters
+  __________
+  dbConn : the database connection
+
+  Returns
+  _______
+  the database connection
+  """
+  try:
+    yield dbConn
+
+  except Exception as err:
+    #
+    # a statement that failed inside has marked the connection
+    # already; any other error leaves it usable once rolled back
+    #
+    print("datatier.transaction() failed:")
+    print(str(err))
+    try:
+      dbConn.rollback()
+    except Exception:
+      _mark_failed(dbConn)
+    raise
+
+  try:
+    dbConn.commit()
+
+  except Exception as err:
+    _mark_failed(dbConn)
+    print("datatier.transaction() failed:")
+    print(str(err))
+    raise
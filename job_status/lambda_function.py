@@ -0,0 +1,67 @@
+#
+# Returns the state of an asynchronous job (see jobs.py): queued,
+# running, done or failed, with the status of its query as it
+# progresses, and its result once finished.
+#
+
+import json
+import datatier
+import jobs
+import runtime
+
+
+def lambda_handler(event, context):
+  dbConn = None
+
+  try:
+    print("**STARTING**")
+    print("**lambda: job_status**")
+
+    if "pathParameters" in event and 'jobid' in event["pathParameters"]:
+      jobid = event["pathParameters"]['jobid']
+    else:
+      return {
+        'statusCode': 400,
+        'body': json.dumps({"error": "requires jobid parameter in pathParameters in event"})
+      }
+
+    if not jobid.isdigit():
+      return {
+        'statusCode': 400,
+        'body': json.dumps({"error": "jobid must be an integer"})
+      }
+
+    print("jobid:", jobid)
+
+    #
+    # open connection to the database (config and connection
+    # pool are set up once per container):
+    #
+    dbConn = runtime.get_dbConn()
+
+    job = jobs.get(dbConn, jobid)
+
+    if job is None:
+      return {
+        'statusCode': 400,
+        'body': json.dumps({"error": "no such job " + jobid})
+      }
+
+    print("state:", job["state"], "status:", job["status"])
+
+    return {
+      'statusCode': 200,
+      'body': json.dumps(job)
+    }
+
+  except Exception as err:
+    print("**ERROR**")
+    print(str(err))
+
+    return {
+      'statusCode': 500,
+      'body': json.dumps({"error": str(err)})
+    }
+
+  finally:
+    datatier.release_dbConn(dbConn)
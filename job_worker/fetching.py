@@ -0,0 +1,199 @@
+#
+# fetching.py
+#
+# The fetch stage: searches the Guardian for a query, stores the
+# combined text of the articles found in S3, and records the query
+# and its articles in the database; or, when the same topic was
+# fetched recently, returns that earlier query instead.
+#
+# Used by the fetch_articles lambda (POST /fetch/{query}) and by
+# the pipeline lambda, which passes the combined text it gets
+# back straight on to the summarize stage.
+#
+
+import artifacts
+import datatier
+import guardian
+import htmltext
+import runtime
+
+
+# how long (seconds) a previous fetch of the same topic can be
+# reused, unless overridden by [cache] query_ttl in the config;
+# 0 disables the cache
+DEFAULT_QUERY_TTL = 3600
+
+# between articles in the combined text, so summarize can tell them
+# apart; the extractors keep the paragraph breaks of an article,
+# so its whitespace is collapsed first (see one_line):
+ARTICLE_SEPARATOR = "\n\n"
+
+
+###################################################################
+#
+# normalize_query:
+#
+def normalize_query(query):
+  """
+  Cache key for a query: lowercased, with runs of whitespace
+  collapsed to a single space, e.g. "  Climate  Change" and
+  "climate change" are the same topic
+  """
+  return " ".join(query.lower().split())
+
+
+###################################################################
+#
+# one_line:
+#
+def one_line(text):
+  """
+  Returns an article's text with every run of whitespace
+  (newlines and blank lines included) collapsed to one space
+  """
+  return " ".join(text.split())
+
+
+###################################################################
+#
+# lookup_cached_query:
+#
+def lookup_cached_query(dbConn, normtext, ttl):
+  """
+  Returns (queryid, status, article_headlines, articlecount) of
+  the most recent query for this topic made within the last ttl
+  seconds, or None; articlecount is the number of articles it
+  asked for
+  """
+  sql = """
+  SELECT queryid, status, articlecount FROM queries
+   WHERE normtext = %s AND created >= NOW() - INTERVAL %s SECOND
+   ORDER BY queryid DESC LIMIT 1;
+  """
+  row = datatier.retrieve_one_row(dbConn, sql, [normtext, ttl])
+  if row == ():
+    return None
+
+  queryid, status, articlecount = row
+  sql = "SELECT headline FROM articles WHERE queryid = %s ORDER BY articleid;"
+  rows = datatier.retrieve_all_rows(dbConn, sql, [queryid])
+  return queryid, status, [r[0] for r in rows], articlecount
+
+
+###################################################################
+#
+# fetch:
+#
+def fetch(dbConn, query, params):
+  """
+  Fetches the articles for a query, or reuses a recent fetch of
+  the same topic
+
+  Parameters
+  ----------
+  dbConn : database connection,
+  query : the query text,
+  params : request options (dict), e.g. {"count": "20"}
+
+  Returns
+  -------
+  (statusCode, body, text): the HTTP status and the response body
+  (dict), and the combined article text if it was just fetched
+  (None on a cache hit or an error)
+  """
+  # read once per container:
+  configur = runtime.get_config()
+
+  API_KEY = configur.get('guardian','api_key')
+
+  #
+  # same topic fetched recently? then reuse that query, and
+  # with it the textkey/scriptkey/audiokey it already has.
+  # ?refresh=true skips the lookup and replaces the entry.
+  #
+  refresh = params.get("refresh", "").lower() in ["1", "true", "yes"]
+  query_ttl = configur.getint('cache', 'query_ttl', fallback=DEFAULT_QUERY_TTL)
+  normtext = normalize_query(query)
+
+  #
+  # how many articles: ?count=N, else the config file:
+  #
+  try:
+    count = int(params.get("count", configur.getint('guardian', 'article_count', fallback=guardian.DEFAULT_COUNT)))
+  except ValueError:
+    return 400, {"error": "count must be an integer"}, None
+  count = max(1, min(count, guardian.MAX_COUNT))
+  page_size = configur.getint('guardian', 'page_size', fallback=guardian.DEFAULT_PAGE_SIZE)
+
+  print("count:", count)
+
+  if query_ttl > 0 and not refresh:
+    cached = lookup_cached_query(dbConn, normtext, query_ttl)
+    #
+    # a cached fetch that asked for fewer articles won't do; one
+    # that asked for as many but got fewer has all the Guardian
+    # has on the topic, and does:
+    #
+    if cached is not None and cached[3] < count:
+      cached = None
+    if cached is not None:
+      queryid, status, article_headlines, _ = cached
+      print("cache hit, queryid:", queryid, "status:", status)
+      return 200, {"queryid": queryid, "article_headlines": article_headlines, "status": status, "cache": "hit"}, None
+
+  print("cache miss")
+
+  #
+  # a cache hit needs neither S3 nor an HTML parser, so they
+  # are only loaded (once per container) from here on:
+  #
+  bucket = runtime.get_bucket()
+  text_from_html = htmltext.get_extractor(configur.get('guardian', 'html_extractor', fallback=htmltext.DEFAULT_EXTRACTOR))
+
+  print("Sending api requests to Guardian...")
+  found = guardian.search_articles(API_KEY, query, text_from_html, count=count, page_size=page_size)
+
+  if len(found) == 0:
+    print('No articles found.')
+    return 400, {"error": f'this query {query} generates no Guardian articles'}, None
+
+  print("Combining the contents of", len(found), "articles")
+  articles = [article for article, text in found]
+  combined_article_text = ARTICLE_SEPARATOR.join(one_line(text) for article, text in found)
+
+  bucketkey = artifacts.artifact_key("combinedarticles", combined_article_text, ext=".txt")
+  if artifacts.put_text_if_absent(bucket, bucketkey, combined_article_text):
+    print ("Uploaded txt file with combined articles' text")
+  else:
+    print ("Identical combined text already in S3")
+  #
+  # the query row and all of its article rows go in as one
+  # unit of work with a single commit
+  #
+  article_headlines = [article['fields']['headline'] for article in articles]
+
+  with datatier.transaction(dbConn):
+    #
+    # only the newest query for a topic is a cache entry;
+    # older ones (expired or refreshed) are evicted:
+    #
+    sql = "UPDATE queries SET normtext = '' WHERE normtext = %s;"
+    datatier.perform_action(dbConn, sql, [normtext], commit=False)
+
+    sql = """
+    INSERT INTO queries(querytext, normtext, articlecount, status, textkey)
+              VALUES(%s, %s, %s, %s, %s);
+    """
+    queryid = datatier.perform_insert(dbConn, sql, [query, normtext, count, 'gathered articles', bucketkey], commit=False)
+    print("queryid:", queryid)
+
+    sql = """
+    INSERT INTO articles(url, headline, querytext, queryid)
+              VALUES(%s, %s, %s, %s);
+    """
+    rows = [[article['id'], article['fields']['headline'], query, queryid] for article in articles]
+    datatier.perform_action_many(dbConn, sql, rows, commit=False)
+
+  print("Inserted query and", len(rows), "articles into database")
+
+  return 200, {"queryid": queryid, "article_headlines": article_headlines, "cache": "miss"}, combined_article_text
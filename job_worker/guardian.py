@@ -0,0 +1,148 @@
+#
+# guardian.py
+#
+# Searches the Guardian content API and extracts the text of the
+# articles found.
+#
+# Results come back in pages of page_size articles, so getting
+# count articles takes ceil(count / page_size) requests. All the
+# pages are requested at once over a pooled HTTP session (pages
+# past the last one just come back empty), and as each page
+# arrives, in order, the text of its articles is extracted while
+# the later pages are still in flight.
+#
+
+import math
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+SEARCH_ENDPOINT = "https://content.guardianapis.com/search"
+
+# only the fields we use, the rest just make the response bigger:
+SHOW_FIELDS = "body,headline"
+
+DEFAULT_COUNT = 5
+DEFAULT_PAGE_SIZE = 10
+MAX_COUNT = 200
+MAX_PAGE_SIZE = 50
+MAX_WORKERS = 8
+
+_session = None
+
+
+###################################################################
+#
+# get_session:
+#
+# One requests.Session per container, so warm invocations reuse
+# the TCP/TLS connections to the API; the connection pool is big
+# enough for all the concurrent page requests. requests is
+# imported here, so a cache hit in the lambda never loads it.
+#
+def get_session():
+  global _session
+
+  if _session is None:
+    import requests
+    import requests.adapters
+
+    _session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS)
+    _session.mount("https://", adapter)
+    _session.mount("http://", adapter)
+
+  return _session
+
+
+###################################################################
+#
+# search_page:
+#
+def search_page(api_key, query, page, page_size, endpoint=SEARCH_ENDPOINT):
+  """
+  Retrieves one page of search results from the Guardian API
+
+  Parameters
+  ----------
+  api_key : Guardian API key,
+  query : search terms,
+  page : page # (1-based),
+  page_size : # of results per page,
+  endpoint : search endpoint URL
+
+  Returns
+  -------
+  list of results (dicts), [] if page is past the last page
+  """
+  params = {
+    "q": query,
+    "show-fields": SHOW_FIELDS,
+    "page": page,
+    "page-size": page_size,
+    "api-key": api_key,
+  }
+
+  response = get_session().get(endpoint, params=params, timeout=30)
+
+  # asking for a page past the end is a 400, not an error for us:
+  if page > 1 and response.status_code == 400:
+    return []
+
+  response.raise_for_status()
+  data = response.json()
+
+  return data.get("response", {}).get("results", [])
+
+
+###################################################################
+#
+# search_articles:
+#
+def search_articles(api_key, query, extractor, count=DEFAULT_COUNT, page_size=DEFAULT_PAGE_SIZE,
+                    max_workers=MAX_WORKERS, endpoint=SEARCH_ENDPOINT):
+  """
+  Searches for up to count articles and extracts their text,
+  fetching the result pages concurrently
+
+  Parameters
+  ----------
+  api_key : Guardian API key,
+  query : search terms,
+  extractor : function from HTML body to text (see htmltext.py),
+  count : max # of articles to return,
+  page_size : # of results per API request,
+  max_workers : max # of concurrent requests/extractions,
+  endpoint : search endpoint URL
+
+  Returns
+  -------
+  list of (article, text) pairs in search order, where article
+  is the result dict from the API; [] if nothing was found
+  """
+  count = max(1, min(count, MAX_COUNT))
+  page_size = max(1, min(page_size, MAX_PAGE_SIZE, count))
+  npages = math.ceil(count / page_size)
+
+  with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+    page_futures = [pool.submit(search_page, api_key, query, page, page_size, endpoint)
+                    for page in range(1, npages + 1)]
+
+    articles = []
+    text_futures = []
+
+    for future in page_futures:
+      for article in future.result():
+        if len(articles) == count:
+          break
+        body = article.get("fields", {}).get("body", "")
+        articles.append(article)
+        text_futures.append(pool.submit(extractor, body))
+
+      if len(articles) == count:
+        break
+
+    for future in page_futures:
+      future.cancel()
+
+    return [(article, future.result()) for article, future in zip(articles, text_futures)]
@@ -0,0 +1,93 @@
+import json
+import datatier
+import fetching
+import jobs
+import pipelining
+import podcasting
+import runtime
+import summarizing
+
+"""
+Runs the asynchronous jobs queued by POST /fetch, /summarize, /podcast
+and /pipeline with ?async=true (see jobs.py). Triggered by the SQS
+queue, one message per job; the result is stored in the jobs table
+for GET /jobs/{jobid}.
+"""
+
+
+def run_job(dbConn, job):
+    #
+    # runs the job's stage, as the synchronous endpoint would;
+    # returns (statusCode, body)
+    #
+    kind = job["kind"]
+    target = job["target"]
+    params = job["params"]
+
+    if kind == "fetch":
+        statusCode, body, _ = fetching.fetch(dbConn, target, params)
+        return statusCode, body
+    if kind == "summarize":
+        return summarizing.summarize(dbConn, target, params)
+    if kind == "podcast":
+        return podcasting.generate(dbConn, target, params)
+    if kind == "pipeline":
+        # so GET /jobs shows the query's status from the start:
+        on_queryid = lambda queryid: jobs.set_queryid(dbConn, job["jobid"], queryid)
+        return pipelining.run(dbConn, target, params, on_queryid)
+
+    return 400, {"error": "unknown job kind: " + kind}
+
+
+def lambda_handler(event, context):
+    dbConn = None
+
+    try:
+        dbConn = runtime.get_dbConn()
+
+        for record in event["Records"]:
+            jobid = json.loads(record["body"])["jobid"]
+            print("jobid:", jobid)
+
+            #
+            # a message can be delivered more than once: only
+            # the delivery that claims the job runs it
+            #
+            job = jobs.claim(dbConn, jobid)
+            if job is None:
+                print("Job already claimed or finished, skipping")
+                continue
+
+            print("kind:", job["kind"], "target:", job["target"])
+            try:
+                statusCode, body = run_job(dbConn, job)
+            except Exception as e:
+                statusCode, body = 500, {"error": str(e)}
+
+            if statusCode == 409:
+                #
+                # another request is working on the query: the
+                # job is not over, run it again once that is done
+                #
+                print("Query busy in another request, requeueing job")
+                jobs.requeue(dbConn, jobid)
+                continue
+
+            print("Job finished with status", statusCode)
+            jobs.finish(dbConn, jobid, statusCode, body)
+
+        return {
+            'statusCode': 200,
+            'body': json.dumps("success")
+        }
+
+    except Exception as e:
+        #
+        # e.g. no database: failing the batch makes SQS deliver
+        # the messages again later
+        #
+        print("**ERROR:", str(e))
+        raise
+
+    finally:
+        datatier.release_dbConn(dbConn)
@@ -0,0 +1,149 @@
+#
+# partials.py
+#
+# While a script is being streamed from Bedrock (see generation.py),
+# the text generated so far is kept in S3 under
+# partials/<queryid>.txt, so a client can poll it with
+# GET /summarize/{queryid} and show the script as it is written,
+# instead of waiting for the whole generation.
+#
+# The object is rewritten at most every interval seconds (plus
+# once right away, for the first piece of text, and once at the
+# end), so a long script costs a handful of PUTs rather than one
+# per token. The writes run on a background thread, so reading
+# the stream never waits for S3. It is stored uncompressed: it is
+# small, short-lived and rewritten often.
+#
+# The partial is deleted when a request takes on the generation
+# and when it gives it up (failed), so a poll never shows the
+# text of an earlier, abandoned attempt. Partial objects are not
+# needed once the script is done (the final script is under
+# summaries/); an S3 lifecycle rule on the partials/ prefix can
+# expire them.
+#
+
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import artifacts
+
+
+PARTIAL_PREFIX = "partials"
+
+DEFAULT_INTERVAL = 0.5  # seconds
+
+
+###################################################################
+#
+# partial_key:
+#
+def partial_key(queryid):
+  """
+  Returns the S3 key of the partial script for a query
+  """
+  return PARTIAL_PREFIX + "/" + str(queryid) + ".txt"
+
+
+###################################################################
+#
+# read_partial:
+#
+def read_partial(bucket, key):
+  """
+  Downloads the partial script
+
+  Returns
+  -------
+  the text generated so far, "" if nothing has been written yet
+  """
+  from botocore.exceptions import ClientError
+
+  try:
+    return artifacts.get_text(bucket, key)
+
+  except ClientError as err:
+    if err.response.get("Error", {}).get("Code") in ["404", "NoSuchKey", "NotFound"]:
+      return ""
+    raise
+
+
+###################################################################
+#
+# delete_partial:
+#
+def delete_partial(bucket, key):
+  """
+  Deletes the partial script, if any. Best effort: an error is
+  printed, not raised (a poll would show stale text, the script
+  is not affected)
+  """
+  try:
+    bucket.meta.client.delete_object(Bucket=bucket.name, Key=key)
+  except Exception as err:
+    print("partials.delete_partial() failed:", str(err))
+
+
+###################################################################
+#
+# PartialScript
+#
+# Collects the pieces of a streamed script and writes the text so
+# far to S3, at most every interval seconds, one write at a time
+# in the background. Pass append as the on_text callback, and call
+# flush at the end: it waits for the last write. If the generation
+# fails, call abort instead: it waits for the write in progress
+# (so it cannot land after the partial is deleted) and writes
+# nothing more.
+#
+class PartialScript:
+
+  def __init__(self, bucket, key, interval=DEFAULT_INTERVAL):
+    self.bucket = bucket
+    self.key = key
+    self.interval = interval
+    self.pieces = []
+    self.writes = 0
+    self._last_write = None
+    self._written = 0  # of pieces
+    self._pending = None
+    self._writer = ThreadPoolExecutor(max_workers=1)
+
+  def _write(self, npieces):
+    artifacts.put_text(self.bucket, self.key, "".join(self.pieces[:npieces]), compress=False)
+    self.writes += 1
+
+  def append(self, text):
+    self.pieces.append(text)
+
+    if self._pending is not None and not self._pending.done():
+      return  # still writing, the next write will include this
+
+    now = time.monotonic()
+    if self._last_write is None or now - self._last_write >= self.interval:
+      if self._pending is not None:
+        self._pending.result()  # raise a failed write here
+      self._last_write = now
+      self._written = len(self.pieces)
+      self._pending = self._writer.submit(self._write, self._written)
+
+  def flush(self):
+    if self._pending is not None:
+      self._pending.result()
+      self._pending = None
+
+    if self._written < len(self.pieces) or self.writes == 0:
+      self._written = len(self.pieces)
+      self._write(self._written)
+
+    self._writer.shutdown()
+
+  def abort(self):
+    if self._pending is not None:
+      try:
+        self._pending.result()
+      except Exception:
+        pass
+      self._pending = None
+
+    self._writer.shutdown()
@@ -0,0 +1,133 @@
+#
+# resultcache.py
+#
+# Cache of expensive generated results (podcast scripts from
+# Bedrock, ...) shared by all queries. An entry maps a hash of
+# everything that determines the result (model, prompt, input
+# text, sampling parameters, ...) to the S3 key of the artifact
+# holding the result, so a repeat of the same generation is
+# answered from S3 instead of calling the model again.
+#
+# Entries live in the resultcache table (see database.sql), and
+# are evicted when older than a TTL, or least-recently-used
+# first when a kind of entry grows past a maximum count.
+# Eviction bounds the table, not the bucket: only the row is
+# deleted, never the artifact, which queries may still point to
+# (queries.scriptkey).
+#
+# Audio is not cached here: its S3 key is already a hash of
+# everything that determines it (see podcasting.py), so whether
+# it exists is a HEAD request away.
+#
+
+import hashlib
+import json
+
+import datatier
+
+
+###################################################################
+#
+# make_key:
+#
+def make_key(inputs):
+  """
+  Returns the cache key (hex SHA-256) for a dict of the inputs
+  that determine a result
+
+  Parameters
+  ----------
+  inputs : dict of JSON-serializable values
+
+  Returns
+  -------
+  cache key (string of 64 hex digits)
+  """
+  data = json.dumps(inputs, sort_keys=True, separators=(",", ":"))
+  return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+###################################################################
+#
+# lookup:
+#
+def lookup(dbConn, kind, cachekey, ttl):
+  """
+  Looks up a cached result, and on a hit records the use (for
+  LRU eviction)
+
+  Parameters
+  ----------
+  dbConn : database connection,
+  kind : kind of result, e.g. 'script',
+  cachekey : key from make_key,
+  ttl : max age of a usable entry, in seconds
+
+  Returns
+  -------
+  (artifactkey, latency_ms) on a hit, where latency_ms is how
+  long the result originally took to produce; None on a miss
+  """
+  sql = """
+  SELECT artifactkey, latency_ms FROM resultcache
+   WHERE cachekey = %s AND kind = %s AND created >= NOW() - INTERVAL %s SECOND;
+  """
+  row = datatier.retrieve_one_row(dbConn, sql, [cachekey, kind, ttl])
+
+  if row == ():
+    return None
+
+  sql = "UPDATE resultcache SET hits = hits + 1, lastused = NOW() WHERE cachekey = %s;"
+  datatier.perform_action(dbConn, sql, [cachekey])
+
+  return row[0], row[1]
+
+
+###################################################################
+#
+# store:
+#
+def store(dbConn, kind, cachekey, artifactkey, latency_ms, ttl, max_entries):
+  """
+  Adds (or refreshes) a cache entry, then evicts entries of the
+  same kind that are expired, or the least recently used ones
+  beyond max_entries
+
+  Parameters
+  ----------
+  dbConn : database connection,
+  kind : kind of result, e.g. 'script',
+  cachekey : key from make_key,
+  artifactkey : S3 key of the result,
+  latency_ms : how long producing the result took,
+  ttl : max age of an entry, in seconds,
+  max_entries : max # of entries of this kind
+
+  Returns
+  -------
+  nothing
+  """
+  with datatier.transaction(dbConn):
+    sql = """
+    INSERT INTO resultcache(cachekey, kind, artifactkey, latency_ms)
+                VALUES(%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE artifactkey = VALUES(artifactkey), latency_ms = VALUES(latency_ms),
+                            created = NOW(), lastused = NOW();
+    """
+    datatier.perform_action(dbConn, sql, [cachekey, kind, artifactkey, latency_ms], commit=False)
+
+    sql = "DELETE FROM resultcache WHERE kind = %s AND created < NOW() - INTERVAL %s SECOND;"
+    datatier.perform_action(dbConn, sql, [kind, ttl], commit=False)
+
+    #
+    # LRU: drop everything used less recently than the
+    # max_entries-th most recently used entry (MySQL needs the
+    # extra derived table to delete from the table it selects):
+    #
+    sql = """
+    DELETE FROM resultcache WHERE kind = %s AND lastused <
+      (SELECT lastused FROM
+        (SELECT lastused FROM resultcache WHERE kind = %s
+          ORDER BY lastused DESC LIMIT 1 OFFSET %s) AS newest);
+    """
+    datatier.perform_action(dbConn, sql, [kind, kind, max_entries - 1], commit=False)
@@ -10,6 +10,8 @@ import sys
 import os
 import base64
 import time
+import threading
+import random
 
 from configparser import ConfigParser
 
@@ -96,6 +98,60 @@ def web_service_get(url):
     logging.error(e)
     return None
 
+############################################################
+#
+# iter_rows
+#
+def iter_rows(baseurl, api, limit=100):
+  """
+  Generator over all the rows of a paged GET endpoint (e.g.
+  /queries), following the "next" cursor in each response and
+  only requesting the next page once the caller has consumed
+  the current one.
+
+  Parameters
+  ----------
+  baseurl: baseurl for web service
+  api: the endpoint, e.g. '/queries'
+  limit: # of rows to request per page
+
+  Returns
+  -------
+  generator of rows (lists); raises an exception if a page
+  cannot be retrieved
+  """
+  after = None
+
+  while True:
+    url = f"{baseurl}{api}?limit={limit}"
+    if after is not None:
+      url += f"&after={after}"
+
+    res = web_service_get(url)
+
+    if res is None:
+      raise Exception("no response from " + url)
+
+    if res.status_code != 200:
+      # failed:
+      print("Failed with status code:", res.status_code)
+      print("url: " + url)
+      if res.status_code == 500:
+        # we'll have an error message
+        body = res.json()
+        print("Error message:", body)
+      #
+      raise Exception("status code " + str(res.status_code))
+
+    body = res.json()
+
+    for row in body["rows"]:
+      yield row
+
+    after = body.get("next")
+    if after is None:
+      return
+
 ############################################################
 #
 # prompt
@@ -147,19 +203,34 @@ def prompt():
 #
 def make_post_request(url, json_data={}):
     """
-    Helper function to make a POST request and return the response
+    Helper function to make a POST request and return the response.
+    Like web_service_get, tries at most 3 times; every attempt sends
+    the same Idempotency-Key header, so if an earlier attempt did
+    reach the server, the retry gets its response instead of the
+    work (a new query, a new script, ...) being done again.
     """
-    try:
-        res = requests.post(url, json=json_data)
-        if res is None:
-            print("**ERROR: No response from server.")
-            return None
-        
+    key = str(uuid.uuid4())
+    retries = 0
+
+    while True:
+        try:
+            res = requests.post(url, json=json_data, headers={"Idempotency-Key": key})
+            if res.status_code in [200, 202, 400, 409, 422, 480, 481, 482, 500]:
+                return res
+            failure = f"status code {res.status_code}"
+        except Exception as e:
+            res = None
+            failure = str(e)
+
+        # failed, try again?
+        retries = retries + 1
+        if retries < 3:
+            time.sleep(retries)
+            continue
+
+        # tried 3 times, we give up:
+        logging.error(f"**ERROR: Request failed: {failure}")
         return res
-    
-    except Exception as e:
-        logging.error(f"**ERROR: Request failed: {str(e)}")
-        return None
 
 def validate_query(query):
     """
@@ -199,48 +270,18 @@ def list_queries(baseurl):
   try:
     print(">> Here are all of the queries that were made:")
     #
-    # call the web service:
+    # page through the web service, mapping each row into a
+    # Query object as it arrives:
     #
     api = '/queries'
     url = baseurl + api
 
-    # res = requests.get(url)
-    res = web_service_get(url)
+    queries = (Query(row) for row in iter_rows(baseurl, api))
 
-    #
-    # let's look at what we got back:
-    #
-    if res.status_code == 200: #success
-      pass
-    else:
-      # failed:
-      print("Failed with status code:", res.status_code)
-      print("url: " + url)
-      if res.status_code == 500:
-        # we'll have an error message
-        body = res.json()
-        print("Error message:", body)
-      #
-      return
-
-    #
-    # deserialize and extract list_queries:
-    #
-    body = res.json()
-
-    #
-    # let's map each row into a Query object:
-    #
-    queries = []
-    for row in body:
-      query = Query(row)
-      queries.append(query)
     #
     # Now we can think OOP:
     #
-    if len(queries) == 0:
-      print("no queries...")
-      return
+    count = 0
 
     for query in queries:
       print(query.queryid)
@@ -249,6 +290,10 @@ def list_queries(baseurl):
       print("\tBucket key: ", query.textkey)
       print("\tScript key: ", query.scriptkey)
       print("\tAudio key:", query.audiokey)
+      count += 1
+
+    if count == 0:
+      print("no queries...")
     #
     return
 
@@ -351,52 +396,27 @@ def list_articles(baseurl):
   try:
     print(">> Articles that were fetched to generate podcasts 📰:")
     #
-    # call the web service:
+    # page through the web service, mapping each row into an
+    # Article object as it arrives:
     #
     api = '/articles'
     url = baseurl + api
 
-    # res = requests.get(url)
-    res = web_service_get(url)
+    articles = (Article(row) for row in iter_rows(baseurl, api))
 
-    #
-    # let's look at what we got back:
-    #
-    if res.status_code == 200: #success
-      pass
-    else:
-      # failed:
-      print("Failed with status code:", res.status_code)
-      print("url: " + url)
-      if res.status_code == 500:
-        # we'll have an error message
-        body = res.json()
-        print("Error message:", body)
-      #
-      return
-
-    #
-    # deserialize and extract list_articles:
-    #
-    body = res.json()
-    #
-    # let's map each row into a article object:
-    #
-    articles = []
-    for row in body:
-      article = Article(row)
-      articles.append(article)
     #
     # Now we can think OOP:
     #
-    if len(articles) == 0:
-      print("no articles...")
-      return
+    count = 0
 
     for article in articles:
       print(article.articleid)
       print("\tTitle: ", article.headline)
       print("\tURL: ", article.url)
+      count += 1
+
+    if count == 0:
+      print("no articles...")
     #
     return
 
@@ -493,8 +513,11 @@ def fetch_articles(baseurl):
     res = make_post_request(url)
 
     if res and res.status_code == 200:
-        print("Articles successfully fetched")
         data = res.json()
+        if data.get("cache") == "hit":
+          print("Articles for this topic were fetched recently, reusing them")
+        else:
+          print("Articles successfully fetched")
         queryid = data.get("queryid")
         print("Your query id:", queryid, "\n")
         article_headlines = data.get("article_headlines")
@@ -512,6 +535,146 @@ def fetch_articles(baseurl):
     logging.error(e)
     return
 
+############################################################
+#
+# stream_script
+#
+def stream_script(baseurl, queryid, interval=1):
+  """
+  Generates the script with streaming (POST ?stream=true) and,
+  while that request runs, polls GET /summarize/{queryid} every
+  interval seconds, printing the script as it is written.
+
+  Parameters
+  ----------
+  baseurl: base URL for the web service
+  queryid: the query to summarize
+  interval: seconds between polls
+
+  Returns
+  -------
+  response to the POST request (None if it failed)
+  """
+  url = f"{baseurl}/summarize/{queryid}"
+  result = {}
+
+  def post():
+    result["res"] = make_post_request(url + "?stream=true")
+
+  start = time.time()
+  worker = threading.Thread(target=post)
+  worker.start()
+
+  shown = 0
+  while worker.is_alive():
+    worker.join(interval)
+
+    res = web_service_get(url)
+    if res is None or res.status_code != 200:
+      continue
+
+    script = res.json().get("script") or ""
+    if shown == 0 and script:
+      print(f"(first words after {time.time() - start:.1f} seconds)\n")
+    print(script[shown:], end="", flush=True)
+    shown = max(shown, len(script))
+
+  res = result.get("res")
+
+  #
+  # 409: another request was already generating this script, and
+  # it is still at it; follow that one's script instead
+  #
+  if res is not None and res.status_code == 409:
+    print("(another request is generating this script, following it)")
+    while True:
+      time.sleep(interval)
+      res = web_service_get(url)
+      if res is None or res.status_code != 200:
+        break
+
+      script = res.json().get("script") or ""
+      if res.json().get("done"):
+        break
+      print(script[shown:], end="", flush=True)
+      shown = max(shown, len(script))
+
+  # whatever the last poll missed:
+  if res is not None and res.status_code == 200:
+    script = res.json().get("script") or ""
+    print(script[shown:])
+
+  return res
+
+
+############################################################
+#
+# run_job
+#
+# Long requests (Bedrock, Polly) run as asynchronous jobs: the
+# POST returns 202 with a job id at once, and we poll the job
+# instead of holding the connection open. The delay between
+# polls doubles up to max_delay, and each is randomized (between
+# half and all of it), so many clients waiting at once do not
+# poll in lockstep.
+#
+def run_job(baseurl, url, first_delay=0.5, max_delay=4, timeout=900):
+  """
+  Submits a POST request as a job (?async=true) and polls
+  GET /jobs/{jobid} with exponential backoff and jitter until it
+  is done, printing the query's status as it changes.
+
+  Parameters
+  ----------
+  baseurl: base URL for the web service
+  url: the POST request's URL
+  first_delay: seconds before the first poll
+  max_delay: most seconds between polls
+  timeout: seconds to wait for the job
+
+  Returns
+  -------
+  (status code, body) of the request, as if it had been made
+  synchronously; (None, None) if there was no answer
+  """
+  res = make_post_request(url + "?async=true")
+  if res is None:
+    return None, None
+
+  if res.status_code != 202:
+    # rejected (or answered) right away:
+    return res.status_code, res.json()
+
+  jobid = res.json()["jobid"]
+  print(f"Job {jobid} queued, waiting for it...")
+
+  start = time.time()
+  delay = first_delay
+  last = None
+
+  while time.time() - start < timeout:
+    time.sleep(random.uniform(delay / 2, delay))
+    delay = min(max_delay, delay * 2)
+
+    res = web_service_get(f"{baseurl}/jobs/{jobid}")
+    if res is None:
+      continue
+    if res.status_code != 200:
+      return res.status_code, res.json()
+
+    job = res.json()
+    progress = job.get("status") or job.get("state")
+    if progress != last:
+      print(f"  ({time.time() - start:.0f} s) {progress}")
+      last = progress
+
+    if job["state"] in ["done", "failed"]:
+      return job["statusCode"], job["result"]
+
+  print(f"**ERROR: job {jobid} did not finish within {timeout} seconds")
+  return None, None
+
+
 ############################################################
 #
 # summarize
@@ -534,23 +697,29 @@ def summarize(baseurl):
     if not validate_queryid(queryid):
       return
 
+    live = input("Show the script as it is generated? (y/n)") == "y"
+
     print(f"Generating podcast script for query ID: {queryid}\n(This may take a few seconds...)")
     url = f"{baseurl}/summarize/{queryid}"
     
     # make request and return response
-    res = make_post_request(url)
+    if live:
+      res = stream_script(baseurl, queryid)
+      status, data = (res.status_code, res.json()) if res is not None else (None, None)
+    else:
+      status, data = run_job(baseurl, url)
 
-    if res and res.status_code == 200:
+    if status == 200:
         print("Summary successfully generated")
-        data = res.json()
         script = data.get("script")
-        answer = input("Do you want to read the generated script? (y/n)")
-        if answer == "y":
-          print (script)
+        if not live:
+          answer = input("Do you want to read the generated script? (y/n)")
+          if answer == "y":
+            print (script)
     else:
-        print(f"**ERROR: Failed with status code {res.status_code}\nURL: {url}")
-        if res.status_code == 500:
-            print("Error message:", res.json())
+        print(f"**ERROR: Failed with status code {status}\nURL: {url}")
+        if status in [409, 500]:
+            print("Error message:", data)
 
   except Exception as e:
     logging.error("**ERROR: summarize() failed:")
@@ -559,6 +728,60 @@ def summarize(baseurl):
     return
 
 
+############################################################
+#
+# save_audio
+#
+def save_audio(data, filename, chunk_size=64 * 1024):
+  """
+  Saves the audio from a /podcast response to a file: decodes
+  it if it was sent inline (small files), else downloads it from
+  the presigned URL a chunk at a time, so the whole file is never
+  held in memory.
+
+  Parameters
+  ----------
+  data: the response body (dict)
+  filename: where to save the audio
+  chunk_size: bytes per chunk when downloading
+
+  Returns
+  -------
+  True if saved, False if not
+  """
+  if not data.get("audiokey"):
+    print("**ERROR: Missing audio data in response.")
+    return False
+
+  if data.get("audiodata"):
+    with open(filename, "wb") as audio_file:
+      audio_file.write(base64.b64decode(data["audiodata"]))
+    return True
+
+  url = data.get("audiourl")
+  if not url:
+    print("**ERROR: Missing audio data in response.")
+    return False
+
+  with requests.get(url, stream=True, timeout=60) as res:
+    if res.status_code != 200:
+      print(f"**ERROR: audio download failed with status code {res.status_code}")
+      return False
+
+    written = 0
+    with open(filename, "wb") as audio_file:
+      for chunk in res.iter_content(chunk_size=chunk_size):
+        audio_file.write(chunk)
+        written += len(chunk)
+
+  expected = data.get("contentlength")
+  if expected is not None and written != expected:
+    print(f"**ERROR: downloaded {written} bytes, expected {expected}")
+    return False
+
+  return True
+
+
 ############################################################
 #
 # generate_podcast
@@ -576,22 +799,17 @@ def generate_podcast(baseurl):
     
     print(f"Generating podcast for query ID: {queryid}\n(This may take a few seconds...)")
     url = f"{baseurl}/podcast/{queryid}"
-    res = make_post_request(url)
+    status, data = run_job(baseurl, url)
 
-    if res and res.status_code == 200:
-        data = res.json()
-        audiokey = data.get("audiokey")
-        audiodata = data.get("audiodata")
+    if status == 200:
         filename = data.get("querytext") + ".mp3"
 
-        if not audiokey or not audiodata:
-            print("**ERROR: Missing audio data in response.")
+        if not save_audio(data, filename):
             return
         
-        with open(filename, "wb") as audio_file:
-            audio_file.write(base64.b64decode(audiodata))
-        
         print(f"Podcast generated and downloaded successfully as {filename}")
+    elif status == 409:
+        print("The podcast is being generated by another request, try again later")
     else:
         print("no audio found...")
 
@@ -605,6 +823,10 @@ def generate_podcast(baseurl):
 #
 # fetch_and_generate
 #
+# One POST /pipeline/{query}: the server fetches, summarizes and
+# synthesizes in a single job, instead of the client calling
+# /fetch, /summarize and /podcast one after the other.
+#
 def fetch_and_generate(baseurl):
   
   try:
@@ -613,51 +835,29 @@ def fetch_and_generate(baseurl):
     if not validate_query(query):
         return
 
-    print(f"Fetching articles for query: {query}\n(This may take a few seconds...)\n")
-    url = f"{baseurl}/fetch/{query}"
+    print(f"Fetching articles, generating the script and the podcast for query: {query}\n(This may take a while...)\n")
+    url = f"{baseurl}/pipeline/{query}"
     
-    res = make_post_request(url)
-    if not res or res.status_code != 200:
-        print(f"Failed with status code: {res.status_code}\nURL: {url}")
-        if res.status_code == 500:
-            print("Error message:", res.json())
+    status, data = run_job(baseurl, url)
+    if status is None:
         return
-
-    body = res.json()
-    queryid = body.get("queryid")
-    print(f"Generating podcast script for query ID: {queryid}\n(This may take a few seconds...)\n")
-
-    # Summarize
-    url = f"{baseurl}/summarize/{queryid}"
-    res = make_post_request(url)
-    if not res or res.status_code != 200:
-        print(f"**ERROR: Failed with status code {res.status_code}\nURL: {url}")
-        if res.status_code == 500:
-            print("Error message:", res.json())
+    if status != 200:
+        print(f"**ERROR: Failed with status code {status}\nURL: {url}")
+        if data.get("stage"):
+            # the earlier stages are saved, retrying resumes from here:
+            print(f"Failed at the {data['stage']} stage, query ID: {data.get('queryid')}")
+        print("Error message:", data.get("error"))
         return
 
-    print("Summary successfully generated :)")
+    print(f"Query ID: {data.get('queryid')}")
+    for stage, info in data.get("stages", {}).items():
+        print(f"  {stage}: {info.get('ms')} ms ({info.get('cache')})")
 
-    # Generate Podcast
-    print(f"Generating podcast for query ID: {queryid}\n(This may take a few seconds...)\n")
-    url = f"{baseurl}/podcast/{queryid}"
-    res = make_post_request(url)
-    if not res or res.status_code != 200:
-        print("No audio found...")
-        return
-    
-    data = res.json()
-    audiokey = data.get("audiokey")
-    audiodata = data.get("audiodata")
     filename = data.get("querytext") + ".mp3"
 
-    if not audiokey or not audiodata:
-        print("**ERROR: Missing audio data in response.")
+    if not save_audio(data, filename):
         return
 
-    with open(filename, "wb") as audio_file:
-        audio_file.write(base64.b64decode(audiodata))
-
     print(f"Podcast generated and downloaded successfully as {filename}")
 
   except Exception as e:
@@ -0,0 +1,53 @@
+#
+# metrics.py
+#
+# Writes metrics to the Lambda log in CloudWatch Embedded Metric
+# Format (EMF): CloudWatch turns each such log line into metric
+# data points, no API calls or extra permissions needed.
+#
+
+import json
+import time
+
+
+NAMESPACE = "PodcastGenerator"
+
+
+###################################################################
+#
+# emit:
+#
+def emit(function, metrics, properties={}):
+  """
+  Logs a set of metric values for one invocation
+
+  Parameters
+  ----------
+  function : name of the lambda, used as the metric dimension,
+  metrics : dict of metric name => (value, unit), where unit is
+            a CloudWatch unit, e.g. "Count" or "Milliseconds",
+  properties : optional dict of extra values to log alongside
+               (searchable in Logs Insights, not metrics)
+
+  Returns
+  -------
+  nothing
+  """
+  record = {
+    "_aws": {
+      "Timestamp": int(time.time() * 1000),
+      "CloudWatchMetrics": [{
+        "Namespace": NAMESPACE,
+        "Dimensions": [["Function"]],
+        "Metrics": [{"Name": name, "Unit": unit} for name, (value, unit) in metrics.items()],
+      }],
+    },
+    "Function": function,
+  }
+
+  for name, (value, unit) in metrics.items():
+    record[name] = value
+
+  record.update(properties)
+
+  print(json.dumps(record))
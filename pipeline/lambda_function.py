@@ -0,0 +1,56 @@
+import json
+import datatier
+import idempotency
+import jobs
+import pipelining
+import runtime
+
+"""
+Fetches the articles for a query, summarizes them into a script and
+synthesizes the podcast, all in one invocation (see pipelining.py).
+"""
+
+
+def lambda_handler(event, context):
+    dbConn = None
+
+    try:
+        dbConn = runtime.get_dbConn()
+
+        if "pathParameters" in event and 'query' in event["pathParameters"]:
+            query = event["pathParameters"]['query']
+        else:
+            return {
+            'statusCode': 400,
+            'body': json.dumps({"error": "requires query parameter in pathParameters in event"})
+            }
+
+        print("query:", query)
+
+        # options for all the stages (count, mode, delivery, ...):
+        params = event.get("queryStringParameters") or {}
+
+        def handle():
+            # ?async=true: queue it, answer 202 with the job id
+            if jobs.wants_async(params):
+                return 202, jobs.submit(dbConn, "pipeline", query, params)
+
+            return pipelining.run(dbConn, query, params)
+
+        # a retry with the same Idempotency-Key header gets the
+        # first response, without the work being done again:
+        statusCode, body = idempotency.once(dbConn, event, ["pipeline", query, params], handle)
+
+        return {
+            'statusCode': statusCode,
+            'body': json.dumps(body)
+        }
+
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'body': json.dumps({"error": str(e)})
+        }
+
+    finally:
+        datatier.release_dbConn(dbConn)
@@ -0,0 +1,106 @@
+#
+# pipelining.py
+#
+# The whole pipeline for a query: fetch, summarize and podcast,
+# one stage after the other in one invocation, over one database
+# connection. The article text and the script are passed from
+# stage to stage in memory, instead of being read back from S3 by
+# the next stage. Every stage still stores its artifact and status
+# as the separate endpoints do, so a failed run can be resumed
+# from the stage that failed.
+#
+# Used by the pipeline lambda (POST /pipeline/{query}) and by the
+# job worker, for pipeline jobs.
+#
+
+import time
+
+import fetching
+import podcasting
+import summarizing
+
+
+###################################################################
+#
+# run:
+#
+def run(dbConn, query, params, on_queryid=None):
+  """
+  Runs the fetch, summarize and podcast stages for a query
+
+  Parameters
+  ----------
+  dbConn : database connection,
+  query : the query text,
+  params : request options for all the stages (dict), e.g.
+           {"count": "20", "delivery": "auto"},
+  on_queryid : optional function called with the queryid as
+               soon as the fetch stage has one
+
+  Returns
+  -------
+  (statusCode, body): the HTTP status and the response body
+  (dict); on success the podcast stage's body plus queryid,
+  article_headlines, scriptkey, script and stages (time and
+  cache result of each), else the failed stage's error body
+  plus stage, queryid and stages
+  """
+  stages = {}
+
+  def failed(stage, statusCode, body, queryid=None):
+    print("stage", stage, "failed:", body)
+    return statusCode, {**body, "stage": stage, "queryid": queryid, "stages": stages}
+
+  #
+  # fetch: the combined text comes back too, unless the query
+  # was a cache hit (summarize then reads it from S3 if it
+  # still needs it)
+  #
+  start = time.perf_counter()
+  statusCode, fetched, article_text = fetching.fetch(dbConn, query, params)
+  if statusCode != 200:
+    return failed("fetch", statusCode, fetched)
+  stages["fetch"] = {"cache": fetched["cache"], "ms": int(1000 * (time.perf_counter() - start))}
+
+  queryid = fetched["queryid"]
+  print("queryid:", queryid)
+
+  #
+  # a query reused from the fetch cache may be further along
+  # (status "generated script", "generated audio", ...): the
+  # stages it has passed only return what they stored
+  #
+  status = fetched.get("status", "gathered articles")
+  print("status:", status)
+
+  if on_queryid is not None:
+    on_queryid(queryid)
+
+  #
+  # summarize: the script comes back in the response
+  #
+  start = time.perf_counter()
+  statusCode, summary = summarizing.summarize(dbConn, queryid, params, article_text=article_text)
+  if statusCode != 200:
+    return failed("summarize", statusCode, summary, queryid)
+  stages["summarize"] = {"cache": summary.get("cache", "done"), "ms": int(1000 * (time.perf_counter() - start))}
+
+  #
+  # podcast: its response (audiourl, ...) is the pipeline's
+  #
+  start = time.perf_counter()
+  statusCode, podcast = podcasting.generate(dbConn, queryid, params, script_text=summary["script"])
+  if statusCode != 200:
+    return failed("podcast", statusCode, podcast, queryid)
+  stages["podcast"] = {"cache": podcast.pop("cache", "done"), "ms": int(1000 * (time.perf_counter() - start))}
+
+  print("stages:", stages)
+
+  return 200, {
+    **podcast,
+    "queryid": queryid,
+    "article_headlines": fetched["article_headlines"],
+    "scriptkey": summary["scriptkey"],
+    "script": summary["script"],
+    "stages": stages
+  }
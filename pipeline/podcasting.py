@@ -0,0 +1,287 @@
+#
+# podcasting.py
+#
+# The podcast stage: turns the script of a query into an MP3
+# episode with Amazon Polly, uploads it to S3 as it is
+# synthesized, records its key and the new status in the
+# database, and builds the response that delivers it (a
+# presigned URL, and the audio itself when it is small enough).
+# Audio already in S3 (the same script and voice, for any query)
+# is not synthesized again.
+#
+# Used by the generate_podcast lambda (POST /podcast/{queryid}) and
+# by the pipeline lambda, which already has the script in memory
+# and passes it in, so it is not downloaded again.
+#
+# Concurrent requests for the same query's episode share one
+# synthesis: the query is claimed ("synthesizing") by the first,
+# and the others wait for its audio (see claims.py).
+#
+
+import base64
+import time
+
+import artifacts
+import claims
+import datatier
+import metrics
+import runtime
+import synthesis
+import ttscache
+
+
+POLLY_SETTINGS = {
+  "OutputFormat": "mp3",
+  "VoiceId": "Joanna",
+  "Engine": "standard"  # Change to your preferred voice
+}
+
+#
+# audio is delivered as a presigned S3 URL, valid for [delivery]
+# url_ttl seconds; only files of at most inline_max_bytes may be
+# embedded in the response as base64 instead (?delivery=inline,
+# or delivery = auto picks inline for those)
+#
+DELIVERY_MODES = ["url", "inline", "auto"]
+DEFAULT_DELIVERY = "url"
+DEFAULT_URL_TTL = 900
+DEFAULT_INLINE_MAX_BYTES = 1024 * 1024
+
+
+###################################################################
+#
+# audio_response:
+#
+def audio_response(bucket, audiokey, querytext, delivery, inline_max_bytes, url_ttl, length=None, extra={}):
+  """
+  Returns the response body (dict) for an audio object: a
+  presigned URL and its content length (looked up if not given),
+  plus the base64 audio itself when inline delivery is chosen and
+  the file is small enough
+  """
+  if length is None:
+    length = artifacts.content_length(bucket, audiokey)
+
+  body = {
+    "audiokey": audiokey,
+    "querytext": querytext,
+    "audiourl": artifacts.presigned_url(bucket, audiokey, url_ttl),
+    "contentlength": length,
+    "expires_in": url_ttl,
+    **extra
+  }
+
+  if delivery in ["inline", "auto"] and length <= inline_max_bytes:
+    audio = artifacts.get_bytes(bucket, audiokey)
+    print ("Encoding audio as data string")
+    body["audiodata"] = base64.b64encode(audio).decode()
+
+  return body
+
+
+###################################################################
+#
+# generate:
+#
+def generate(dbConn, queryid, params, script_text=None):
+  """
+  Generates the podcast episode for a query, or returns the one
+  it already has (or waits for the one another request is
+  synthesizing)
+
+  Parameters
+  ----------
+  dbConn : database connection,
+  queryid : the query's id,
+  params : request options (dict), e.g. {"delivery": "auto"},
+  script_text : the query's script, if the caller has it (else
+                it is downloaded from S3)
+
+  Returns
+  -------
+  (statusCode, body): the HTTP status and the response body (dict)
+  """
+  # config and bucket are set up once per container (the Polly
+  # client too, on the first cache miss):
+  configur = runtime.get_config()
+  bucket = runtime.get_bucket()
+
+  print("Getting scriptkey from database")
+  sql = "SELECT querytext, status, scriptkey, audiokey from queries where queryid = %s;"
+
+  row = datatier.retrieve_one_row(dbConn, sql, [queryid])
+
+  if row == ():
+    return 400, {"error": "No script available"}
+
+  querytext = row[0]
+  status = row[1]
+  scriptkey = row[2]
+  audiokey = row[3]
+
+  print("querytext:", querytext)
+  print("status:", status)
+  print("scriptkey:", scriptkey)
+
+  delivery = params.get("delivery", configur.get('delivery', 'mode', fallback=DEFAULT_DELIVERY))
+  if delivery not in DELIVERY_MODES:
+    return 400, {"error": "delivery must be one of " + ", ".join(DELIVERY_MODES)}
+  url_ttl = configur.getint('delivery', 'url_ttl', fallback=DEFAULT_URL_TTL)
+  inline_max_bytes = configur.getint('delivery', 'inline_max_bytes', fallback=DEFAULT_INLINE_MAX_BYTES)
+
+  if status not in ["generated script", "generated audio", "synthesizing"]:
+    return 400, {"error": "No script available, status: " + status}
+  if status == "generated audio":
+    print("Audio already generated")
+    return 200, audio_response(bucket, audiokey, querytext, delivery, inline_max_bytes, url_ttl)
+
+  #
+  # one request at a time synthesizes a query's episode; if
+  # another one is at it, wait for its audio instead of
+  # synthesizing it again
+  #
+  claimed, status = claims.claim_or_wait(dbConn, queryid, "generated script", "synthesizing")
+
+  if not claimed:
+    if status == "generated audio":
+      print("Audio generated by another request")
+      return generate(dbConn, queryid, params)
+    if status == "synthesizing":
+      return 409, {"error": "audio is being synthesized by another request, try again later", "status": status}
+    return 400, {"error": "No script available, status: " + str(status)}
+
+  try:
+    statusCode, body = synthesize_audio(dbConn, queryid, querytext, scriptkey, delivery, inline_max_bytes, url_ttl, script_text)
+  except Exception:
+    claims.release(dbConn, queryid, "synthesizing", "generated script")
+    raise
+
+  if statusCode != 200:
+    claims.release(dbConn, queryid, "synthesizing", "generated script")
+
+  return statusCode, body
+
+
+###################################################################
+#
+# synthesize_audio:
+#
+def synthesize_audio(dbConn, queryid, querytext, scriptkey, delivery, inline_max_bytes, url_ttl, script_text=None):
+  """
+  Synthesizes the episode of a query claimed by this request
+  (status "synthesizing"), or takes it from the audio cache, and
+  records it (status "generated audio")
+
+  Parameters
+  ----------
+  dbConn : database connection,
+  queryid : the query's id,
+  querytext : its query text,
+  scriptkey : S3 key of its script,
+  delivery, inline_max_bytes, url_ttl : how to deliver the audio
+               (see audio_response),
+  script_text : the script, if the caller has it
+
+  Returns
+  -------
+  (statusCode, body): the HTTP status and the response body (dict)
+  """
+  configur = runtime.get_config()
+  bucket = runtime.get_bucket()
+
+  if script_text is None:
+    #
+    print("Downloading podcast script from S3")
+    #
+    script_text = artifacts.get_text(bucket, scriptkey)
+
+  if script_text == "":
+    return 400, {"error": "No script available"}
+
+  #
+  # the audio's key is derived from the script and the voice
+  # settings, so the same audio is always stored once, under
+  # the same key:
+  #
+  audiokey = artifacts.artifact_key("podcasts", script_text, POLLY_SETTINGS, ".mp3")
+  print ("audiokey:", audiokey)
+
+  length = None
+
+  #
+  # has this script been synthesized with these settings
+  # before, for any query? Then its audio is in S3 already, under
+  # this key: a HEAD request says so. The lambdas never delete
+  # audio (queries keep pointing to it); how long it is kept is
+  # up to the bucket
+  #
+  if artifacts.exists(bucket, audiokey):
+    print ("Audio for this script already in S3, skipping synthesis")
+
+    metrics.emit("generate_podcast", {
+      "AudioCacheHit": (1, "Count")
+    }, {
+      "queryid": queryid
+    })
+
+    extra = {"cache": "hit"}
+  else:
+    #
+    # Convert text to speech using Polly: in sentence-aligned
+    # chunks, synthesized concurrently and joined frame by
+    # frame, so scripts of any length work
+    #
+    chunk_chars = configur.getint('polly', 'chunk_chars', fallback=synthesis.DEFAULT_CHUNK_CHARS)
+    max_workers = configur.getint('polly', 'max_workers', fallback=synthesis.DEFAULT_MAX_WORKERS)
+
+    #
+    # sentences already synthesized with this voice (for any
+    # script) come from the segment cache instead of Polly, if
+    # it is turned on (see ttscache.py)
+    #
+    segment_cache = None
+    if configur.getboolean('polly', 'segment_cache', fallback=False):
+      ttscache.memory.max_bytes = configur.getint('polly', 'segment_cache_mb', fallback=ttscache.DEFAULT_MEMORY_BYTES // (1024 * 1024)) * 1024 * 1024
+      segment_cache = ttscache.SegmentCache(bucket, POLLY_SETTINGS)
+
+    #
+    # the audio goes straight from Polly into a multipart
+    # upload, part_size bytes at a time: the whole episode
+    # is never held in memory or written to /tmp
+    #
+    part_size = configur.getint('polly', 'upload_part_mb', fallback=artifacts.DEFAULT_PART_SIZE // (1024 * 1024)) * 1024 * 1024
+    writer = artifacts.MultipartWriter(bucket, audiokey, 'audio/mpeg', part_size)
+
+    print ("Synthesizing and uploading podcast mp3 file to S3")
+    start = time.perf_counter()
+    try:
+      _, synth_stats = synthesis.synthesize(runtime.get_client("polly"), script_text, POLLY_SETTINGS, chunk_chars, max_workers, segment_cache, writer.write)
+      length = writer.close()
+    except Exception:
+      writer.abort()
+      raise
+    latency = int(1000 * (time.perf_counter() - start))
+    print("Synthesis:", synth_stats)
+    print ("Uploaded mp3 file with podcast")
+
+    metrics.emit("generate_podcast", {
+      "AudioCacheHit": (0, "Count"),
+      "SynthesisLatency": (latency, "Milliseconds"),
+      "PollyRequests": (synth_stats["requests"], "Count"),
+      "PollyCharacters": (synth_stats["characters"], "Count"),
+      "PollyCharactersSaved": (synth_stats["characters_saved"], "Count"),
+      "SegmentCacheHitRate": (100 * synth_stats["hit_rate"], "Percent")
+    }, {
+      "queryid": queryid,
+      "segments": synth_stats["chunks"],
+      "memory_hits": segment_cache.memory_hits if segment_cache else 0,
+      "s3_hits": segment_cache.s3_hits if segment_cache else 0
+    })
+
+    extra = {"cache": "miss", "synthesis": synth_stats}
+
+  print ("Updating database with podcast script key and new status")
+  sql = "UPDATE queries SET status = %s, audiokey = %s WHERE queryid = %s;"
+  datatier.perform_action(dbConn, sql, ["generated audio", audiokey, queryid])
+
+  return 200, audio_response(bucket, audiokey, querytext, delivery, inline_max_bytes, url_ttl, length, extra)
@@ -0,0 +1,203 @@
+#
+# prompting.py
+#
+# Builds the prompt sent to the model from the combined article
+# text, keeping it within an input token budget.
+#
+# Tokens are counted with a local approximation of the Llama 3
+# tokenizer (no model files needed): every word and every
+# punctuation mark is a token, and long words count as several.
+# For English news text this lands within ~10% of the real count,
+# which is plenty for budgeting.
+#
+# When the articles don't all fit, the budget is shared fairly:
+# every article gets an equal share, and whatever short articles
+# don't use is split among the longer ones (max-min fairness), so
+# one long read cannot crowd out the others. Articles are cut at
+# a token boundary.
+#
+
+import re
+
+
+# fetch_articles separates the articles in the combined text with
+# a blank line (and collapses the whitespace inside each article,
+# so an article has no newlines):
+ARTICLE_SEPARATOR = "\n\n"
+
+PROMPT_TEMPLATE = (
+  "Generate a podcast script summarizing the provided articles in a natural and engaging style. "
+  "The script should flow seamlessly without including meta text like 'Here's the podcast script' "
+  "or section headers such as 'Segment 1'. Instead, transition smoothly between topics as a natural "
+  "conversation or narration would. Keep it to 250 words max and professional, engaging, and "
+  "structured without explicit labels\n{articles}"
+)
+
+# map step of map-reduce summarization (see generation.py):
+MAP_PROMPT_TEMPLATE = (
+  "Summarize the following news article in three or four sentences, keeping the key facts, "
+  "names and numbers. Reply with the summary only.\n{article}"
+)
+
+DEFAULT_INPUT_TOKEN_BUDGET = 8000
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+# a word piece covers about this many characters:
+_CHARS_PER_PIECE = 7
+
+
+def _piece_tokens(piece):
+  return 1 + (len(piece) - 1) // _CHARS_PER_PIECE
+
+
+###################################################################
+#
+# count_tokens:
+#
+def count_tokens(text):
+  """
+  Returns the approximate # of model tokens in a text
+  """
+  return sum(_piece_tokens(m.group()) for m in _TOKEN_RE.finditer(text))
+
+
+###################################################################
+#
+# truncate_tokens:
+#
+def truncate_tokens(text, max_tokens):
+  """
+  Cuts a text down to at most max_tokens (approximate) tokens,
+  at a token boundary
+
+  Returns
+  -------
+  (text, # of tokens kept)
+  """
+  ntokens = 0
+  end = 0
+
+  for m in _TOKEN_RE.finditer(text):
+    t = _piece_tokens(m.group())
+    if ntokens + t > max_tokens:
+      return text[:end], ntokens
+    ntokens += t
+    end = m.end()
+
+  return text, ntokens
+
+
+###################################################################
+#
+# allocate_budget:
+#
+def allocate_budget(sizes, budget):
+  """
+  Shares a token budget among articles of the given sizes (in
+  tokens), max-min fairly: no article gets more than it needs,
+  and no article gets less than an equal share of what is left
+  once the smaller ones are served
+
+  Returns
+  -------
+  list of # of tokens allowed, one per article, in input order
+  """
+  allowed = [0] * len(sizes)
+  remaining = max(0, budget)
+
+  order = sorted(range(len(sizes)), key=lambda i: sizes[i])
+
+  for n, i in enumerate(order):
+    share = remaining // (len(sizes) - n)
+    allowed[i] = min(sizes[i], share)
+    remaining -= allowed[i]
+
+  return allowed
+
+
+###################################################################
+#
+# split_articles:
+#
+def split_articles(combined_text):
+  """
+  Splits the combined text saved by fetch_articles back into the
+  individual articles (texts saved before the articles were
+  separated come back as a single article)
+  """
+  return [a.strip() for a in combined_text.split(ARTICLE_SEPARATOR) if a.strip()]
+
+
+###################################################################
+#
+# build_prompt:
+#
+def build_prompt(articles, budget=DEFAULT_INPUT_TOKEN_BUDGET):
+  """
+  Builds the model prompt for a list of article texts, fitting
+  it in the input token budget
+
+  Parameters
+  ----------
+  articles : list of article texts (strings),
+  budget : max # of input tokens for the whole prompt
+
+  Returns
+  -------
+  (prompt, stats) where stats is a dict with the estimated
+  "prompt_tokens", and the # of "articles" and of
+  "truncated_articles"
+  """
+  overhead = count_tokens(PROMPT_TEMPLATE.format(articles=""))
+
+  sizes = [count_tokens(a) for a in articles]
+  allowed = allocate_budget(sizes, budget - overhead)
+
+  kept = []
+  ntokens = overhead
+  truncated = 0
+
+  for article, size, limit in zip(articles, sizes, allowed):
+    if size > limit:
+      article, size = truncate_tokens(article, limit)
+      truncated += 1
+    if article:
+      kept.append(article)
+      ntokens += size
+
+  prompt = PROMPT_TEMPLATE.format(articles=ARTICLE_SEPARATOR.join(kept))
+
+  stats = {
+    "prompt_tokens": ntokens,
+    "articles": len(articles),
+    "truncated_articles": truncated,
+  }
+
+  return prompt, stats
+
+
+###################################################################
+#
+# build_map_prompt:
+#
+def build_map_prompt(article, budget=DEFAULT_INPUT_TOKEN_BUDGET):
+  """
+  Builds the prompt summarizing a single article (map step),
+  fitting it in the input token budget
+
+  Returns
+  -------
+  (prompt, stats), stats as for build_prompt
+  """
+  overhead = count_tokens(MAP_PROMPT_TEMPLATE.format(article=""))
+
+  text, ntokens = truncate_tokens(article, max(0, budget - overhead))
+
+  stats = {
+    "prompt_tokens": overhead + ntokens,
+    "articles": 1,
+    "truncated_articles": 1 if len(text) < len(article.rstrip()) else 0,
+  }
+
+  return MAP_PROMPT_TEMPLATE.format(article=text), stats
@@ -0,0 +1,420 @@
+#
+# synthesis.py
+#
+# Turns a podcast script into MP3 audio with Amazon Polly.
+#
+# A synthesize_speech request takes at most MAX_CHARS characters,
+# so the script is split on sentence boundaries into chunks of at
+# most chunk_chars characters (a sentence longer than that is
+# split between words). The chunks are synthesized concurrently,
+# by a bounded thread pool, and their MP3 streams are joined in
+# script order.
+#
+# The audio can be passed on (e.g. to an S3 multipart upload) as
+# it is produced, in order, instead of being returned; only a
+# bounded window of chunks is then held in memory.
+#
+# With a segment cache (see ttscache.py), each sentence is its own
+# segment instead: segments already in the cache are not sent to
+# Polly at all, and only the others are synthesized, one request
+# per segment, concurrently as above.
+#
+# MP3 is a sequence of self-contained frames, so the streams can
+# be joined without re-encoding: only the audio frames of each
+# stream are kept, leaving out any ID3 tags and the Xing/Info (or
+# VBRI) frame an encoder may put first, which describe a single
+# stream and would give players the wrong duration for the whole.
+#
+
+import re
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Polly's limit on the text of one synthesize_speech request:
+MAX_CHARS = 3000
+
+# smaller chunks => more of them to synthesize in parallel:
+DEFAULT_CHUNK_CHARS = 1500
+DEFAULT_MAX_WORKERS = 8
+
+# sentence ends: . ! ? (optionally followed by closing quotes or
+# brackets) and then whitespace
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])[\"'’”)\]]*\s+")
+
+
+###################################################################
+#
+# split_script:
+#
+def split_script(text, max_chars=DEFAULT_CHUNK_CHARS):
+  """
+  Splits a script into chunks of at most max_chars characters,
+  each made of whole sentences where possible
+
+  Returns
+  -------
+  list of chunks (strings), in script order
+  """
+  max_chars = max(1, min(max_chars, MAX_CHARS))
+
+  chunks = []
+  current = ""
+  for piece in split_segments(text, max_chars):
+    if current and len(current) + 1 + len(piece) > max_chars:
+      chunks.append(current)
+      current = ""
+    current = current + " " + piece if current else piece
+
+  if current:
+    chunks.append(current)
+
+  return chunks
+
+
+###################################################################
+#
+# split_segments:
+#
+def split_segments(text, max_chars=DEFAULT_CHUNK_CHARS):
+  """
+  Splits a script into its sentences, splitting any sentence
+  longer than max_chars characters between words
+
+  Returns
+  -------
+  list of segments (strings), in script order
+  """
+  max_chars = max(1, min(max_chars, MAX_CHARS))
+
+  segments = []
+  for sentence in _sentences(text):
+    if len(sentence) <= max_chars:
+      segments.append(sentence)
+    else:
+      segments.extend(_split_long(sentence, max_chars))
+
+  return segments
+
+
+def _sentences(text):
+  start = 0
+  for m in _SENTENCE_END_RE.finditer(text):
+    sentence = text[start:m.start() + len(m.group().rstrip())].strip()
+    if sentence:
+      yield sentence
+    start = m.end()
+
+  sentence = text[start:].strip()
+  if sentence:
+    yield sentence
+
+
+def _split_long(sentence, max_chars):
+  #
+  # between words, or anywhere if a single "word" is too long:
+  #
+  parts = []
+  current = ""
+  for word in sentence.split():
+    while len(word) > max_chars:
+      if current:
+        parts.append(current)
+        current = ""
+      parts.append(word[:max_chars])
+      word = word[max_chars:]
+    if current and len(current) + 1 + len(word) > max_chars:
+      parts.append(current)
+      current = ""
+    current = current + " " + word if current else word
+
+  if current:
+    parts.append(current)
+
+  return parts
+
+
+###################################################################
+#
+# MP3 frames
+#
+# Frame header: 11 sync bits, version (2), layer (2), protection
+# (1), bitrate index (4), sample rate index (2), padding (1), ...
+#
+_BITRATES = {  # kbps, by (MPEG-1?, layer)
+  (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+  (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+  (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+  (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+  (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+  (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+_SAMPLE_RATES = {  # by version bits
+  3: [44100, 48000, 32000],  # MPEG-1
+  2: [22050, 24000, 16000],  # MPEG-2
+  0: [11025, 12000, 8000],   # MPEG-2.5
+}
+
+
+def parse_frame_header(data, pos):
+  """
+  Parses the MP3 frame header at data[pos:pos+4]
+
+  Returns
+  -------
+  dict with the frame's "length" (bytes), "samples",
+  "sample_rate", "mpeg1", "layer" and "mono", or None if there
+  is no valid frame header at pos
+  """
+  if pos + 4 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xE0 != 0xE0:
+    return None
+
+  version = (data[pos + 1] >> 3) & 3
+  layer = 4 - ((data[pos + 1] >> 1) & 3)
+  bitrate_index = data[pos + 2] >> 4
+  rate_index = (data[pos + 2] >> 2) & 3
+  padding = (data[pos + 2] >> 1) & 1
+  mono = (data[pos + 3] >> 6) == 3
+
+  if version == 1 or layer == 4 or bitrate_index in [0, 15] or rate_index == 3:
+    return None  # reserved, or free format
+
+  mpeg1 = version == 3
+  bitrate = _BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+  sample_rate = _SAMPLE_RATES[version][rate_index]
+
+  if layer == 1:
+    samples = 384
+    length = (12 * bitrate // sample_rate + padding) * 4
+  elif layer == 2 or mpeg1:
+    samples = 1152
+    length = 144 * bitrate // sample_rate + padding
+  else:
+    samples = 576
+    length = 72 * bitrate // sample_rate + padding
+
+  return {
+    "length": length,
+    "samples": samples,
+    "sample_rate": sample_rate,
+    "mpeg1": mpeg1,
+    "layer": layer,
+    "mono": mono,
+  }
+
+
+def _is_info_frame(data, pos, header):
+  #
+  # Xing/Info tags sit right after the side information of a
+  # layer III frame, VBRI tags at a fixed offset
+  #
+  if header["layer"] == 3:
+    if header["mpeg1"]:
+      side = 17 if header["mono"] else 32
+    else:
+      side = 9 if header["mono"] else 17
+    if data[pos + 4 + side:pos + 8 + side] in [b"Xing", b"Info"]:
+      return True
+
+  return data[pos + 36:pos + 40] == b"VBRI"
+
+
+def _skip_id3v2(data):
+  pos = 0
+  while data[pos:pos + 3] == b"ID3" and pos + 10 <= len(data):
+    size = 0
+    for b in data[pos + 6:pos + 10]:
+      size = (size << 7) | (b & 0x7F)
+    footer = 10 if data[pos + 5] & 0x10 else 0
+    pos += 10 + size + footer
+  return pos
+
+
+###################################################################
+#
+# audio_frames:
+#
+def audio_frames(data):
+  """
+  Returns the audio frames of an MP3 stream, without ID3 tags
+  and Xing/Info/VBRI frames, and the # of samples and sample
+  rate
+
+  Returns
+  -------
+  (frames as bytes, # of samples, sample rate); the sample rate
+  is None if there are no frames
+  """
+  pos = _skip_id3v2(data)
+
+  # resync on the first valid frame (some encoders pad):
+  while pos < len(data) and parse_frame_header(data, pos) is None:
+    pos += 1
+
+  start = pos
+  samples = 0
+  sample_rate = None
+  first = True
+
+  while True:
+    header = parse_frame_header(data, pos)
+    if header is None or pos + header["length"] > len(data):
+      break  # end of stream, or a trailing ID3v1 "TAG"
+
+    if first and _is_info_frame(data, pos, header):
+      start = pos + header["length"]
+    else:
+      samples += header["samples"]
+      sample_rate = header["sample_rate"]
+
+    first = False
+    pos += header["length"]
+
+  return data[start:pos], samples, sample_rate
+
+
+###################################################################
+#
+# concat_mp3:
+#
+def concat_mp3(streams):
+  """
+  Joins MP3 streams into one, frame by frame, without
+  re-encoding
+
+  Parameters
+  ----------
+  streams : list of MP3 streams (bytes), in order
+
+  Returns
+  -------
+  (MP3 bytes, duration in seconds)
+  """
+  parts = []
+  duration = 0.0
+
+  for stream in streams:
+    frames, samples, sample_rate = audio_frames(stream)
+    parts.append(frames)
+    if sample_rate:
+      duration += samples / sample_rate
+
+  return b"".join(parts), duration
+
+
+###################################################################
+#
+# synthesize:
+#
+def synthesize(client, text, settings, chunk_chars=DEFAULT_CHUNK_CHARS, max_workers=DEFAULT_MAX_WORKERS,
+               cache=None, sink=None):
+  """
+  Synthesizes a script of any length with Polly, chunk by chunk
+  in parallel, see the top of the file
+
+  Parameters
+  ----------
+  client : boto3 polly client (thread-safe),
+  text : the script,
+  settings : synthesize_speech parameters other than Text (the
+             OutputFormat must be "mp3"),
+  chunk_chars : max # of characters per request,
+  max_workers : max # of concurrent requests,
+  cache : optional ttscache.SegmentCache for these settings,
+  sink : optional function to pass the audio to, in order, a
+         chunk's frames at a time, instead of returning it; at
+         most 2 x max_workers chunks of audio are held at once,
+         however long the script
+
+  Returns
+  -------
+  (MP3 bytes, stats) where stats is a dict with the # of
+  "chunks" the script was split into, of Polly "requests", of
+  "characters" sent to Polly and "characters_saved" (thanks to
+  the cache, or repeated in the script), the # of "cache_hits",
+  the "hit_rate", the audio "duration" in seconds and its "size"
+  in bytes; the MP3 bytes are None if there is a sink
+  """
+  if cache is None:
+    chunks = split_script(text, chunk_chars)
+  else:
+    chunks = split_segments(text, chunk_chars)
+
+  def synthesize_one(chunk):
+    if cache is not None:
+      audio = cache.get(chunk)
+      if audio is not None:
+        return audio, True
+
+    response = client.synthesize_speech(Text=chunk, **settings)
+    audio = response["AudioStream"].read()
+
+    if cache is not None:
+      cache.put(chunk, audio)
+
+    return audio, False
+
+  parts = []
+  collect = sink is None
+  if collect:
+    sink = parts.append
+
+  window = 2 * max(1, max_workers)
+  stats = {
+    "chunks": len(chunks),
+    "requests": 0,
+    "characters": 0,
+    "characters_saved": 0,
+    "cache_hits": 0,
+    "hit_rate": 0.0,
+    "duration": 0.0,
+    "size": 0,
+  }
+
+  with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks) or 1))) as pool:
+    #
+    # keep up to window chunks in flight, and hand the audio on
+    # in script order as it completes:
+    #
+    futures = {}
+    shared = set()  # of chunks reusing the request of an earlier one
+    recent = {}     # chunk => future, to share with repeats in flight
+
+    def submit(n):
+      chunk = chunks[n]
+      if chunk in recent:
+        futures[n] = recent[chunk]
+        shared.add(n)
+      else:
+        futures[n] = recent[chunk] = pool.submit(synthesize_one, chunk)
+
+    for n in range(min(window, len(chunks))):
+      submit(n)
+
+    for n, chunk in enumerate(chunks):
+      audio, hit = futures.pop(n).result()
+      if n + window < len(chunks):
+        submit(n + window)
+
+      if hit:
+        stats["cache_hits"] += 1
+      elif n not in shared:
+        stats["requests"] += 1
+        stats["characters"] += len(chunk)
+
+      frames, samples, sample_rate = audio_frames(audio)
+      if sample_rate:
+        stats["duration"] += samples / sample_rate
+      stats["size"] += len(frames)
+
+      sink(frames)
+
+      if recent.get(chunk) is not None and all(f is not recent[chunk] for f in futures.values()):
+        del recent[chunk]
+
+  stats["characters_saved"] = sum(len(c) for c in chunks) - stats["characters"]
+  stats["hit_rate"] = round(stats["cache_hits"] / len(chunks), 3) if chunks else 0.0
+  stats["duration"] = round(stats["duration"], 3)
+
+  return (b"".join(parts) if collect else None), stats
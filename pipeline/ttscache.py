@@ -0,0 +1,154 @@
+#
+# ttscache.py
+#
+# Caches the synthesized audio of script segments (sentences), so
+# greetings, sign-offs and other sentences that recur across
+# scripts are only ever sent to Polly once per voice.
+#
+# Segments are keyed by their normalized text (Unicode NFC, runs
+# of whitespace collapsed) and the Polly settings (VoiceId, Engine,
+# OutputFormat, ...), content-addressed like the other artifacts:
+#
+#   ttscache/<sha256>.mp3
+#
+# Two layers: S3, shared by all containers, and an in-memory LRU
+# per container (at most max_bytes of audio), which keeps the
+# most recently used segments of warm invocations without any
+# S3 request.
+#
+# The cache is opt-in ([polly] segment_cache = true): every
+# sentence is then its own Polly request (plus an S3 GET and PUT),
+# so a script with nothing to reuse costs more requests than the
+# plain chunked synthesis. It pays off when scripts share many
+# sentences. The S3 layer does not expire by itself: apply the
+# lifecycle rule in tools/s3-lifecycle.json to the bucket (it
+# deletes ttscache/ objects after 30 days).
+#
+
+import threading
+import unicodedata
+
+from collections import OrderedDict
+
+import artifacts
+
+
+PREFIX = "ttscache"
+
+DEFAULT_MEMORY_BYTES = 16 * 1024 * 1024
+
+
+###################################################################
+#
+# MemoryLRU
+#
+# Least recently used cache of bytes values, bounded by their
+# total size; thread-safe.
+#
+class MemoryLRU:
+
+  def __init__(self, max_bytes):
+    self.max_bytes = max_bytes
+    self.size = 0
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    with self._lock:
+      value = self._entries.get(key)
+      if value is not None:
+        self._entries.move_to_end(key)
+      return value
+
+  def put(self, key, value):
+    with self._lock:
+      if key in self._entries:
+        self.size -= len(self._entries.pop(key))
+
+      if len(value) > self.max_bytes:
+        return
+
+      self._entries[key] = value
+      self.size += len(value)
+
+      while self.size > self.max_bytes:
+        _, evicted = self._entries.popitem(last=False)
+        self.size -= len(evicted)
+
+  def __len__(self):
+    return len(self._entries)
+
+
+# one per container, kept across warm invocations:
+memory = MemoryLRU(DEFAULT_MEMORY_BYTES)
+
+
+###################################################################
+#
+# normalize:
+#
+def normalize(text):
+  """
+  Returns the form of a segment's text used in its cache key
+  """
+  return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+###################################################################
+#
+# SegmentCache
+#
+# The two-layer cache for one bucket and one set of Polly
+# settings; get and put may be called from several threads.
+#
+class SegmentCache:
+
+  def __init__(self, bucket, settings, lru=memory):
+    self.bucket = bucket
+    self.settings = dict(settings)
+    self.lru = lru
+    self.memory_hits = 0
+    self.s3_hits = 0
+    self.misses = 0
+    self._lock = threading.Lock()
+
+  def key(self, segment):
+    return artifacts.artifact_key(PREFIX, normalize(segment), self.settings, ".mp3")
+
+  def _count(self, name):
+    with self._lock:
+      setattr(self, name, getattr(self, name) + 1)
+
+  def get(self, segment):
+    """
+    Returns the cached audio of a segment, None on a miss
+    """
+    from botocore.exceptions import ClientError
+
+    key = self.key(segment)
+
+    audio = self.lru.get(key)
+    if audio is not None:
+      self._count("memory_hits")
+      return audio
+
+    try:
+      audio = artifacts.get_bytes(self.bucket, key)
+    except ClientError as err:
+      if err.response.get("Error", {}).get("Code") in ["404", "NoSuchKey", "NotFound"]:
+        self._count("misses")
+        return None
+      raise
+
+    self.lru.put(key, audio)
+    self._count("s3_hits")
+    return audio
+
+  def put(self, segment, audio):
+    """
+    Stores the audio of a segment in both layers
+    """
+    key = self.key(segment)
+
+    artifacts.put_bytes(self.bucket, key, audio, 'audio/mpeg')
+    self.lru.put(key, audio)
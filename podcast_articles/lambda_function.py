@@ -1,70 +1,77 @@
 #
-# Retrieves and returns all the articles in the 
+# Retrieves and returns a page of the articles in the
 # PodcastApp database.
 #
 
 import json
-import boto3
-import os
 import datatier
+import runtime
+
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
 
-from configparser import ConfigParser
 
 def lambda_handler(event, context):
+  dbConn = None
+
   try:
     print("**STARTING**")
     print("**lambda: podcast_queries**")
     
     #
-    # setup AWS based on config file:
+    # open connection to the database (config and connection
+    # pool are set up once per container):
     #
-    config_file = 'podcast-config.ini'
-    os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
+    print("**Opening connection**")
     
-    configur = ConfigParser()
-    configur.read(config_file)
+    dbConn = runtime.get_dbConn()
     
     #
-    # configure for RDS access
+    # page of rows to return: ?after=<articleid>&limit=N
     #
-    rds_endpoint = configur.get('rds', 'endpoint')
-    rds_portnum = int(configur.get('rds', 'port_number'))
-    rds_username = configur.get('rds', 'user_name')
-    rds_pwd = configur.get('rds', 'user_pwd')
-    rds_dbname = configur.get('rds', 'db_name')
+    params = event.get("queryStringParameters") or {}
+
+    try:
+      after = int(params.get("after", 0))
+      limit = int(params.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+      return {
+        'statusCode': 400,
+        'body': json.dumps("after and limit must be integers")
+      }
+
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    print("after:", after)
+    print("limit:", limit)
 
     #
-    # open connection to the database:
-    #
-    print("**Opening connection**")
-    
-    dbConn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
-    
-    #
-    # now retrieve all the users:
+    # now retrieve the page of articles, using keyset pagination on
+    # articleid so each page is an index range scan no matter how
+    # deep into the table we are. We ask for one extra row to
+    # know if there is a next page:
     #
     print("**Retrieving data**")
 
-    #
-    # TODO #1 of 1: write sql query to select all articles from the 
-    # articles table, ordered by queryid
-    #
-    sql = "select * from articles order by articleid";
-    
-    rows = datatier.retrieve_all_rows(dbConn, sql)
+    sql = "select * from articles where articleid > %s order by articleid limit %s";
     
-    for row in rows:
-      print(row)
+    rows = list(datatier.retrieve_rows_iter(dbConn, sql, [after, limit + 1]))
+
+    next_after = None
+    if len(rows) > limit:
+      rows = rows[:limit]
+      next_after = rows[-1][0]
 
     #
     # respond in an HTTP-like way, i.e. with a status
     # code and body in JSON format:
     #
-    print("**DONE, returning rows**")
+    print("**DONE, returning", len(rows), "rows**")
     
     return {
       'statusCode': 200,
-      'body': json.dumps(rows)
+      'body': json.dumps({"rows": rows, "next": next_after})
     }
     
   except Exception as err:
@@ -75,3 +82,6 @@ def lambda_handler(event, context):
       'statusCode': 500,
       'body': json.dumps(str(err))
     }
+
+  finally:
+    datatier.release_dbConn(dbConn)
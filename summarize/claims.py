@@ -0,0 +1,102 @@
+#
+# claims.py
+#
+# Single flight for the expensive stages: when several requests
+# ask for the same query's script (or audio) at once, only one of
+# them calls Bedrock (or Polly). Each stage moves the query's
+# status through an in-progress state:
+#
+#   "gathered articles" => "summarizing"  => "generated script"
+#   "generated script"  => "synthesizing" => "generated audio"
+#
+# and the first step is a compare-and-set (datatier), so exactly
+# one request wins it. The others poll the status until the
+# winner is done, and then answer with its result; if the winner
+# fails it puts the status back, and a waiting request claims it
+# instead.
+#
+# A claim is stamped with the time (queries.claimed); one older
+# than the lease (its owner crashed or timed out) may be taken
+# over. Losers wait at most wait seconds. Both are [claims] lease
+# and wait, defaulting to the [leases] ones (see runtime.py).
+#
+
+import time
+
+import datatier
+import runtime
+
+
+# seconds between two looks at the status of a query another
+# request has claimed:
+DEFAULT_POLL_INTERVAL = 0.5
+
+
+###################################################################
+#
+# claim_or_wait:
+#
+def claim_or_wait(dbConn, queryid, ready, working):
+  """
+  Claims a query for a stage, or waits while another request
+  has it claimed
+
+  Parameters
+  ----------
+  dbConn : database connection,
+  queryid : the query's id,
+  ready : the status the stage starts from, e.g. "gathered articles",
+  working : its in-progress status, e.g. "summarizing"
+
+  Returns
+  -------
+  (claimed, status): True and working if this request now owns
+  the stage, else False and the status when it stopped waiting
+  (the winner's result, e.g. "generated script", or still working
+  if the wait ran out)
+  """
+  configur = runtime.get_config()
+  lease = runtime.get_lease('claims')
+  wait = runtime.get_wait('claims')
+  interval = configur.getfloat('claims', 'poll_interval', fallback=DEFAULT_POLL_INTERVAL)
+
+  deadline = time.monotonic() + wait
+  sql = "SELECT status FROM queries WHERE queryid = %s;"
+
+  while True:
+    if datatier.compare_and_set(dbConn, "queries", {"queryid": queryid}, "status", ready, working,
+                                lease_column="claimed", lease=lease):
+      print("Claimed query", queryid, "for", working)
+      return True, working
+
+    #
+    # the compare-and-set committed, so this read sees the
+    # latest status, not an old snapshot:
+    #
+    row = datatier.retrieve_one_row(dbConn, sql, [queryid])
+    status = row[0] if row != () else None
+
+    if status == ready:  # the winner gave up, try again
+      continue
+    if status != working or time.monotonic() >= deadline:
+      return False, status
+
+    print("Query", queryid, "is", working, "in another request, waiting")
+    time.sleep(interval)
+
+
+###################################################################
+#
+# release:
+#
+def release(dbConn, queryid, working, ready):
+  """
+  Gives up a claim after the stage failed, putting the status
+  back to ready so another request can try. Best effort: an
+  error is printed, not raised (the claim's lease runs out
+  anyway)
+  """
+  try:
+    datatier.compare_and_set(dbConn, "queries", {"queryid": queryid}, "status", working, ready)
+  except Exception as err:
+    print("claims.release() failed:", str(err))
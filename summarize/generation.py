@@ -0,0 +1,312 @@
+#
+# generation.py
+#
+# Calls Llama 3.3 70B Instruct on Amazon Bedrock to turn the
+# articles into a podcast script, in one of two modes:
+#
+#   "single"    - one prompt with all the articles (trimmed to the
+#                 input token budget, see prompting.py)
+#   "mapreduce" - each article is summarized on its own, by
+#                 concurrent calls from a bounded thread pool, then
+#                 one final call writes the script from those
+#                 summaries. Prompt processing time grows with
+#                 the longest article rather than with the sum of
+#                 them all, and no article has to be cut to fit
+#                 one prompt, but there are two rounds of
+#                 generation instead of one.
+#
+# "auto" picks mapreduce when the articles add up to more than a
+# threshold of tokens (by default the input token budget, i.e.
+# when a single prompt would have to truncate them), and single
+# otherwise. benchmarks/bench_mapreduce.py shows where the
+# crossover is for given model speeds.
+#
+# Given an on_text callback, the call that writes the script (the
+# only call, or the reduce call) is streamed with
+# invoke_model_with_response_stream, and on_text gets each piece
+# of the script as soon as Bedrock sends it. Either way the stats
+# report the time to the first token of the script ("ttft_ms"),
+# which without streaming is the whole generation time.
+#
+# # {
+# #  "modelId": "meta.llama3-3-70b-instruct-v1:0",
+# #  "contentType": "application/json",
+# #  "accept": "application/json",
+# #  "body": "{\"prompt\":\"this is where you place your input text\",\"max_gen_len\":512,\"temperature\":0.5,\"top_p\":0.9}"
+# # }
+#
+
+import json
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import prompting
+
+
+modelId = "meta.llama3-3-70b-instruct-v1:0"
+contentType = "application/json"
+accept = "application/json"
+
+MODES = ["auto", "single", "mapreduce"]
+
+# one prompt is faster and far cheaper: map-reduce runs two rounds
+# of generation and one Bedrock call per article, and only wins
+# on latency with as many workers as articles (bench_mapreduce.py),
+# so it is opt-in, for article sets too big for one prompt
+DEFAULT_MODE = "single"
+
+# "auto" switches to mapreduce above this many article tokens:
+DEFAULT_MAPREDUCE_THRESHOLD = prompting.DEFAULT_INPUT_TOKEN_BUDGET
+
+DEFAULT_MAP_WORKERS = 8
+
+# per-article summaries are short:
+MAP_MAX_GEN_LEN = 200
+
+
+###################################################################
+#
+# invoke:
+#
+def invoke(client, prompt, params):
+  """
+  Runs one generation on Bedrock
+
+  Parameters
+  ----------
+  client : boto3 bedrock-runtime client,
+  prompt : the prompt (string),
+  params : dict of sampling parameters (max_gen_len, ...)
+
+  Returns
+  -------
+  the response JSON as a dict; the text is under "generation"
+  """
+  body = {
+    "prompt": prompt,
+    **params
+  }
+
+  response = client.invoke_model(
+    modelId=modelId,
+    contentType=contentType,
+    accept=accept,
+    body=json.dumps(body)
+  )
+
+  return json.loads(response['body'].read())
+
+
+###################################################################
+#
+# invoke_stream:
+#
+def invoke_stream(client, prompt, params, on_text):
+  """
+  Runs one generation on Bedrock, streaming the response
+
+  Parameters
+  ----------
+  client : boto3 bedrock-runtime client,
+  prompt : the prompt (string),
+  params : dict of sampling parameters (max_gen_len, ...),
+  on_text : function called with each piece of generated text,
+            in order, as it arrives
+
+  Returns
+  -------
+  the response as a dict, like invoke: the whole text under
+  "generation", plus the token counts and stop reason
+  """
+  body = {
+    "prompt": prompt,
+    **params
+  }
+
+  response = client.invoke_model_with_response_stream(
+    modelId=modelId,
+    contentType=contentType,
+    accept=accept,
+    body=json.dumps(body)
+  )
+
+  pieces = []
+  res_json = {
+    "prompt_token_count": 0,
+    "generation_token_count": 0,
+    "stop_reason": None,
+  }
+
+  for event in response['body']:
+    if 'chunk' not in event:
+      # the stream ends with an error event instead of a chunk,
+      # e.g. modelStreamErrorException or throttlingException:
+      raise Exception("Bedrock stream failed: " + json.dumps(event, default=str))
+
+    chunk = json.loads(event['chunk']['bytes'])
+
+    text = chunk.get("generation")
+    if text:
+      pieces.append(text)
+      on_text(text)
+
+    # counts are cumulative and only set in some of the chunks:
+    for name in ["prompt_token_count", "generation_token_count", "stop_reason"]:
+      if chunk.get(name) is not None:
+        res_json[name] = chunk[name]
+
+  res_json["generation"] = "".join(pieces)
+
+  return res_json
+
+
+def _invoke_final(client, prompt, params, on_text, stats, start):
+  #
+  # the call that writes the script: streamed if there is an
+  # on_text, and either way the time from start to its first
+  # token is recorded
+  #
+  if on_text is None:
+    res_json = invoke(client, prompt, params)
+    stats["ttft_ms"] = int(1000 * (time.perf_counter() - start))
+    return res_json
+
+  def first_text(text):
+    if stats["ttft_ms"] is None:
+      stats["ttft_ms"] = int(1000 * (time.perf_counter() - start))
+    on_text(text)
+
+  res_json = invoke_stream(client, prompt, params, first_text)
+
+  if stats["ttft_ms"] is None:  # empty generation
+    stats["ttft_ms"] = int(1000 * (time.perf_counter() - start))
+
+  return res_json
+
+
+def _new_stats(mode):
+  return {
+    "mode": mode,
+    "calls": 0,
+    "prompt_tokens": 0,            # our estimate, all calls
+    "model_prompt_tokens": 0,      # as reported by Bedrock
+    "model_generation_tokens": 0,
+    "articles": 0,
+    "truncated_articles": 0,
+    "ttft_ms": None,
+  }
+
+
+def _add_call(stats, prompt_stats, res_json):
+  stats["calls"] += 1
+  stats["prompt_tokens"] += prompt_stats["prompt_tokens"]
+  stats["model_prompt_tokens"] += res_json.get("prompt_token_count", 0)
+  stats["model_generation_tokens"] += res_json.get("generation_token_count", 0)
+
+
+###################################################################
+#
+# choose_mode:
+#
+def choose_mode(mode, articles, threshold=DEFAULT_MAPREDUCE_THRESHOLD):
+  """
+  Resolves "auto" to "single" or "mapreduce" for these articles;
+  other modes are returned as is
+  """
+  if mode != "auto":
+    return mode
+
+  if len(articles) > 1 and sum(prompting.count_tokens(a) for a in articles) > threshold:
+    return "mapreduce"
+
+  return "single"
+
+
+###################################################################
+#
+# summarize_single:
+#
+def summarize_single(client, articles, budget, params, on_text=None):
+  """
+  Writes the script with a single prompt over all the articles
+
+  Parameters
+  ----------
+  client : boto3 bedrock-runtime client,
+  articles : list of article texts,
+  budget : input token budget for the prompt,
+  params : dict of sampling parameters,
+  on_text : optional function to stream the script to, see the
+            top of the file
+
+  Returns
+  -------
+  (script, stats)
+  """
+  start = time.perf_counter()
+  stats = _new_stats("single")
+
+  prompt, prompt_stats = prompting.build_prompt(articles, budget)
+  print("prompt:", prompt_stats)
+
+  res_json = _invoke_final(client, prompt, params, on_text, stats, start)
+  _add_call(stats, prompt_stats, res_json)
+
+  stats["articles"] = prompt_stats["articles"]
+  stats["truncated_articles"] = prompt_stats["truncated_articles"]
+
+  return res_json['generation'], stats
+
+
+###################################################################
+#
+# summarize_map_reduce:
+#
+def summarize_map_reduce(client, articles, budget, params, max_workers=DEFAULT_MAP_WORKERS, on_text=None):
+  """
+  Summarizes each article concurrently (map), then writes the
+  script from the summaries (reduce)
+
+  Parameters
+  ----------
+  client : boto3 bedrock-runtime client (thread-safe),
+  articles : list of article texts,
+  budget : input token budget, per call,
+  params : dict of sampling parameters for the final call,
+  max_workers : max # of concurrent Bedrock calls,
+  on_text : optional function to stream the script to (only the
+            reduce call is streamed)
+
+  Returns
+  -------
+  (script, stats)
+  """
+  start = time.perf_counter()
+  stats = _new_stats("mapreduce")
+  map_params = dict(params, max_gen_len=MAP_MAX_GEN_LEN)
+
+  def summarize_one(article):
+    prompt, prompt_stats = prompting.build_map_prompt(article, budget)
+    return prompt_stats, invoke(client, prompt, map_params)
+
+  with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+    results = list(pool.map(summarize_one, articles))
+
+  summaries = []
+  for prompt_stats, res_json in results:
+    _add_call(stats, prompt_stats, res_json)
+    stats["truncated_articles"] += prompt_stats["truncated_articles"]
+    summaries.append(res_json['generation'].strip())
+
+  print("map: summarized", len(summaries), "articles")
+
+  prompt, prompt_stats = prompting.build_prompt(summaries, budget)
+  print("reduce prompt:", prompt_stats)
+
+  res_json = _invoke_final(client, prompt, params, on_text, stats, start)
+  _add_call(stats, prompt_stats, res_json)
+
+  stats["articles"] = len(articles)
+
+  return res_json['generation'], stats
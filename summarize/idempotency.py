@@ -0,0 +1,218 @@
+#
+# idempotency.py
+#
+# Idempotency keys for the POST endpoints (/fetch, /summarize,
+# /podcast, /pipeline): a client that sends an Idempotency-Key
+# header (any unique string, e.g. a UUID) can safely retry the
+# request with the same key after a network failure. The first
+# request with a key does the work and its response is stored
+# (table idempotency); a repeat gets that response back without
+# the work being done again, and a repeat that arrives while the
+# first is still running waits for it.
+#
+# A replayed response that delivers audio gets a new presigned
+# URL (the stored one may have expired).
+#
+# Server errors (5xx) and "try again later" answers (RETRYABLE,
+# e.g. 409 while another request generates the script) are not
+# stored, so a retry of such a request tries again. A key used
+# for a different request (another endpoint, target or options)
+# is rejected with 422.
+# Keys are kept for [idempotency] ttl seconds; a request still
+# running after lease seconds (it crashed or timed out) is
+# forgotten, so its key can be used again, and a repeat waits at
+# most wait seconds ([idempotency] lease and wait, defaulting to
+# the [leases] ones, see runtime.py).
+#
+
+import hashlib
+import json
+import time
+
+import artifacts
+import datatier
+import runtime
+
+
+HEADER = "idempotency-key"
+MAX_KEY_LENGTH = 255
+
+DEFAULT_TTL = 24 * 3600
+
+# statuses that are not a final outcome, besides 5xx:
+RETRYABLE = [408, 409, 425, 429]
+
+# seconds between two looks at a request still running:
+DEFAULT_POLL_INTERVAL = 0.2
+
+
+###################################################################
+#
+# get_key:
+#
+def get_key(event):
+  """
+  Returns the Idempotency-Key header of a request event, or None
+  (header names are case-insensitive, and API Gateway passes
+  them on as sent, or lowercased)
+  """
+  headers = event.get("headers") or {}
+
+  for name, value in headers.items():
+    if name.lower() == HEADER and value and value.strip():
+      return value.strip()
+
+  return None
+
+
+###################################################################
+#
+# once:
+#
+def once(dbConn, event, request, work):
+  """
+  Runs a request once per Idempotency-Key: if the event has no
+  key, calls work(); else returns the stored response of the
+  first request with the key, waiting for it if it is still
+  running, or calls work() and stores its response
+
+  Parameters
+  ----------
+  dbConn : database connection,
+  event : the lambda's event (for the header),
+  request : JSON-serializable description of the request, e.g.
+            ["fetch", query, params]; a key may only be reused
+            for the same request,
+  work : function doing the request, returning (statusCode, body)
+
+  Returns
+  -------
+  (statusCode, body): the HTTP status and the response body (dict)
+  """
+  key = get_key(event)
+  if key is None:
+    return work()
+
+  if len(key) > MAX_KEY_LENGTH:
+    return 400, {"error": "Idempotency-Key must be at most " + str(MAX_KEY_LENGTH) + " characters"}
+
+  configur = runtime.get_config()
+  ttl = configur.getint('idempotency', 'ttl', fallback=DEFAULT_TTL)
+  lease = runtime.get_lease('idempotency')
+  wait = runtime.get_wait('idempotency')
+  interval = configur.getfloat('idempotency', 'poll_interval', fallback=DEFAULT_POLL_INTERVAL)
+
+  # fixed-size keys whatever the client sends:
+  idemkey = hashlib.sha256(key.encode("utf-8")).hexdigest()
+  fingerprint = hashlib.sha256(json.dumps(request, sort_keys=True).encode("utf-8")).hexdigest()
+
+  replay = _begin(dbConn, idemkey, fingerprint, ttl, lease, wait, interval)
+  if replay is not None:
+    print("Idempotency-Key seen before, returning the first response:", replay[0])
+    return replay
+
+  try:
+    statusCode, body = work()
+  except Exception:
+    _forget(dbConn, idemkey)
+    raise
+
+  if statusCode >= 500 or statusCode in RETRYABLE:
+    _forget(dbConn, idemkey)
+  else:
+    _store(dbConn, idemkey, statusCode, body, ttl)
+
+  return statusCode, body
+
+
+###################################################################
+#
+# _begin:
+#
+# Claims the key with an INSERT IGNORE (only one request can
+# insert it), else waits for the request that did.
+#
+def _begin(dbConn, idemkey, fingerprint, ttl, lease, wait, interval):
+  """
+  Returns None if this request now owns the key, else the
+  response (statusCode, body) to give
+  """
+  deadline = time.monotonic() + wait
+
+  while True:
+    sql = "INSERT IGNORE INTO idempotency(idemkey, request) VALUES(%s, %s);"
+    if datatier.perform_action(dbConn, sql, [idemkey, fingerprint]) == 1:
+      return None
+
+    #
+    # the INSERT committed, so this read sees the latest state,
+    # not an old snapshot:
+    #
+    sql = """
+    SELECT request, state, statuscode, response,
+           created < NOW() - INTERVAL %s SECOND,
+           state = 'running' AND created < NOW() - INTERVAL %s SECOND
+      FROM idempotency
+     WHERE idemkey = %s;
+    """
+    row = datatier.retrieve_one_row(dbConn, sql, [ttl, lease, idemkey])
+    if row == ():  # forgotten meanwhile, try again
+      continue
+
+    request, state, statuscode, response, expired, abandoned = row
+
+    if expired or abandoned:
+      sql = "DELETE FROM idempotency WHERE idemkey = %s AND created < NOW() - INTERVAL %s SECOND;"
+      datatier.perform_action(dbConn, sql, [idemkey, ttl if expired else lease])
+      continue
+
+    if request != fingerprint:
+      return 422, {"error": "Idempotency-Key was already used for a different request"}
+
+    if state == "done":
+      # a presigned URL in it may have expired since (url_ttl is
+      # shorter than ttl):
+      body = json.loads(response)
+      if "audiourl" in body:
+        body = artifacts.resign_url(runtime.get_bucket(), body)
+      return statuscode, body
+
+    if time.monotonic() >= deadline:
+      return 409, {"error": "a request with this Idempotency-Key is still in progress, retry later"}
+
+    time.sleep(interval)
+
+
+###################################################################
+#
+# _store:
+#
+# Records the response, and deletes the keys older than ttl while
+# at it (like resultcache.store does).
+#
+def _store(dbConn, idemkey, statusCode, body, ttl):
+  with datatier.transaction(dbConn):
+    sql = """
+    UPDATE idempotency SET state = 'done', statuscode = %s, response = %s
+     WHERE idemkey = %s;
+    """
+    datatier.perform_action(dbConn, sql, [statusCode, json.dumps(body), idemkey], commit=False)
+
+    sql = "DELETE FROM idempotency WHERE created < NOW() - INTERVAL %s SECOND;"
+    datatier.perform_action(dbConn, sql, [ttl], commit=False)
+
+
+###################################################################
+#
+# _forget:
+#
+# Drops the key of a request that failed, so a retry does the
+# work. Best effort: an error is printed, not raised (the lease
+# runs out anyway).
+#
+def _forget(dbConn, idemkey):
+  try:
+    sql = "DELETE FROM idempotency WHERE idemkey = %s AND state = 'running';"
+    datatier.perform_action(dbConn, sql, [idemkey])
+  except Exception as err:
+    print("idempotency._forget() failed:", str(err))
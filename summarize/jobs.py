@@ -0,0 +1,228 @@
+#
+# jobs.py
+#
+# Asynchronous jobs: instead of doing the work while the client
+# waits, a POST with ?async=true (or [jobs] async = true in the
+# config) records a job in the jobs table, sends its id to a
+# queue (SQS, [jobs] queue_url) and answers 202 Accepted with the
+# job id at once. The job_worker lambda, fed by the queue, runs
+# the job and stores its result; GET /jobs/{jobid} (job_status)
+# reports its state and the status of its query (the
+# queries.status states: "gathered articles", "summarizing",
+# "generated script", "synthesizing", "generated audio") as it
+# progresses.
+#
+# Queues deliver a message at least once, so a job is claimed
+# (queued => running) with a conditional UPDATE before it is run,
+# and a duplicate delivery finds it already claimed. A job left
+# running longer than the lease ([jobs] lease, defaulting to
+# [leases] lease, see runtime.py; the worker timed out or crashed)
+# can be claimed again.
+#
+# A finished podcast or pipeline job's result gets a new presigned
+# audio URL every time it is read, valid for expires_in seconds
+# from then.
+#
+# A job whose query another request is working on (its stage
+# answers 409) is not finished with that answer: it is queued
+# again, to run after [jobs] retry_delay seconds. The other
+# request's claim ends within its lease, so the job does run.
+#
+
+import json
+
+import artifacts
+import datatier
+import runtime
+
+
+KINDS = ["fetch", "summarize", "podcast", "pipeline"]
+
+# seconds before a job found busy (409) is run again (SQS delays
+# a message by at most 900):
+DEFAULT_RETRY_DELAY = 30
+
+
+###################################################################
+#
+# wants_async:
+#
+def wants_async(params):
+  """
+  Should this request run as a job? ?async=true|false, else
+  [jobs] async in the config (default false)
+  """
+  if "async" in params:
+    return params["async"].lower() in ["1", "true", "yes"]
+
+  return runtime.get_config().getboolean('jobs', 'async', fallback=False)
+
+
+###################################################################
+#
+# submit:
+#
+def submit(dbConn, kind, target, params):
+  """
+  Records a job and queues it for the worker
+
+  Parameters
+  ----------
+  dbConn : database connection,
+  kind : one of KINDS,
+  target : the query text (fetch, pipeline) or the queryid
+           (summarize, podcast),
+  params : the request's options (dict), passed on to the stage
+
+  Returns
+  -------
+  the 202 response body (dict): jobid, state and location
+  """
+  queryid = int(target) if kind in ["summarize", "podcast"] and str(target).isdigit() else 0
+
+  sql = """
+  INSERT INTO jobs(kind, target, params, queryid, state)
+            VALUES(%s, %s, %s, %s, 'queued');
+  """
+  jobid = datatier.perform_insert(dbConn, sql, [kind, str(target), json.dumps(params), queryid])
+  print("jobid:", jobid)
+
+  _send(dbConn, jobid)
+
+  return {"jobid": jobid, "state": "queued", "location": "/jobs/" + str(jobid)}
+
+
+###################################################################
+#
+# _send:
+#
+# Sends a job's id to the queue; if that fails, the job fails
+# (nothing would ever run it).
+#
+def _send(dbConn, jobid, delay=0):
+  try:
+    queue_url = runtime.get_config().get('jobs', 'queue_url')
+    runtime.get_client("sqs").send_message(QueueUrl=queue_url, MessageBody=json.dumps({"jobid": jobid}),
+                                           DelaySeconds=delay)
+  except Exception as err:
+    finish(dbConn, jobid, 500, {"error": "could not queue job: " + str(err)})
+    raise
+
+
+###################################################################
+#
+# claim:
+#
+def claim(dbConn, jobid):
+  """
+  Marks a queued job (or one whose lease has run out) as running
+
+  Returns
+  -------
+  the job as a dict (jobid, kind, target, params), or None if
+  there is no such job or it is done or being run by someone else
+  """
+  if not datatier.compare_and_set(dbConn, "jobs", {"jobid": jobid}, "state", "queued", "running",
+                                  lease_column="updated", lease=runtime.get_lease('jobs')):
+    return None
+
+  sql = "SELECT kind, target, params FROM jobs WHERE jobid = %s;"
+  row = datatier.retrieve_one_row(dbConn, sql, [jobid])
+
+  return {"jobid": jobid, "kind": row[0], "target": row[1], "params": json.loads(row[2])}
+
+
+###################################################################
+#
+# requeue:
+#
+def requeue(dbConn, jobid):
+  """
+  Puts a running job back in the queue, to run again after
+  [jobs] retry_delay seconds
+  """
+  delay = runtime.get_config().getint('jobs', 'retry_delay', fallback=DEFAULT_RETRY_DELAY)
+
+  sql = "UPDATE jobs SET state = 'queued', updated = NOW() WHERE jobid = %s AND state = 'running';"
+  datatier.perform_action(dbConn, sql, [jobid])
+
+  _send(dbConn, jobid, min(delay, 900))
+
+
+###################################################################
+#
+# set_queryid:
+#
+def set_queryid(dbConn, jobid, queryid):
+  """
+  Records the query a job works on, once it is known (fetch and
+  pipeline jobs create it), so its status shows the progress
+  """
+  sql = "UPDATE jobs SET queryid = %s, updated = NOW() WHERE jobid = %s;"
+  datatier.perform_action(dbConn, sql, [queryid, jobid])
+
+
+###################################################################
+#
+# finish:
+#
+def finish(dbConn, jobid, statusCode, body):
+  """
+  Stores the result of a job: state done (status 200) or failed,
+  the HTTP status and the response body (dict)
+  """
+  state = "done" if statusCode == 200 else "failed"
+
+  sql = """
+  UPDATE jobs SET state = %s, statuscode = %s, result = %s, updated = NOW()
+   WHERE jobid = %s;
+  """
+  datatier.perform_action(dbConn, sql, [state, statusCode, json.dumps(body), jobid])
+
+  if statusCode == 200 and body.get("queryid"):
+    set_queryid(dbConn, jobid, body["queryid"])
+
+
+###################################################################
+#
+# get:
+#
+def get(dbConn, jobid):
+  """
+  Returns a job's progress as a dict, or None if there is no
+  such job: jobid, kind, state (queued, running, done or
+  failed), queryid and status (the query's queries.status, once
+  there is a query), and when finished statusCode and result
+  (the response the synchronous call would have given)
+  """
+  sql = """
+  SELECT j.kind, j.state, j.queryid, q.status, j.statuscode, j.result, j.created, j.updated
+    FROM jobs j LEFT JOIN queries q ON q.queryid = j.queryid
+   WHERE j.jobid = %s;
+  """
+  row = datatier.retrieve_one_row(dbConn, sql, [jobid])
+  if row == ():
+    return None
+
+  kind, state, queryid, status, statuscode, result, created, updated = row
+
+  job = {
+    "jobid": int(jobid),
+    "kind": kind,
+    "state": state,
+    "queryid": queryid or None,
+    "status": status,
+    "created": str(created),
+    "updated": str(updated)
+  }
+
+  if state in ["done", "failed"]:
+    job["statusCode"] = statuscode
+    job["result"] = json.loads(result)
+
+    # the result's presigned URL has expired if the job finished
+    # more than url_ttl ago:
+    if "audiourl" in job["result"]:
+      job["result"] = artifacts.resign_url(runtime.get_bucket(), job["result"])
+
+  return job
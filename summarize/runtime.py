@@ -0,0 +1,195 @@
+#
+# runtime.py
+#
+# Per-container setup shared by the lambdas: the parsed config
+# file, the boto3 sessions, the S3 bucket and service clients, and
+# the database connection are created on first use and kept at
+# module scope, so warm invocations reuse them instead of paying
+# for them on every call (building an S3 resource alone takes
+# ~100 ms of CPU).
+#
+# S3 is accessed with the s3readwrite profile from the config
+# file, through a session of its own. Other services (Polly,
+# Bedrock) use the default credentials, i.e. the lambda's role,
+# as they did when their clients were created at import time;
+# the default boto3 session is no longer changed.
+#
+# boto3 takes 100-200 ms to import, so it is imported lazily (see
+# lazy_import): handlers that only touch MySQL never load it, and
+# the others load it on their first get_bucket or get_client.
+#
+
+import importlib.util
+import os
+import sys
+
+from configparser import ConfigParser
+
+import datatier
+
+
+CONFIG_FILE = 'podcast-config.ini'
+S3_PROFILE = 's3readwrite'
+
+#
+# work in progress is claimed in the database (a query's stage,
+# see claims.py; an Idempotency-Key, idempotency.py; a job,
+# jobs.py), and every kind of claim has the same two settings,
+# [leases] lease and wait unless its own section overrides them
+# (see get_lease, get_wait):
+#
+# seconds before a claim is considered abandoned (its owner
+# crashed or timed out): at least the lambdas' timeout
+DEFAULT_LEASE = 900
+
+# seconds a request waits for work claimed by another one (API
+# Gateway gives up on a request after 29):
+DEFAULT_WAIT = 25
+
+_config = None
+_s3_session = None
+_bucket = None
+_clients = {}
+
+
+###################################################################
+#
+# lazy_import:
+#
+def lazy_import(name):
+  """
+  Returns a module whose code runs on first attribute access,
+  instead of now; raises ImportError now if it is not installed
+
+  Parameters
+  ----------
+  name : module name (e.g. "boto3")
+
+  Returns
+  -------
+  the module (loaded later, when first used)
+  """
+  if name in sys.modules:
+    return sys.modules[name]
+
+  spec = importlib.util.find_spec(name)
+  if spec is None:
+    raise ModuleNotFoundError("No module named " + repr(name), name=name)
+
+  loader = importlib.util.LazyLoader(spec.loader)
+  spec.loader = loader
+  module = importlib.util.module_from_spec(spec)
+  sys.modules[name] = module
+  loader.exec_module(module)
+  return module
+
+
+boto3 = lazy_import("boto3")
+
+
+###################################################################
+#
+# get_config:
+#
+def get_config():
+  """
+  Returns the parsed config file (a ConfigParser), read once per
+  container
+  """
+  global _config
+
+  if _config is None:
+    # the profiles for boto3 are in the same file:
+    os.environ['AWS_SHARED_CREDENTIALS_FILE'] = CONFIG_FILE
+
+    configur = ConfigParser()
+    configur.read(CONFIG_FILE)
+    _config = configur
+
+  return _config
+
+
+###################################################################
+#
+# get_lease:
+#
+def get_lease(section):
+  """
+  Returns the lease of a kind of claim, in seconds: [section]
+  lease, else [leases] lease, else DEFAULT_LEASE
+  """
+  configur = get_config()
+  lease = configur.getint('leases', 'lease', fallback=DEFAULT_LEASE)
+
+  return configur.getint(section, 'lease', fallback=lease)
+
+
+###################################################################
+#
+# get_wait:
+#
+def get_wait(section):
+  """
+  Returns how long a request waits for a claimed result, in
+  seconds: [section] wait, else [leases] wait, else DEFAULT_WAIT
+  """
+  configur = get_config()
+  wait = configur.getfloat('leases', 'wait', fallback=DEFAULT_WAIT)
+
+  return configur.getfloat(section, 'wait', fallback=wait)
+
+
+###################################################################
+#
+# get_bucket:
+#
+def get_bucket():
+  """
+  Returns the boto3 Bucket resource for the [s3] bucket_name
+  bucket, with the s3readwrite profile's credentials
+  """
+  global _s3_session, _bucket
+
+  if _bucket is None:
+    configur = get_config()
+
+    _s3_session = boto3.session.Session(profile_name=S3_PROFILE)
+    s3 = _s3_session.resource('s3')
+    _bucket = s3.Bucket(configur.get('s3', 'bucket_name'))
+
+  return _bucket
+
+
+###################################################################
+#
+# get_client:
+#
+def get_client(service):
+  """
+  Returns a boto3 client for a service (e.g. "polly"), with the
+  default credentials (the lambda's role); clients are
+  thread-safe and shared
+  """
+  if service not in _clients:
+    get_config()
+    _clients[service] = boto3.client(service)
+
+  return _clients[service]
+
+
+###################################################################
+#
+# get_dbConn:
+#
+def get_dbConn():
+  """
+  Returns an open connection to the [rds] database, from the
+  pool in datatier (give it back with datatier.release_dbConn)
+  """
+  configur = get_config()
+
+  return datatier.get_dbConn(configur.get('rds', 'endpoint'),
+                             configur.getint('rds', 'port_number'),
+                             configur.get('rds', 'user_name'),
+                             configur.get('rds', 'user_pwd'),
+                             configur.get('rds', 'db_name'))
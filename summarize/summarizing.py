@@ -0,0 +1,368 @@
+#
+# summarizing.py
+#
+# The summarize stage: turns the combined article text of a query
+# into a podcast script using Llama 3.3 70B Instruct via Amazon
+# Bedrock, stores the script in S3, and records its key and the
+# new status in the database. Repeat generations come from the
+# result cache.
+#
+# Used by the summarize lambda (POST/GET /summarize/{queryid}) and
+# by the pipeline lambda, which already has the article text in
+# memory and passes it in, so it is not downloaded again.
+#
+# Concurrent requests for the same query's script share one
+# generation: the query is claimed ("summarizing") by the first,
+# and the others wait for its script (see claims.py).
+#
+
+import time
+
+import artifacts
+import claims
+import datatier
+import extractive
+import generation
+import metrics
+import partials
+import prompting
+import resultcache
+import runtime
+
+
+# bump whenever the prompt text (prompting.py) changes, so cached
+# scripts made from the old prompt are not reused:
+PROMPT_VERSION = 2
+
+GENERATION_PARAMS = {
+  "max_gen_len": 512,
+  "temperature": 0.5,
+  "top_p": 0.9
+}
+
+# statuses of a query that has its script (scriptkey is set):
+SCRIPT_STATUSES = ["generated script", "synthesizing", "generated audio"]
+
+# generated scripts are reused for [cache] script_ttl seconds, and
+# at most [cache] script_max_entries are kept:
+DEFAULT_SCRIPT_TTL = 7 * 24 * 3600
+DEFAULT_SCRIPT_MAX_ENTRIES = 10000
+
+
+###################################################################
+#
+# parse_options:
+#
+def parse_options(params):
+  """
+  Reads a request's generation options, each from the request
+  (?extractive=R, ?mode=..., ?stream=true) or else the config
+  file
+
+  Returns
+  -------
+  (options, error): a dict with extractive_ratio, mode and stream,
+  and None; or None and the 400 response body for a bad option
+  """
+  configur = runtime.get_config()
+
+  #
+  # optional extractive compression: keep only this fraction
+  # of each article (its most central sentences) before it
+  # goes to the model
+  #
+  try:
+    extractive_ratio = float(params.get("extractive", configur.getfloat('summarize', 'extractive_ratio', fallback=extractive.DEFAULT_RATIO)))
+  except ValueError:
+    return None, {"error": "extractive must be a number between 0 and 1"}
+  if not 0 < extractive_ratio < 1:
+    extractive_ratio = 0  # disabled
+
+  #
+  # single prompt, or map-reduce over the articles:
+  #
+  mode = params.get("mode", configur.get('summarize', 'mode', fallback=generation.DEFAULT_MODE))
+  if mode not in generation.MODES:
+    return None, {"error": "mode must be one of " + ", ".join(generation.MODES)}
+
+  #
+  # stream the script from Bedrock, saving the text so far to
+  # S3 for GET polls:
+  #
+  if "stream" in params:
+    stream = params["stream"].lower() in ["1", "true", "yes"]
+  else:
+    stream = configur.getboolean('summarize', 'stream', fallback=False)
+
+  return {"extractive_ratio": extractive_ratio, "mode": mode, "stream": stream}, None
+
+
+###################################################################
+#
+# summarize:
+#
+def summarize(dbConn, queryid, params, method="POST", article_text=None):
+  """
+  Generates the podcast script for a query, or returns the one it
+  already has (or waits for the one another request is generating);
+  a GET returns the script so far instead
+
+  Parameters
+  ----------
+  dbConn : database connection,
+  queryid : the query's id,
+  params : request options (dict), e.g. {"mode": "mapreduce"},
+  method : "POST" to generate, "GET" to poll,
+  article_text : the query's combined article text, if the caller
+                 has it (else it is downloaded from S3)
+
+  Returns
+  -------
+  (statusCode, body): the HTTP status and the response body (dict)
+  """
+  # config and bucket are set up once per container (the Bedrock
+  # client too, on the first cache miss):
+  configur = runtime.get_config()
+  bucket = runtime.get_bucket()
+
+  print("Getting textkey from database")
+  sql = "SELECT querytext, status, textkey, scriptkey from queries where queryid = %s;"
+
+  row = datatier.retrieve_one_row(dbConn, sql, [queryid])
+
+  if row == ():  # no such query
+    return 400, {"error": "no such query" + str(queryid)}
+
+  querytext = row[0]
+  status = row[1]
+  textkey = row[2]
+  scriptkey = row[3]
+
+  print("querytext:", querytext)
+  print("status:", status)
+  print("textkey:", textkey)
+  print("scriptkey:", scriptkey)
+
+  #
+  # GET polls for the script while a streamed generation
+  # (POST ?stream=true) is running: the text so far, and
+  # done=true once the whole script is saved
+  #
+  if method == "GET":
+    if status in SCRIPT_STATUSES:
+      script = artifacts.get_text(bucket, scriptkey)
+      return 200, {"scriptkey": scriptkey, "script": script, "done": True}
+    if status in ["gathered articles", "summarizing"]:
+      script = partials.read_partial(bucket, partials.partial_key(queryid))
+      return 200, {"script": script, "done": False}
+
+  #
+  # a bad option is rejected now, not after waiting for (or
+  # claiming) the query:
+  #
+  options, error = parse_options(params)
+  if error is not None:
+    return 400, error
+
+  if status not in SCRIPT_STATUSES + ["gathered articles", "summarizing"]:
+    return 400, {"error": "No articles content available, status: " + status}
+  if status in SCRIPT_STATUSES:
+    # e.g. a query reused from the fetch cache, podcast and all
+    print("Script already generated, status:", status)
+    script = artifacts.get_text(bucket, scriptkey)
+    return 200, {"scriptkey": scriptkey, "script": script}
+
+  #
+  # one request at a time generates a query's script; if another
+  # one is at it, wait for its script instead of generating it
+  # again
+  #
+  claimed, status = claims.claim_or_wait(dbConn, queryid, "gathered articles", "summarizing")
+
+  if not claimed:
+    if status in SCRIPT_STATUSES:
+      print("Script generated by another request")
+      return summarize(dbConn, queryid, params, method)
+    if status == "summarizing":
+      return 409, {"error": "script is being generated by another request, GET /summarize/" + str(queryid) + " to poll it", "status": status}
+    return 400, {"error": "No articles content available, status: " + str(status)}
+
+  #
+  # a poll must not show the partial script of an earlier attempt
+  # that failed, so it goes when the generation is claimed, and
+  # when it is released:
+  #
+  partialkey = partials.partial_key(queryid)
+  partials.delete_partial(bucket, partialkey)
+
+  try:
+    statusCode, body = generate_script(dbConn, queryid, textkey, options, article_text)
+  except Exception:
+    partials.delete_partial(bucket, partialkey)
+    claims.release(dbConn, queryid, "summarizing", "gathered articles")
+    raise
+
+  if statusCode != 200:
+    partials.delete_partial(bucket, partialkey)
+    claims.release(dbConn, queryid, "summarizing", "gathered articles")
+
+  return statusCode, body
+
+
+###################################################################
+#
+# generate_script:
+#
+def generate_script(dbConn, queryid, textkey, options, article_text=None):
+  """
+  Generates the script of a query claimed by this request (status
+  "summarizing"), or takes it from the result cache, and records
+  it (status "generated script")
+
+  Parameters
+  ----------
+  dbConn : database connection,
+  queryid : the query's id,
+  textkey : S3 key of its combined article text,
+  options : generation options (dict, from parse_options),
+  article_text : the combined article text, if the caller has it
+
+  Returns
+  -------
+  (statusCode, body): the HTTP status and the response body (dict)
+  """
+  configur = runtime.get_config()
+  bucket = runtime.get_bucket()
+
+  if article_text is None:
+    #
+    print("Downloading combined articles text from S3")
+    #
+    article_text = artifacts.get_text(bucket, textkey)
+  articles = prompting.split_articles(article_text)
+
+  if not articles:
+    return 400, {"error": "No articles text was found in s3"}
+
+  input_token_budget = configur.getint('summarize', 'input_token_budget', fallback=prompting.DEFAULT_INPUT_TOKEN_BUDGET)
+
+  extractive_ratio = options["extractive_ratio"]
+  mode = options["mode"]
+  stream = options["stream"]
+
+  mapreduce_threshold = configur.getint('summarize', 'mapreduce_threshold', fallback=input_token_budget)
+  map_workers = configur.getint('summarize', 'map_workers', fallback=generation.DEFAULT_MAP_WORKERS)
+
+  partial_interval = configur.getfloat('summarize', 'partial_interval', fallback=partials.DEFAULT_INTERVAL)
+
+  script_ttl = configur.getint('cache', 'script_ttl', fallback=DEFAULT_SCRIPT_TTL)
+  script_max_entries = configur.getint('cache', 'script_max_entries', fallback=DEFAULT_SCRIPT_MAX_ENTRIES)
+
+  mode = generation.choose_mode(mode, articles, mapreduce_threshold)
+
+  #
+  # has this exact generation been done before (same model,
+  # prompt, articles and sampling parameters)?
+  #
+  cachekey = resultcache.make_key({
+    "modelId": generation.modelId,
+    "mode": mode,
+    "prompt_version": PROMPT_VERSION,
+    "text": article_text,
+    "input_token_budget": input_token_budget,
+    "extractive_ratio": extractive_ratio,
+    "params": GENERATION_PARAMS
+  })
+
+  cached = resultcache.lookup(dbConn, 'script', cachekey, script_ttl)
+
+  if cached is not None:
+    scriptkey, latency_saved = cached
+    print("Generation cache hit, scriptkey:", scriptkey)
+    res_text = artifacts.get_text(bucket, scriptkey)
+
+    sql = "UPDATE queries SET status = %s, scriptkey = %s WHERE queryid = %s;"
+    datatier.perform_action(dbConn, sql, ["generated script", scriptkey, queryid])
+
+    metrics.emit("summarize", {
+      "GenerationCacheHit": (1, "Count"),
+      "GenerationLatencySaved": (latency_saved, "Milliseconds")
+    })
+
+    return 200, {"scriptkey": scriptkey, "script": res_text, "cache": "hit", "latency_saved_ms": latency_saved}
+
+  if extractive_ratio > 0:
+    start = time.perf_counter()
+    compressed = extractive.compress_articles(articles, extractive_ratio)
+    print("Extractive compression: {} => {} chars in {:.1f} ms".format(
+      sum(len(a) for a in articles), sum(len(a) for a in compressed), 1000 * (time.perf_counter() - start)))
+    articles = compressed
+
+  # invoke the Bedrock model
+  print("Invoking Bedrock model, mode:", mode, "stream:", stream)
+  partial = None
+  on_text = None
+  if stream:
+    partial = partials.PartialScript(bucket, partials.partial_key(queryid), partial_interval)
+    on_text = partial.append
+
+  bedrock_client = runtime.get_client("bedrock-runtime")
+  start = time.perf_counter()
+
+  try:
+    if mode == "mapreduce":
+      res_text, gen_stats = generation.summarize_map_reduce(bedrock_client, articles, input_token_budget, GENERATION_PARAMS, map_workers, on_text)
+    else:
+      res_text, gen_stats = generation.summarize_single(bedrock_client, articles, input_token_budget, GENERATION_PARAMS, on_text)
+  except Exception:
+    if partial is not None:
+      partial.abort()
+    raise
+
+  latency = int(1000 * (time.perf_counter() - start))
+
+  if partial is not None:
+    # so polls see the whole script until the status changes:
+    partial.flush()
+    print("Partial script writes:", partial.writes)
+
+  print("Generation:", gen_stats)
+
+  print ("res_text:", res_text)
+
+  print ("Uploading podcast script txt file to S3")
+
+  scriptkey = artifacts.artifact_key("summaries", res_text, ext=".txt")
+  if artifacts.put_text_if_absent(bucket, scriptkey, res_text):
+    print ("Uploaded txt file with podcast script")
+  else:
+    print ("Identical script already in S3")
+  print ("scriptkey:", scriptkey)
+
+  resultcache.store(dbConn, 'script', cachekey, scriptkey, latency, script_ttl, script_max_entries)
+
+  #
+  # prompt size next to model latency, for each request;
+  # Bedrock also reports the real token counts:
+  #
+  metrics.emit("summarize", {
+    "GenerationCacheHit": (0, "Count"),
+    "GenerationLatency": (latency, "Milliseconds"),
+    "TimeToFirstToken": (gen_stats["ttft_ms"], "Milliseconds"),
+    "PromptTokens": (gen_stats["prompt_tokens"], "Count"),
+    "ModelPromptTokens": (gen_stats["model_prompt_tokens"], "Count"),
+    "ModelGenerationTokens": (gen_stats["model_generation_tokens"], "Count"),
+    "ModelCalls": (gen_stats["calls"], "Count")
+  }, {
+    "queryid": queryid,
+    "mode": mode,
+    "stream": stream,
+    "articles": gen_stats["articles"],
+    "truncated_articles": gen_stats["truncated_articles"]
+  })
+
+  print ("Updating database with podcast script key and new status")
+  sql = "UPDATE queries SET status = %s, scriptkey = %s WHERE queryid = %s;"
+  datatier.perform_action(dbConn, sql, ["generated script", scriptkey, queryid])
+
+  return 200, {"scriptkey": scriptkey, "script": res_text, "cache": "miss", "ttft_ms": gen_stats["ttft_ms"]}
@@ -0,0 +1,91 @@
+#
+# conftest.py
+#
+# The tests run the stage modules against the local stand-ins of
+# benchmarks/standins.py (SQLite for MySQL, in-memory S3, Bedrock
+# and Polly, canned Guardian results), with no simulated latency.
+# The pipeline lambda's directory has copies of every stage and
+# shared module, so that is where they are imported from.
+#
+# Usage: python -m pytest tests
+#
+
+import glob
+import os
+import sys
+import types
+
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root, "benchmarks"))
+sys.path.insert(0, os.path.join(root, "pipeline"))
+
+import standins
+
+standins.install_pymysql_standin(handshake=0, rtt=0, schema=standins.SCHEMA)
+
+import datatier
+import guardian
+import htmltext
+import runtime
+
+CONFIG = """
+[s3]
+bucket_name = bucket
+
+[rds]
+endpoint = db
+port_number = 3306
+user_name = admin
+user_pwd = secret
+db_name = podcastgenerator
+
+[guardian]
+api_key = test
+
+[polly]
+segment_cache = false
+"""
+
+texts = [htmltext.extract_text_stream(open(f, encoding="utf-8").read())
+         for f in sorted(glob.glob(os.path.join(root, "benchmarks", "fixtures", "guardian_*.html")))]
+
+
+@pytest.fixture
+def stack(tmp_path, monkeypatch):
+  """
+  A fresh database, bucket, Bedrock and Polly for each test;
+  the Guardian search returns the fixture articles, with the
+  topic in the text (or search.pages, if set: lists of texts)
+  """
+  monkeypatch.chdir(tmp_path)
+  (tmp_path / "podcast-config.ini").write_text(CONFIG)
+
+  datatier.close_pool()
+  standins.install_pymysql_standin(handshake=0, rtt=0, schema=standins.SCHEMA)
+  monkeypatch.setattr(datatier, "pymysql", sys.modules["pymysql"])
+
+  s = types.SimpleNamespace(
+    bucket=standins.FakeBucket(latency=0, bandwidth=1e12),
+    bedrock=standins.FakeBedrock(overhead=0, per_input_token=0, per_output_token=0),
+    polly=standins.FakePolly(overhead=0, per_char=0),
+    searches=0,
+    pages=None)
+
+  monkeypatch.setattr(runtime, "_config", None)
+  monkeypatch.setattr(runtime, "_bucket", s.bucket)
+  monkeypatch.setattr(runtime, "_clients", {"bedrock-runtime": s.bedrock, "polly": s.polly})
+
+  def search_articles(api_key, query, extractor, count=guardian.DEFAULT_COUNT, **kwargs):
+    s.searches += 1
+    bodies = s.pages or ["About " + query + ". " + texts[i % len(texts)] for i in range(count)]
+    return [({"id": "world/" + query + "/" + str(i), "fields": {"headline": query + " headline " + str(i)}}, body)
+            for i, body in enumerate(bodies[:count])]
+
+  monkeypatch.setattr(guardian, "search_articles", search_articles)
+
+  s.dbConn = runtime.get_dbConn()
+  yield s
+  datatier.release_dbConn(s.dbConn)
+  datatier.close_pool()
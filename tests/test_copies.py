@@ -0,0 +1,48 @@
+#
+# Every lambda is deployed from its own directory, so the shared
+# modules (at the top of the repo) and the stage modules (in the
+# lambda they belong to) are copied into each lambda that uses
+# them. The tests import the pipeline/ copies only: this checks
+# that no copy has drifted from its original.
+#
+
+import filecmp
+import glob
+import os
+
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STAGE_MODULES = {
+  "fetching": "fetch_articles",
+  "guardian": "fetch_articles",
+  "htmltext": "fetch_articles",
+  "summarizing": "summarize",
+  "extractive": "summarize",
+  "generation": "summarize",
+  "partials": "summarize",
+  "prompting": "summarize",
+  "podcasting": "generate_podcast",
+  "synthesis": "generate_podcast",
+  "ttscache": "generate_podcast",
+  "pipelining": "pipeline",
+}
+
+SHARED_MODULES = [os.path.basename(f)[:-3] for f in glob.glob(os.path.join(root, "*.py"))
+                  if os.path.basename(f) != "main.py"]
+
+
+def originals():
+  for name in SHARED_MODULES:
+    yield name, os.path.join(root, name + ".py")
+  for name, home in STAGE_MODULES.items():
+    yield name, os.path.join(root, home, name + ".py")
+
+
+@pytest.mark.parametrize("name,original", list(originals()), ids=[name for name, _ in originals()])
+def test_copies_match_original(name, original):
+  copies = [f for f in glob.glob(os.path.join(root, "*", name + ".py")) if f != original]
+  assert copies, "no lambda uses " + name
+  differ = [os.path.relpath(f, root) for f in copies if not filecmp.cmp(original, f, shallow=False)]
+  assert not differ, "copies of " + os.path.relpath(original, root) + " differ: " + ", ".join(differ)
@@ -0,0 +1,36 @@
+import pytest
+
+import datatier
+import runtime
+
+
+def test_healthy_connection_is_pooled(stack):
+  conn = stack.dbConn
+  datatier.retrieve_one_row(conn, "SELECT 1;")
+  datatier.release_dbConn(conn)
+
+  stack.dbConn = runtime.get_dbConn()
+  assert stack.dbConn is conn
+
+
+def test_other_errors_in_a_transaction_keep_the_connection(stack):
+  conn = stack.dbConn
+  with pytest.raises(ValueError):
+    with datatier.transaction(conn):
+      datatier.perform_action(conn, "DELETE FROM queries;", [], commit=False)
+      raise ValueError("not a database error")
+  datatier.release_dbConn(conn)
+
+  stack.dbConn = runtime.get_dbConn()
+  assert stack.dbConn is conn
+
+
+def test_connection_a_statement_failed_on_is_not_pooled(stack):
+  failed = stack.dbConn
+  with pytest.raises(Exception):
+    datatier.perform_action(failed, "TRUNCATE TABLE nosuchtable;")
+  datatier.release_dbConn(failed)
+
+  assert not failed.open
+  stack.dbConn = runtime.get_dbConn()
+  assert stack.dbConn is not failed
@@ -0,0 +1,65 @@
+import fetching
+import htmltext
+import podcasting
+import prompting
+import summarizing
+
+
+def test_cache_hit_reuses_query(stack):
+  status, first, text = fetching.fetch(stack.dbConn, "Climate", {})
+  assert status == 200 and first["cache"] == "miss" and text
+
+  status, again, text = fetching.fetch(stack.dbConn, "  climate ", {})
+  assert status == 200 and again["cache"] == "hit" and text is None
+  assert again["queryid"] == first["queryid"]
+  assert again["status"] == "gathered articles"
+  assert stack.searches == 1
+
+
+def test_summarize_after_cache_hit_of_finished_query(stack):
+  # a topic that already has its podcast:
+  _, first, _ = fetching.fetch(stack.dbConn, "climate", {})
+  queryid = first["queryid"]
+  status, script = summarizing.summarize(stack.dbConn, queryid, {})
+  assert status == 200
+  status, _ = podcasting.generate(stack.dbConn, queryid, {})
+  assert status == 200
+
+  _, hit, _ = fetching.fetch(stack.dbConn, "climate", {})
+  assert hit["cache"] == "hit" and hit["status"] == "generated audio"
+
+  calls = stack.bedrock.calls
+  status, again = summarizing.summarize(stack.dbConn, hit["queryid"], {})
+  assert status == 200, again
+  assert again["scriptkey"] == script["scriptkey"] and again["script"] == script["script"]
+  assert stack.bedrock.calls == calls
+
+  status, polled = summarizing.summarize(stack.dbConn, hit["queryid"], {}, method="GET")
+  assert status == 200 and polled["done"] and polled["script"] == script["script"]
+
+
+def test_multi_paragraph_articles_stay_whole(stack):
+  bodies = ["<p>First of {0}.\n\nStill {0}.</p>\n<p>Another paragraph of {0}.</p>".format(i) for i in range(3)]
+  stack.pages = [htmltext.extract_text_stream(body) for body in bodies]
+  assert "\n" in stack.pages[0]
+
+  status, body, text = fetching.fetch(stack.dbConn, "paragraphs", {"count": "3"})
+  assert status == 200
+
+  articles = prompting.split_articles(text)
+  assert len(articles) == 3
+  assert all("Another paragraph of {}.".format(i) in articles[i] for i in range(3))
+
+
+def test_cache_hit_for_topic_with_few_articles(stack):
+  # the Guardian has a single article on it:
+  stack.pages = ["The only article on this topic."]
+
+  status, first, text = fetching.fetch(stack.dbConn, "rare topic", {})
+  status, again, text = fetching.fetch(stack.dbConn, "rare topic", {})
+  assert again["cache"] == "hit" and again["queryid"] == first["queryid"]
+  assert stack.searches == 1
+
+  # asking for more than the first fetch did is a miss:
+  status, more, text = fetching.fetch(stack.dbConn, "rare topic", {"count": "10"})
+  assert more["cache"] == "miss" and stack.searches == 2
@@ -0,0 +1,30 @@
+import glob
+import os
+
+import pytest
+
+import htmltext
+
+
+# the hand-written fixtures, and real bodies if tools/capture_fixtures.py saved any:
+here = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fixtures")
+fixtures = sorted(glob.glob(os.path.join(here, "guardian_*.html")) + glob.glob(os.path.join(here, "real", "*.html")))
+
+
+def test_default_is_stream():
+  assert htmltext.get_extractor() is htmltext.extract_text_stream
+
+
+@pytest.mark.parametrize("fixture", fixtures, ids=os.path.basename)
+def test_stream_matches_bs4(fixture):
+  pytest.importorskip("bs4")
+  body = open(fixture, encoding="utf-8").read()
+  assert htmltext.extract_text_stream(body) == htmltext.extract_text_bs4(body)
+
+
+def test_stream_edge_markup():
+  pytest.importorskip("bs4")
+  for body in ["<p>a<textarea><b>x</b></textarea>b</p>",
+               "<p>a<![CDATA[ c ]]>b</p>",
+               "<p>a<noscript>n</noscript><script>s</script>b</p>"]:
+    assert htmltext.extract_text_stream(body) == htmltext.extract_text_bs4(body)
@@ -0,0 +1,48 @@
+import idempotency
+
+
+def event(key):
+  return {"headers": {"Idempotency-Key": key}}
+
+
+def test_repeat_returns_first_response(stack):
+  calls = []
+
+  def work():
+    calls.append(1)
+    return 200, {"n": len(calls)}
+
+  assert idempotency.once(stack.dbConn, event("k"), ["fetch", "x", {}], work) == (200, {"n": 1})
+  assert idempotency.once(stack.dbConn, event("k"), ["fetch", "x", {}], work) == (200, {"n": 1})
+  assert len(calls) == 1
+
+  status, _ = idempotency.once(stack.dbConn, event("k"), ["fetch", "y", {}], work)
+  assert status == 422
+
+
+def test_temporary_answers_are_not_stored(stack):
+  answers = [(409, {"error": "being generated by another request"}), (503, {"error": "busy"}), (200, {"script": "s"})]
+
+  def work():
+    return answers.pop(0)
+
+  request = ["summarize", "1", {}]
+  assert idempotency.once(stack.dbConn, event("k"), request, work)[0] == 409
+  assert idempotency.once(stack.dbConn, event("k"), request, work)[0] == 503
+  assert idempotency.once(stack.dbConn, event("k"), request, work) == (200, {"script": "s"})
+  assert idempotency.once(stack.dbConn, event("k"), request, work) == (200, {"script": "s"})
+
+
+def test_replayed_audio_url_is_signed_again(stack):
+  stack.bucket.objects["podcasts/a.mp3"] = {"data": b"mp3", "meta": {}, "size": 3}
+  url = stack.bucket.meta.client.generate_presigned_url('get_object', {"Bucket": "bucket", "Key": "podcasts/a.mp3"}, 900)
+
+  def work():
+    return 200, {"audiokey": "podcasts/a.mp3", "audiourl": url, "expires_in": 900}
+
+  request = ["podcast", "1", {}]
+  first = idempotency.once(stack.dbConn, event("k"), request, work)
+  status, again = idempotency.once(stack.dbConn, event("k"), request, work)
+
+  assert status == 200 and again["audiokey"] == "podcasts/a.mp3"
+  assert again["audiourl"] != first[1]["audiourl"] and again["expires_in"] == 900
@@ -0,0 +1,65 @@
+import importlib.util
+import json
+import os
+
+import datatier
+import fetching
+import jobs
+import runtime
+
+
+class RecordingSQS:
+
+  def __init__(self):
+    self.messages = []
+
+  def send_message(self, QueueUrl, MessageBody, DelaySeconds=0):
+    self.messages.append((json.loads(MessageBody)["jobid"], DelaySeconds))
+
+
+def load_worker():
+  root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  spec = importlib.util.spec_from_file_location("job_worker_lambda", os.path.join(root, "job_worker", "lambda_function.py"))
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module.lambda_handler
+
+
+def test_busy_job_is_requeued_not_failed(stack, monkeypatch):
+  # the worker waits for the other request at most [leases] wait
+  # (shortened here):
+  with open("podcast-config.ini", "a") as f:
+    f.write("[jobs]\nqueue_url = queue\n\n[leases]\nwait = 0.5\n")
+  monkeypatch.setattr(runtime, "_config", None)
+
+  sqs = runtime._clients["sqs"] = RecordingSQS()
+  worker = load_worker()
+
+  status, body, text = fetching.fetch(stack.dbConn, "climate", {})
+  queryid = body["queryid"]
+
+  # another request is generating the script:
+  datatier.perform_action(stack.dbConn, "UPDATE queries SET status = 'summarizing', claimed = NOW() WHERE queryid = %s;", [queryid])
+
+  job = jobs.submit(stack.dbConn, "summarize", queryid, {})
+  worker({"Records": [{"body": json.dumps({"jobid": job["jobid"]})}]}, None)
+
+  assert jobs.get(stack.dbConn, job["jobid"])["state"] == "queued"
+  assert sqs.messages == [(job["jobid"], 0), (job["jobid"], jobs.DEFAULT_RETRY_DELAY)]
+
+  # it is done when it runs after the other request:
+  datatier.perform_action(stack.dbConn, "UPDATE queries SET status = 'gathered articles' WHERE queryid = %s;", [queryid])
+  worker({"Records": [{"body": json.dumps({"jobid": job["jobid"]})}]}, None)
+
+  assert jobs.get(stack.dbConn, job["jobid"])["state"] == "done"
+
+
+def test_finished_job_gets_a_fresh_audio_url(stack):
+  stack.bucket.objects["podcasts/a.mp3"] = {"data": b"mp3", "meta": {}, "size": 3}
+  sql = "INSERT INTO jobs(kind, target, params, queryid, state) VALUES('podcast', '1', '{}', 1, 'running');"
+  jobid = datatier.perform_insert(stack.dbConn, sql, [])
+  jobs.finish(stack.dbConn, jobid, 200, {"audiokey": "podcasts/a.mp3", "audiourl": "https://expired", "expires_in": 900})
+
+  result = jobs.get(stack.dbConn, jobid)["result"]
+  assert result["audiourl"] != "https://expired" and "podcasts/a.mp3" in result["audiourl"]
+  assert result["expires_in"] == 900
@@ -0,0 +1,20 @@
+import pipelining
+
+
+def test_pipeline_twice_on_same_topic(stack):
+  status, first = pipelining.run(stack.dbConn, "climate", {})
+  assert status == 200, first
+  assert first["stages"]["fetch"]["cache"] == "miss"
+
+  calls = (stack.searches, stack.bedrock.calls, stack.polly.calls)
+
+  status, again = pipelining.run(stack.dbConn, "Climate", {})
+  assert status == 200, again
+  assert again["queryid"] == first["queryid"]
+  assert again["stages"]["fetch"]["cache"] == "hit"
+  assert again["stages"]["summarize"]["cache"] == "done"
+  assert again["stages"]["podcast"]["cache"] == "done"
+  assert again["script"] == first["script"] and again["audiokey"] == first["audiokey"]
+
+  # nothing fetched, generated or synthesized again:
+  assert (stack.searches, stack.bedrock.calls, stack.polly.calls) == calls
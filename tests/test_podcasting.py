@@ -0,0 +1,31 @@
+import fetching
+import podcasting
+import summarizing
+
+
+def make_podcast(stack, topic):
+  status, body, text = fetching.fetch(stack.dbConn, topic, {})
+  queryid = body["queryid"]
+  assert summarizing.summarize(stack.dbConn, queryid, {})[0] == 200
+  status, body = podcasting.generate(stack.dbConn, queryid, {})
+  assert status == 200, body
+  return body
+
+
+def test_audio_in_s3_is_not_synthesized_again(stack):
+  # the same articles (so the same script) for every topic:
+  stack.pages = ["The same article, whatever the topic."] * 5
+
+  first = make_podcast(stack, "climate")
+  assert first["cache"] == "miss"
+  requests = stack.polly.calls
+
+  again = make_podcast(stack, "climate again")
+  assert again["audiokey"] == first["audiokey"] and again["cache"] == "hit"
+  assert stack.polly.calls == requests
+
+  # once the bucket no longer has it, it is synthesized again:
+  del stack.bucket.objects[first["audiokey"]]
+  third = make_podcast(stack, "climate once more")
+  assert third["cache"] == "miss" and stack.polly.calls > requests
+  assert first["audiokey"] in stack.bucket.objects
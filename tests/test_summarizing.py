@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+import artifacts
+import datatier
+import fetching
+import partials
+import summarizing
+
+
+def test_failed_stream_leaves_no_partial(stack):
+  status, body, text = fetching.fetch(stack.dbConn, "climate", {})
+  queryid = body["queryid"]
+  key = partials.partial_key(queryid)
+
+  # left over from an earlier attempt:
+  artifacts.put_text(stack.bucket, key, "stale text", compress=False)
+
+  stream = stack.bedrock.invoke_model_with_response_stream
+  seen = []
+
+  def failing_stream(**kwargs):
+    seen.append(key in stack.bucket.objects)
+
+    def events():
+      for i, event in enumerate(stream(**kwargs)["body"]):
+        if i == 20:
+          raise RuntimeError("stream broken")
+        yield event
+
+    return {"body": events()}
+
+  stack.bedrock.invoke_model_with_response_stream = failing_stream
+
+  with pytest.raises(RuntimeError):
+    summarizing.summarize(stack.dbConn, queryid, {"stream": "true"})
+
+  assert seen == [False]  # gone once the generation was claimed
+  assert key not in stack.bucket.objects
+
+  status, body = summarizing.summarize(stack.dbConn, queryid, {}, method="GET")
+  assert status == 200 and body == {"script": "", "done": False}
+
+
+def test_bad_option_is_rejected_before_claiming(stack):
+  status, body, text = fetching.fetch(stack.dbConn, "climate", {})
+  queryid = body["queryid"]
+  sql = "SELECT status FROM queries WHERE queryid = %s;"
+
+  status, body = summarizing.summarize(stack.dbConn, queryid, {"mode": "bogus"})
+  assert status == 400 and "mode" in body["error"]
+  assert datatier.retrieve_one_row(stack.dbConn, sql, [queryid])[0] == "gathered articles"
+
+  # another request is generating the script: no wait for it
+  datatier.perform_action(stack.dbConn, "UPDATE queries SET status = 'summarizing', claimed = NOW() WHERE queryid = %s;", [queryid])
+  start = time.monotonic()
+  status, body = summarizing.summarize(stack.dbConn, queryid, {"extractive": "half"})
+  assert status == 400 and time.monotonic() - start < 1
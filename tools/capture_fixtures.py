@@ -0,0 +1,70 @@
+#
+# capture_fixtures.py
+#
+# Saves the HTML bodies of real Guardian articles, as the fetch
+# lambda gets them from the Content API (show-fields=body), for
+# benchmarks/bench_htmltext.py to measure and compare the HTML
+# extractors on. They go to benchmarks/fixtures/real/, which is
+# not committed (the articles are the Guardian's content).
+#
+# Usage:
+#   python tools/capture_fixtures.py API_KEY [count] [query ...]
+#
+#   count: articles per query (default 10); the default queries
+#          cover news, live blogs, long reads, sport and culture
+#
+
+import os
+import sys
+
+import requests
+
+
+SEARCH_URL = "https://content.guardianapis.com/search"
+
+DEFAULT_QUERIES = ["climate", "election live", "the long read", "football", "film review"]
+
+
+def capture(api_key, queries, count, outdir):
+  """
+  Downloads count article bodies per query into outdir, one
+  file per article, and returns the number of files written
+  """
+  os.makedirs(outdir, exist_ok=True)
+  written = 0
+
+  for query in queries:
+    res = requests.get(SEARCH_URL, params={
+      "q": query,
+      "api-key": api_key,
+      "show-fields": "body",
+      "page-size": count
+    }, timeout=30)
+    res.raise_for_status()
+
+    for article in res.json()["response"]["results"]:
+      body = article.get("fields", {}).get("body")
+      if not body:
+        continue
+
+      name = article["id"].replace("/", "_") + ".html"
+      with open(os.path.join(outdir, name), "w", encoding="utf-8") as f:
+        f.write(body)
+      written += 1
+
+    print("{}: {} articles".format(query, len(res.json()["response"]["results"])))
+
+  return written
+
+
+if __name__ == "__main__":
+  if len(sys.argv) < 2:
+    print("usage: python tools/capture_fixtures.py API_KEY [count] [query ...]")
+    sys.exit(1)
+
+  count = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+  queries = sys.argv[3:] or DEFAULT_QUERIES
+  outdir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fixtures", "real")
+
+  n = capture(sys.argv[1], queries, count, outdir)
+  print("{} bodies saved to {}".format(n, outdir))
@@ -0,0 +1,105 @@
+#
+# storage_report.py
+#
+# Estimates how much S3 storage content-addressed keys save, from
+# a listing of the bucket: objects with the same ETag and size
+# hold the same bytes, so only one copy per (ETag, size) is
+# needed. Reports per top-level prefix (combinedarticles/,
+# summaries/, podcasts/, ...).
+#
+# Usage:
+#   aws s3api list-objects-v2 --bucket BUCKET --output json > listing.json
+#   python tools/storage_report.py listing.json
+#
+# or list the bucket directly (needs boto3 and credentials):
+#   python tools/storage_report.py --bucket BUCKET
+#
+# NOTE: multipart uploads have ETags of the form "<md5>-<parts>",
+# which only match for identical content uploaded with the same
+# part size, so duplicates among those may be under-counted.
+#
+
+import json
+import sys
+
+
+def load_listing(path):
+  """
+  Reads a list-objects-v2 JSON listing (one page, or several
+  pages written one after the other), returning a list of
+  (key, size, etag)
+  """
+  with open(path) if path != "-" else sys.stdin as infile:
+    text = infile.read()
+
+  objects = []
+  decoder = json.JSONDecoder()
+  pos = 0
+
+  while pos < len(text):
+    while pos < len(text) and text[pos].isspace():
+      pos += 1
+    if pos >= len(text):
+      break
+    page, pos = decoder.raw_decode(text, pos)
+    for obj in page.get("Contents", []):
+      objects.append((obj["Key"], int(obj["Size"]), obj["ETag"].strip('"')))
+
+  return objects
+
+
+def list_bucket(bucketname):
+  """
+  Lists a bucket with boto3, returning a list of (key, size, etag)
+  """
+  import boto3
+
+  objects = []
+  paginator = boto3.client("s3").get_paginator("list_objects_v2")
+
+  for page in paginator.paginate(Bucket=bucketname):
+    for obj in page.get("Contents", []):
+      objects.append((obj["Key"], int(obj["Size"]), obj["ETag"].strip('"')))
+
+  return objects
+
+
+def report(objects):
+  prefixes = {}
+
+  for key, size, etag in objects:
+    prefix = key.split("/", 1)[0] + "/" if "/" in key else "(root)"
+    stats = prefixes.setdefault(prefix, {"objects": 0, "bytes": 0, "unique": {}})
+    stats["objects"] += 1
+    stats["bytes"] += size
+    stats["unique"][(etag, size)] = size
+
+  print("{:20s} {:>8s} {:>12s} {:>8s} {:>12s} {:>7s}".format(
+    "prefix", "objects", "bytes", "unique", "dup bytes", "saved"))
+
+  total_bytes = 0
+  total_dup = 0
+
+  for prefix in sorted(prefixes):
+    stats = prefixes[prefix]
+    unique_bytes = sum(stats["unique"].values())
+    dup = stats["bytes"] - unique_bytes
+    total_bytes += stats["bytes"]
+    total_dup += dup
+    print("{:20s} {:8d} {:12d} {:8d} {:12d} {:6.1f}%".format(
+      prefix, stats["objects"], stats["bytes"], len(stats["unique"]), dup,
+      100 * dup / stats["bytes"] if stats["bytes"] else 0))
+
+  print("{:20s} {:8d} {:12d} {:8s} {:12d} {:6.1f}%".format(
+    "total", len(objects), total_bytes, "", total_dup,
+    100 * total_dup / total_bytes if total_bytes else 0))
+
+
+if __name__ == "__main__":
+  if len(sys.argv) == 3 and sys.argv[1] == "--bucket":
+    report(list_bucket(sys.argv[2]))
+  elif len(sys.argv) == 2:
+    report(load_listing(sys.argv[1]))
+  else:
+    print("usage: python tools/storage_report.py listing.json | --bucket BUCKET")
+    sys.exit(1)